@@ -0,0 +1,115 @@
+"""
+Retention for finished executions.
+
+Completed and failed executions older than ARCHIVE_AFTER_DAYS move, with their
+step rows, from the hot workflow_* tables into the *_archive tables, so the
+engine's queries and the execution lists only ever touch recent history.
+Archived executions stay readable through GET /api/executions/{id} and stay
+in the per-status counters; they drop out of lists and output searches.
+
+The API runs archive_loop() in the background; `python -m api.archive`
+runs one pass by hand.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .database import connection, create_schema
+from .timestamps import to_ms
+
+# 0 disables the background job.
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+# Executions moved per transaction; each batch briefly holds the write lock.
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "200"))
+# Seconds between background passes.
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+EXECUTION_COLUMNS = (
+    "id, workflow_definition_id, organization_id, user_id, requested_by, "
+    "status, current_step_order, created_at, completed_at"
+)
+STEP_COLUMNS = (
+    "id, execution_id, step_definition_id, step_order, status, "
+    "manual_input, output, error, completed_by, started_at, completed_at, "
+    "lease_owner, lease_expires_at"
+)
+
+log = logging.getLogger(__name__)
+
+
+def _archive_batch(conn, cutoff: int, batch_rows: int) -> int:
+    """Move up to `batch_rows` finished executions last touched before `cutoff`; returns how many."""
+    # created_at < cutoff lets the scan use idx_we_status_created; a finished
+    # execution can't have completed before it was created.
+    ids = [r["id"] for r in conn.execute("""
+        SELECT id FROM workflow_executions
+        WHERE status IN ('completed', 'failed') AND created_at < ?
+          AND coalesce(completed_at, created_at) < ?
+        ORDER BY created_at, id LIMIT ?
+    """, (cutoff, cutoff, batch_rows)).fetchall()]
+    if not ids:
+        return 0
+    marks = ",".join("?" * len(ids))
+    conn.execute(
+        f"INSERT OR IGNORE INTO workflow_step_executions_archive ({STEP_COLUMNS}) "
+        f"SELECT {STEP_COLUMNS} FROM workflow_step_executions WHERE execution_id IN ({marks})",
+        ids
+    )
+    conn.execute(
+        f"INSERT OR IGNORE INTO workflow_executions_archive ({EXECUTION_COLUMNS}) "
+        f"SELECT {EXECUTION_COLUMNS} FROM workflow_executions WHERE id IN ({marks})",
+        ids
+    )
+    # Steps and contexts first: they reference the execution rows.
+    conn.execute(f"DELETE FROM workflow_step_executions WHERE execution_id IN ({marks})", ids)
+    conn.execute(f"DELETE FROM execution_contexts WHERE execution_id IN ({marks})", ids)
+    conn.execute(f"DELETE FROM workflow_executions WHERE id IN ({marks})", ids)
+    return len(ids)
+
+
+def archive_executions(older_than_days: Optional[int] = None, batch_rows: Optional[int] = None) -> int:
+    """
+    Archive every finished execution older than `older_than_days`, one short
+    transaction per batch so engine writes can interleave. Returns the number
+    of executions moved.
+    """
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_rows = batch_rows or ARCHIVE_BATCH_ROWS
+    cutoff = to_ms(datetime.utcnow() - timedelta(days=days))
+    total = 0
+    while True:
+        with connection() as conn:
+            moved = _archive_batch(conn, cutoff, batch_rows)
+        total += moved
+        if moved < batch_rows:
+            return total
+
+
+async def archive_loop() -> None:
+    """Background task: archive once per ARCHIVE_INTERVAL until cancelled."""
+    while True:
+        started = time.monotonic()
+        try:
+            moved = await run_in_threadpool(archive_executions)
+            if moved:
+                log.info("archived %d executions in %.2fs", moved, time.monotonic() - started)
+        except Exception:
+            log.exception("execution archive pass failed")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move finished executions to the archive tables.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive executions finished more than this many days ago")
+    args = parser.parse_args()
+    create_schema()
+    print(f"Archived {archive_executions(args.days)} executions.")
@@ -16,6 +16,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from .database import get_db
+from .records import UserRecord
 
 SECRET_KEY = os.getenv("JWT_SECRET", "hyopps-dev-secret-change-in-prod").encode()
 ACCESS_TOKEN_EXPIRE_HOURS = 8
@@ -63,6 +64,7 @@ def _decode_token(token: str) -> dict:
 
 
 # ── Password helpers (bcrypt direct) ──────────────────────────────────────
+# bcrypt is deliberately slow; async handlers call these via run_in_threadpool.
 
 def verify_password(plain: str, hashed: str) -> bool:
     return bcrypt.checkpw(plain.encode(), hashed.encode() if isinstance(hashed, str) else hashed)
@@ -74,25 +76,22 @@ def hash_password(plain: str) -> str:
 
 # ── User lookup ────────────────────────────────────────────────────────────
 
-def _get_user_by_id(user_id: str) -> Optional[dict]:
-    conn = get_db()
-    row = conn.execute(
+async def _get_user_by_id(user_id: str, conn) -> Optional[UserRecord]:
+    row = await conn.fetchone(
         "SELECT id,firstname,lastname,email,languages,skills,roles,organization_id,app_role,created_at FROM users WHERE id=?",
         (user_id,)
-    ).fetchone()
-    conn.close()
+    )
     if not row:
         return None
-    d = dict(row)
-    d["languages"] = json.loads(d["languages"] or "[]")
-    d["skills"] = json.loads(d["skills"] or "[]")
-    d["roles"] = json.loads(d["roles"] or "[]")
-    return d
+    return UserRecord(row)
 
 
 # ── FastAPI dependencies ───────────────────────────────────────────────────
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> dict:
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    conn=Depends(get_db, scope="function"),
+) -> UserRecord:
     try:
         payload = _decode_token(credentials.credentials)
         user_id: str = payload.get("sub", "")
@@ -101,19 +100,19 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
 
-    user = _get_user_by_id(user_id)
+    user = await _get_user_by_id(user_id, conn)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
 
 
-def require_admin(user: dict = Depends(get_current_user)) -> dict:
+async def require_admin(user: UserRecord = Depends(get_current_user)) -> UserRecord:
     if user["app_role"] != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
     return user
 
 
-def require_partner_admin(user: dict = Depends(get_current_user)) -> dict:
+async def require_partner_admin(user: UserRecord = Depends(get_current_user)) -> UserRecord:
     """Allows both 'admin' and 'partner_admin' roles. partner_admin must have an org."""
     if user["app_role"] not in ("admin", "partner_admin"):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Partner admin access required")
@@ -0,0 +1,201 @@
+"""
+Online backups of the SQLite database.
+
+create_backup() copies the live database with the sqlite3 backup API,
+BACKUP_STEP_PAGES pages at a time, pausing between steps. Each step is its own
+short read transaction, so WAL checkpoints keep running during the copy. A
+commit or checkpoint by another connection between two steps restarts the
+copy from page one; after BACKUP_MAX_RESTARTS restarts the rest is copied in a single
+step, which holds a read lock only for as long as that one step takes.
+
+Each snapshot is written to BACKUP_DIR as hyopps-<UTC timestamp>.db, next to
+a .sha256 file in `sha256sum` format. With the execution tables split out,
+their file is copied first, to hyopps-<timestamp>.exec.db, and the main file
+after it, so every organization or user an execution refers to is in the
+main snapshot.
+The API takes one every BACKUP_INTERVAL seconds and keeps the newest
+BACKUP_KEEP. POST /api/admin/backups takes one on demand, and so does
+`python -m api.backup`.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .database import get_backend
+
+BACKUP_DIR = os.getenv(
+    "BACKUP_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "backups"),
+)
+# Seconds between scheduled backups; 0 disables the schedule.
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", str(24 * 3600)))
+# Snapshots kept in BACKUP_DIR; older ones are deleted after each backup.
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+# Seconds to pause between steps so the engine's I/O isn't starved.
+BACKUP_STEP_PAUSE = float(os.getenv("BACKUP_STEP_PAUSE", "0.005"))
+# Restarts caused by concurrent commits before the copy is finished in one step.
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+class BackupFailed(Exception):
+    """The snapshot was written but didn't pass its integrity check; nothing was kept."""
+
+
+class _Restarted(Exception):
+    """The batched copy kept restarting under concurrent writes."""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _describe(path: str) -> dict:
+    checksum_path = path + ".sha256"
+    checksum = None
+    if os.path.exists(checksum_path):
+        with open(checksum_path) as f:
+            checksum = f.read().split()[0]
+    result = {
+        "file": os.path.basename(path),
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "sha256": checksum,
+    }
+    exec_path = path[:-len(".db")] + ".exec.db"
+    if os.path.exists(exec_path):
+        result["exec"] = _describe(exec_path)
+    return result
+
+
+def list_backups() -> list[dict]:
+    """Snapshots in BACKUP_DIR, newest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    paths = [
+        os.path.join(BACKUP_DIR, n) for n in os.listdir(BACKUP_DIR)
+        if n.startswith("hyopps-") and n.endswith(".db") and not n.endswith(".exec.db")
+    ]
+    paths.sort(key=lambda p: (os.path.getmtime(p), p), reverse=True)
+    return [_describe(p) for p in paths]
+
+
+def _prune(keep: int) -> None:
+    for old in list_backups()[keep:]:
+        for snapshot in (old, old.get("exec")):
+            if not snapshot:
+                continue
+            for path in (snapshot["path"], snapshot["path"] + ".sha256"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _copy(source: sqlite3.Connection, schema: str, path: str, pause) -> None:
+    """Back up one attached database of `source` into a checked snapshot at `path`."""
+    partial = path + ".partial"
+    target = sqlite3.connect(partial)
+    try:
+        restarts = 0
+        left = None
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal restarts, left
+            if left is not None and remaining >= left:  # started over from page one
+                restarts += 1
+                if restarts > BACKUP_MAX_RESTARTS:
+                    raise _Restarted()
+            left = remaining
+            pause(status, remaining, total)
+
+        try:
+            source.backup(target, pages=BACKUP_STEP_PAGES, progress=progress, name=schema)
+        except _Restarted:
+            log.info("backup of %s restarted %d times under writes; copying the rest in one step", schema, restarts)
+            source.backup(target, pages=-1, name=schema)
+        # The copy is a rollback-journal database, readable without the -wal file.
+        target.execute("PRAGMA journal_mode=DELETE")
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+        if check != "ok":
+            raise BackupFailed(f"Backup failed integrity check: {check}")
+    except BaseException:
+        target.close()
+        os.remove(partial)
+        raise
+    target.close()
+    os.replace(partial, path)
+    with open(path + ".sha256", "w") as f:
+        f.write(f"{_sha256(path)}  {os.path.basename(path)}\n")
+
+
+def create_backup(keep: Optional[int] = None) -> dict:
+    """Write a consistent snapshot of the SQLite database plus its checksum; returns its description."""
+    backend = get_backend()
+    if backend.name != "sqlite":
+        raise RuntimeError(f"Online backup is only available for SQLite; back up {backend.name} with its own tools")
+
+    with _lock:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(BACKUP_DIR, f"hyopps-{stamp}.db")
+        n = 1
+        while os.path.exists(path):  # several backups within one second
+            path = os.path.join(BACKUP_DIR, f"hyopps-{stamp}-{n}.db")
+            n += 1
+        started = time.monotonic()
+        steps = 0
+
+        def pause(status: int, remaining: int, total: int) -> None:
+            nonlocal steps
+            steps += 1
+            time.sleep(BACKUP_STEP_PAUSE)
+
+        source = sqlite3.connect(backend.path, isolation_level=None)
+        try:
+            schemas = backend.schemas()
+            if "exec" in schemas:
+                source.execute("ATTACH DATABASE ? AS exec", (backend.exec_path,))
+            if "exec" in schemas:
+                _copy(source, "exec", path[:-len(".db")] + ".exec.db", pause)
+            _copy(source, "main", path, pause)
+        finally:
+            source.close()
+        _prune(BACKUP_KEEP if keep is None else keep)
+
+    result = _describe(path)
+    result["steps"] = steps
+    result["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+    log.info("backup %s: %d bytes in %d steps, %.1f ms", result["file"], result["bytes"], steps, result["duration_ms"])
+    return result
+
+
+async def backup_loop() -> None:
+    """Background task: back up every BACKUP_INTERVAL until cancelled."""
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        try:
+            await run_in_threadpool(create_backup)
+        except Exception:
+            log.exception("scheduled backup failed")
+
+
+if __name__ == "__main__":
+    print(create_backup())
@@ -0,0 +1,27 @@
+"""
+Reads of the per-status execution counters maintained by triggers on
+workflow_executions (see migration 6). Each lookup reads a handful of rows
+from the counters' primary key, however much history has accumulated.
+"""
+
+from .database import AsyncConnection
+
+STATUSES = ("pending", "running", "awaiting_input", "completed", "failed")
+
+
+async def execution_counts(
+    conn: AsyncConnection,
+    organization_id: str = "",
+    workflow_definition_id: str = "",
+) -> dict:
+    """
+    Status → count for one organization and/or workflow definition.
+    An empty id means "all"; every known status is present, zero or not.
+    """
+    rows = await conn.fetchall(
+        "SELECT status, count FROM execution_counts WHERE organization_id=? AND workflow_definition_id=?",
+        (organization_id, workflow_definition_id),
+    )
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update({r["status"]: r["count"] for r in rows})
+    return {"counts": counts, "total": sum(counts.values())}
@@ -1,233 +1,129 @@
-import sqlite3
-import os
 import json
-import uuid
+import asyncio
+import threading
 import bcrypt
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
-
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "hyopps_py.db")
-
-
-def get_db() -> sqlite3.Connection:
-    """Return a new SQLite connection. Each caller (thread) gets its own connection."""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
-    return conn
-
-
-def _migrate(conn) -> None:
-    """Apply incremental schema migrations to existing databases."""
-    # Migration: add partner_admin to app_role CHECK constraint.
-    # SQLite can't ALTER a column's CHECK, so we recreate the table.
-    row = conn.execute(
-        "SELECT sql FROM sqlite_master WHERE type='table' AND name='users'"
-    ).fetchone()
-    if row and "partner_admin" not in row["sql"]:
-        conn.execute("PRAGMA foreign_keys=OFF")
-        conn.execute("ALTER TABLE users RENAME TO _users_migrate")
-        conn.execute("""
-            CREATE TABLE users (
-                id              TEXT PRIMARY KEY,
-                firstname       TEXT NOT NULL,
-                lastname        TEXT NOT NULL,
-                email           TEXT NOT NULL UNIQUE,
-                languages       TEXT NOT NULL DEFAULT '[]',
-                skills          TEXT NOT NULL DEFAULT '[]',
-                roles           TEXT NOT NULL DEFAULT '[]',
-                organization_id TEXT REFERENCES organizations(id),
-                app_role        TEXT NOT NULL DEFAULT 'user'
-                                CHECK (app_role IN ('admin', 'user', 'partner_admin')),
-                password_hash   TEXT NOT NULL,
-                created_at      TEXT DEFAULT (datetime('now'))
-            )
-        """)
-        conn.execute("INSERT INTO users SELECT * FROM _users_migrate")
-        conn.execute("DROP TABLE _users_migrate")
-        conn.commit()
-        conn.execute("PRAGMA foreign_keys=ON")
-
-    # Migration: add metabase_user_id column to users table.
-    existing_cols = {r["name"] for r in conn.execute("PRAGMA table_info(users)").fetchall()}
-    if "metabase_user_id" not in existing_cols:
-        conn.execute("ALTER TABLE users ADD COLUMN metabase_user_id INTEGER")
-        conn.commit()
-
-    # Migration: add organization_documentation table.
-    existing_tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
-    if "organization_documentation" not in existing_tables:
-        conn.execute("""
-            CREATE TABLE organization_documentation (
-                id              TEXT PRIMARY KEY,
-                organization_id TEXT NOT NULL UNIQUE REFERENCES organizations(id),
-                internal_docu   TEXT,
-                generique_docu  TEXT,
-                add_docu        TEXT,
-                updated_at      TEXT DEFAULT (datetime('now'))
-            )
-        """)
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from .ids import new_id
+from .migrations import step_dependency_backfill
+from .storage import Backend, create_backend
+
+_backend: Optional[Backend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Backend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def close_pool() -> None:
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
+
+@contextmanager
+def connection() -> Iterator[Any]:
+    """
+    Borrow a pooled connection for one unit of work.
+    Commits on success, rolls back on error, and returns the connection to the pool.
+    """
+    pool = get_backend()
+    conn = pool.acquire()
+    try:
+        yield conn
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+
+class AsyncConnection:
+    """
+    Awaitable view of a pooled connection for async route handlers.
+    Every call runs on the connection's own thread, so the event loop never
+    blocks on the database and no request ties up Starlette's threadpool.
+    """
+
+    def __init__(self, conn: Any):
+        self.raw = conn
+
+    async def _call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.raw.executor(), fn, *args)
+
+    async def execute(self, sql: str, params: Any = ()) -> Any:
+        """Run a write; the returned cursor is only good for rowcount/lastrowid."""
+        return await self._call(self.raw.execute, sql, params)
+
+    async def fetchone(self, sql: str, params: Any = ()) -> Optional[Any]:
+        return await self._call(lambda: self.raw.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: Any = ()) -> list:
+        return await self._call(lambda: self.raw.execute(sql, params).fetchall())
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Call a sync helper that takes the connection as its last argument, e.g. the engine."""
+        return await self._call(fn, *args, self.raw)
+
+    async def commit(self) -> None:
+        await self._call(self.raw.commit)
+
+    async def rollback(self) -> None:
+        await self._call(self.raw.rollback)
+
+
+@asynccontextmanager
+async def async_connection() -> AsyncIterator[AsyncConnection]:
+    """Async twin of connection(), for coroutines such as the engine and its integrations."""
+    pool = get_backend()
+    # acquire() may have to open a new connection or wait for a free one.
+    conn = await asyncio.get_running_loop().run_in_executor(None, pool.acquire)
+    db = AsyncConnection(conn)
+    try:
+        yield db
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    finally:
+        await db._call(pool.release, conn)
+
+
+async def get_db() -> AsyncIterator[AsyncConnection]:
+    """
+    FastAPI dependency: one pooled connection and one transaction per request.
+    Declare it as Depends(get_db, scope="function"), so the transaction commits
+    (and the write lock is released) before the response is sent, and a failed
+    commit becomes a 500 rather than a success the client has already seen.
+    """
+    async with async_connection() as db:
+        yield db
 
 
 def create_schema() -> None:
-    conn = get_db()
-    _migrate(conn)
-    conn.executescript("""
-        CREATE TABLE IF NOT EXISTS organizations (
-            id            TEXT PRIMARY KEY,
-            name          TEXT NOT NULL UNIQUE,
-            account_types TEXT NOT NULL DEFAULT '["partner"]',
-            created_at    TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS users (
-            id               TEXT PRIMARY KEY,
-            firstname        TEXT NOT NULL,
-            lastname         TEXT NOT NULL,
-            email            TEXT NOT NULL UNIQUE,
-            languages        TEXT NOT NULL DEFAULT '[]',
-            skills           TEXT NOT NULL DEFAULT '[]',
-            roles            TEXT NOT NULL DEFAULT '[]',
-            organization_id  TEXT REFERENCES organizations(id),
-            app_role         TEXT NOT NULL DEFAULT 'user' CHECK (app_role IN ('admin', 'user', 'partner_admin')),
-            password_hash    TEXT NOT NULL,
-            metabase_user_id INTEGER,
-            created_at       TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS studio_companies (
-            id              TEXT PRIMARY KEY,
-            organization_id TEXT NOT NULL REFERENCES organizations(id),
-            studio_id       TEXT NOT NULL UNIQUE,
-            name            TEXT NOT NULL,
-            environment     TEXT NOT NULL CHECK (environment IN ('test', 'prod')),
-            created_at      TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS user_studio_access (
-            id                TEXT PRIMARY KEY,
-            user_id           TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            studio_company_id TEXT NOT NULL REFERENCES studio_companies(id) ON DELETE CASCADE,
-            granted_at        TEXT DEFAULT (datetime('now')),
-            revoked_at        TEXT,
-            UNIQUE (user_id, studio_company_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS system_groups (
-            id              TEXT PRIMARY KEY,
-            organization_id TEXT NOT NULL REFERENCES organizations(id),
-            tool            TEXT NOT NULL,
-            external_name   TEXT NOT NULL,
-            external_id     TEXT,
-            created_at      TEXT DEFAULT (datetime('now')),
-            UNIQUE (organization_id, tool)
-        );
-
-        CREATE TABLE IF NOT EXISTS organization_integrations (
-            id                      TEXT PRIMARY KEY,
-            organization_id         TEXT NOT NULL UNIQUE REFERENCES organizations(id),
-            keycloak_confirmed      INTEGER DEFAULT 0,
-            keycloak_cluster        TEXT,
-            metabase_collection_id  TEXT,
-            lms_confirmed           INTEGER DEFAULT 0,
-            updated_at              TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS resources (
-            id          TEXT PRIMARY KEY,
-            name        TEXT NOT NULL UNIQUE,
-            type        TEXT,
-            has_api     INTEGER DEFAULT 1,
-            created_at  TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS workflow_definitions (
-            id          TEXT PRIMARY KEY,
-            name        TEXT NOT NULL UNIQUE,
-            description TEXT,
-            created_at  TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS workflow_step_definitions (
-            id                     TEXT PRIMARY KEY,
-            workflow_definition_id TEXT NOT NULL REFERENCES workflow_definitions(id),
-            step_order             INTEGER NOT NULL,
-            name                   TEXT NOT NULL,
-            label                  TEXT NOT NULL,
-            type                   TEXT NOT NULL CHECK (type IN ('auto', 'manual')),
-            description            TEXT,
-            UNIQUE (workflow_definition_id, step_order)
-        );
-
-        CREATE TABLE IF NOT EXISTS workflow_executions (
-            id                     TEXT PRIMARY KEY,
-            workflow_definition_id TEXT NOT NULL REFERENCES workflow_definitions(id),
-            organization_id        TEXT REFERENCES organizations(id),
-            user_id                TEXT REFERENCES users(id),
-            requested_by           TEXT REFERENCES users(id),
-            status                 TEXT NOT NULL DEFAULT 'pending'
-                                   CHECK (status IN ('pending','running','awaiting_input','completed','failed')),
-            current_step_order     INTEGER DEFAULT 1,
-            created_at             TEXT DEFAULT (datetime('now')),
-            completed_at           TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS workflow_step_executions (
-            id                 TEXT PRIMARY KEY,
-            execution_id       TEXT NOT NULL REFERENCES workflow_executions(id),
-            step_definition_id TEXT NOT NULL REFERENCES workflow_step_definitions(id),
-            step_order         INTEGER NOT NULL,
-            status             TEXT NOT NULL DEFAULT 'pending'
-                               CHECK (status IN ('pending','running','awaiting_input','completed','failed','skipped')),
-            manual_input       TEXT,
-            output             TEXT,
-            error              TEXT,
-            completed_by       TEXT REFERENCES users(id),
-            started_at         TEXT,
-            completed_at       TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS access_grants (
-            id           TEXT PRIMARY KEY,
-            user_id      TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            resource_id  TEXT NOT NULL REFERENCES resources(id),
-            permission   TEXT NOT NULL DEFAULT 'read'
-                         CHECK (permission IN ('read','write','admin')),
-            granted_by   TEXT REFERENCES users(id),
-            granted_at   TEXT DEFAULT (datetime('now')),
-            revoked_at   TEXT,
-            execution_id TEXT REFERENCES workflow_executions(id),
-            UNIQUE (user_id, resource_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS user_studio_companies (
-            id         TEXT PRIMARY KEY,
-            user_id    TEXT NOT NULL UNIQUE REFERENCES users(id) ON DELETE CASCADE,
-            studio_id  TEXT NOT NULL UNIQUE,
-            name       TEXT NOT NULL,
-            created_at TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS organization_documentation (
-            id              TEXT PRIMARY KEY,
-            organization_id TEXT NOT NULL UNIQUE REFERENCES organizations(id),
-            internal_docu   TEXT,
-            generique_docu  TEXT,
-            add_docu        TEXT,
-            updated_at      TEXT DEFAULT (datetime('now'))
-        );
-    """)
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        get_backend().migrate(conn)
 
 
 def seed_data() -> None:
-    conn = get_db()
-    count = conn.execute("SELECT COUNT(*) FROM workflow_definitions").fetchone()[0]
+    with connection() as conn:
+        _seed_data(conn)
+
+
+def _seed_data(conn) -> None:
+    count = conn.execute("SELECT COUNT(*) AS n FROM workflow_definitions").fetchone()["n"]
     if count > 0:
-        conn.close()
         return
 
     now = datetime.utcnow().isoformat()
@@ -244,12 +140,12 @@ def seed_data() -> None:
     for name, rtype, has_api in resources:
         conn.execute(
             "INSERT OR IGNORE INTO resources (id, name, type, has_api) VALUES (?,?,?,?)",
-            (str(uuid.uuid4()), name, rtype, has_api)
+            (new_id(), name, rtype, has_api)
         )
 
     # Workflow definitions
-    np_id = str(uuid.uuid4())
-    npu_id = str(uuid.uuid4())
+    np_id = new_id()
+    npu_id = new_id()
     conn.execute(
         "INSERT OR IGNORE INTO workflow_definitions (id, name, description) VALUES (?,?,?)",
         (np_id, "new_partner", "Onboard a new partner organization from scratch")
@@ -281,7 +177,7 @@ def seed_data() -> None:
     for order, name, label, stype, desc in np_steps:
         conn.execute(
             "INSERT OR IGNORE INTO workflow_step_definitions (id,workflow_definition_id,step_order,name,label,type,description) VALUES (?,?,?,?,?,?,?)",
-            (str(uuid.uuid4()), np_id, order, name, label, stype, desc)
+            (new_id(), np_id, order, name, label, stype, desc)
         )
 
     # New Partner User steps
@@ -308,16 +204,19 @@ def seed_data() -> None:
     for order, name, label, stype, desc in npu_steps:
         conn.execute(
             "INSERT OR IGNORE INTO workflow_step_definitions (id,workflow_definition_id,step_order,name,label,type,description) VALUES (?,?,?,?,?,?,?)",
-            (str(uuid.uuid4()), npu_id, order, name, label, stype, desc)
+            (new_id(), npu_id, order, name, label, stype, desc)
         )
 
+    # Which steps wait for which (see migrations.SEEDED_STEP_DEPENDENCIES)
+    for sql in step_dependency_backfill():
+        conn.execute(sql)
+
     # Default admin user
     password_hash = bcrypt.hashpw(b"admin123", bcrypt.gensalt()).decode()
     conn.execute(
         "INSERT OR IGNORE INTO users (id,firstname,lastname,email,app_role,password_hash) VALUES (?,?,?,?,?,?)",
-        (str(uuid.uuid4()), "Admin", "User", "admin@hyopps.local", "admin", password_hash)
+        (new_id(), "Admin", "User", "admin@hyopps.local", "admin", password_hash)
     )
 
     conn.commit()
-    conn.close()
     print("Database seeded. Default admin: admin@hyopps.local / admin123")
@@ -0,0 +1,108 @@
+"""
+Standalone engine worker: `python -m api.engine.worker`.
+
+Polls the database for executions with a step ready to run and advances them
+on its own event loop, up to ENGINE_WORKERS at a time, with the same
+conditional claims and step leases as the API's engine. Any number of
+workers can run against one PostgreSQL database, on any host. A worker that
+dies mid-step leaves an expiring lease, and another worker resumes that step
+once the lease runs out.
+
+On SIGTERM or SIGINT a worker stops claiming, gives the advances in flight
+ENGINE_SHUTDOWN_GRACE seconds to finish, cancels the rest and hands their
+steps back as pending, so another worker picks them up at once rather than
+after their leases run out.
+
+Set ENGINE_EXTERNAL=1 on the API processes so they only record requests and
+leave every step to the workers; the API can then run with `--workers N`.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Optional
+
+from ..database import async_connection, close_pool, create_schema
+from .workflow import ENGINE_WORKERS, _advance, _owner, release_leases, runnable_executions
+
+# Seconds between polls for new work while the worker has free capacity.
+ENGINE_POLL_INTERVAL = float(os.getenv("ENGINE_POLL_INTERVAL", "0.5"))
+# Seconds a stopping worker waits for its advances before cancelling them.
+ENGINE_SHUTDOWN_GRACE = float(os.getenv("ENGINE_SHUTDOWN_GRACE", "10"))
+
+log = logging.getLogger(__name__)
+
+
+def _finished(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.error("advancing execution failed", exc_info=task.exception())
+
+
+async def _drain(active: dict[bytes, asyncio.Task]) -> None:
+    """Let the advances in flight finish within the grace period, cancel the rest, release their steps."""
+    tasks = list(active.values())
+    if tasks:
+        log.info("waiting up to %.0fs for %d advances", ENGINE_SHUTDOWN_GRACE, len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=ENGINE_SHUTDOWN_GRACE)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    async with async_connection() as db:
+        released = await db.run(release_leases)
+    if released:
+        log.warning("handed %d unfinished steps back", released)
+
+
+async def run_worker(stop: Optional[asyncio.Event] = None) -> None:
+    """Advance runnable executions, one advance per execution at a time, until `stop` is set."""
+    stop = stop or asyncio.Event()
+    active: dict[bytes, asyncio.Task] = {}
+    try:
+        while not stop.is_set():
+            free = ENGINE_WORKERS - len(active)
+            if free > 0:
+                try:
+                    async with async_connection() as db:
+                        # Ask for extra rows: some may be executions already advancing here.
+                        found = await db.run(runnable_executions, free + len(active))
+                except Exception:
+                    log.exception("polling for runnable executions failed")
+                    found = []
+                for execution_id in found:
+                    if execution_id in active or len(active) >= ENGINE_WORKERS:
+                        continue
+                    task = asyncio.create_task(_advance(execution_id))
+                    task.add_done_callback(_finished)
+                    task.add_done_callback(lambda _, key=execution_id: active.pop(key, None))
+                    active[execution_id] = task
+            try:
+                await asyncio.wait_for(stop.wait(), ENGINE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await _drain(active)
+
+
+async def _main() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    log.info("engine worker %s started, %d advances at once", _owner, ENGINE_WORKERS)
+    await run_worker(stop)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    create_schema()
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_pool()
+    log.info("engine worker %s stopped", _owner)
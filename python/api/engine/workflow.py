@@ -1,46 +1,148 @@
 """
 Workflow engine — drives step-by-step execution.
 
-Each call to advance() is synchronous and runs in a background thread
-so the HTTP response returns immediately.
+Advances are coroutines on the engine's own asyncio loop, which runs in a
+daemon thread, so the HTTP response returns immediately. Auto steps await
+their integrations (httpx, aiosmtplib), and a pooled connection is borrowed
+only for the short transactions around each step, never across its I/O: an
+execution waiting on Metabase costs a coroutine, not a thread or a connection.
+Up to ENGINE_WORKERS advances run at once and ENGINE_QUEUE_SIZE more wait for
+their turn; past that the public entry points raise EngineBusy before writing
+anything.
+
+A step is ready once every step it depends on (workflow_step_dependencies)
+is completed, so independent auto steps of one execution run concurrently,
+up to ENGINE_STEP_CONCURRENCY at a time. The advance is a loop of
+transitions, each one transaction: record the steps that finished (those
+finishing within ENGINE_GROUP_COMMIT_MS of each other together), then claim
+the steps that became ready. Steps are claimed with a conditional UPDATE
+(pending -> running), so two advances of one execution, in this process or
+another, never run the same step, and only the one that marks the execution
+completed finalizes it. A failed step fails the execution only after every
+step that doesn't depend on it has run, so the outcome doesn't depend on which
+siblings happened to be claimed before the failure was recorded.
+
+A claimed auto step is leased to this process for ENGINE_LEASE_SECONDS and
+renewed while it runs. If the process dies, the lease runs out and the step
+becomes claimable again: recovery_loop(), run by the API at startup and every
+ENGINE_RECOVERY_INTERVAL, queues an advance for such executions. A step
+whose lease was taken over has its late result dropped.
+
+With ENGINE_EXTERNAL set, the API runs no advances at all: entry points only
+commit, and standalone workers (engine/worker.py) find the work by polling
+runnable_executions().
+
+The public entry points run on the caller's request connection and commit
+before handing off, because the advance borrows its own pooled connection and
+must see the new rows. They return the queued advance as a Future; async
+callers can `await settle(future, timeout)` to wait for it without blocking
+the event loop.
 """
 
 import json
-import uuid
+import asyncio
+import logging
+import os
+import socket
 import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Iterator, Optional
 
-from ..database import get_db
+from ..database import async_connection
+from ..ids import new_id, new_key, to_id
 from ..integrations.steps import execute_step
+from ..timestamps import now_ms
 
-_lock = threading.Lock()
+# Advances running at once on the engine loop; each is a coroutine, not a thread.
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", "64"))
+# Advances allowed to wait for their turn before new work is refused.
+ENGINE_QUEUE_SIZE = int(os.getenv("ENGINE_QUEUE_SIZE", "1000"))
+# Ready auto steps of one execution run at once, up to this many.
+ENGINE_STEP_CONCURRENCY = int(os.getenv("ENGINE_STEP_CONCURRENCY", "4"))
+# How long a finished step waits for its siblings so they commit together (0 = never).
+ENGINE_GROUP_COMMIT_MS = float(os.getenv("ENGINE_GROUP_COMMIT_MS", "5"))
+# Seconds a claimed step stays leased without renewal; running steps renew at a third of it.
+ENGINE_LEASE_SECONDS = float(os.getenv("ENGINE_LEASE_SECONDS", "60"))
+# Seconds between sweeps for executions stranded by a dead process (0 = at startup only).
+ENGINE_RECOVERY_INTERVAL = float(os.getenv("ENGINE_RECOVERY_INTERVAL", "30"))
+# Leave running steps to `python -m api.engine.worker` processes; the API only records requests.
+ENGINE_EXTERNAL = os.getenv("ENGINE_EXTERNAL", "0") == "1"
+
+log = logging.getLogger(__name__)
+
+# One slot per queued or running advance; taken before an entry point writes.
+_slots = threading.BoundedSemaphore(ENGINE_WORKERS + ENGINE_QUEUE_SIZE)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_guard = threading.Lock()
+_running: Optional[asyncio.Semaphore] = None  # created on the engine loop
+
+# Executions with an advance queued or running in this process, and how many.
+_queued: dict[bytes, int] = {}
+_queued_guard = threading.Lock()
+
+# Lease owner for the steps this process runs.
+_owner = f"{socket.gethostname()}:{os.getpid()}:{new_id()[-12:]}"
 
 
 # ── helpers ────────────────────────────────────────────────────────────────
 
 def _now() -> str:
+    """Timestamp for the directory tables; the execution tables take now_ms()."""
     return datetime.utcnow().isoformat()
 
 
-def _build_context(execution_id: str, conn) -> dict[str, Any]:
-    """Merge outputs + manual_inputs from all completed steps into one context dict."""
-    rows = conn.execute(
-        "SELECT output, manual_input FROM workflow_step_executions WHERE execution_id=? AND status='completed'",
-        (execution_id,)
-    ).fetchall()
-    ctx: dict[str, Any] = {}
-    for row in rows:
-        if row["output"]:
-            ctx.update(json.loads(row["output"]))
-        if row["manual_input"]:
-            ctx.update(json.loads(row["manual_input"]))
-    return ctx
+def _lease_until() -> int:
+    return now_ms() + int(ENGINE_LEASE_SECONDS * 1000)
+
+
+def _expiry() -> tuple[int, int]:
+    """Parameters of _LEASE_EXPIRED: now, and a lease period ago."""
+    now = now_ms()
+    return now, now - int(ENGINE_LEASE_SECONDS * 1000)
+
+
+def _load_context(execution_id: bytes, conn) -> dict[str, Any]:
+    """The execution's context: outputs and manual inputs of its completed steps, merged."""
+    row = conn.execute(
+        "SELECT context FROM execution_contexts WHERE execution_id=?", (execution_id,)
+    ).fetchone()
+    return json.loads(row["context"]) if row else {}
+
+
+def _merge_context(execution_id: bytes, values: dict[str, Any], step_order: int, conn) -> None:
+    """
+    Fold a completed step's output or manual input into the stored context.
+    Parallel steps finish in any order, so a key keeps the value of the latest
+    step in step order that set it (key_orders), as a sequential run would.
+    """
+    # Write first: that locks the row (and takes SQLite's write lock), so
+    # parallel steps of one execution merge one after another, never over each other.
+    if not conn.execute(
+        "UPDATE execution_contexts SET context=context WHERE execution_id=?", (execution_id,)
+    ).rowcount:
+        conn.execute(
+            "INSERT INTO execution_contexts (execution_id, context) VALUES (?,?)", (execution_id, "{}")
+        )
+    row = conn.execute(
+        "SELECT context, key_orders FROM execution_contexts WHERE execution_id=?", (execution_id,)
+    ).fetchone()
+    ctx, orders = json.loads(row["context"]), json.loads(row["key_orders"])
+    for key, value in values.items():
+        if orders.get(key, step_order) <= step_order:
+            ctx[key] = value
+            orders[key] = step_order
+    conn.execute(
+        "UPDATE execution_contexts SET context=?, key_orders=? WHERE execution_id=?",
+        (json.dumps(ctx), json.dumps(orders), execution_id)
+    )
 
 
 # ── side-effect writers ────────────────────────────────────────────────────
 
-def _apply_step_output(execution_id: str, step_name: str, output: dict, conn) -> None:
+def _apply_step_output(execution_id: bytes, step_name: str, output: dict, conn) -> None:
     """Immediately persist relevant fields from an auto step's output."""
     execution = conn.execute(
         "SELECT organization_id, user_id FROM workflow_executions WHERE id=?", (execution_id,)
@@ -54,7 +156,7 @@ def _apply_step_output(execution_id: str, step_name: str, output: dict, conn) ->
     if step_name == "create_studio_user_company" and user_id and output.get("studio_user_company_id"):
         conn.execute(
             "INSERT OR IGNORE INTO user_studio_companies (id, user_id, studio_id, name, created_at) VALUES (?,?,?,?,?)",
-            (str(uuid.uuid4()), user_id,
+            (new_id(), user_id,
              output["studio_user_company_id"],
              output.get("studio_user_company_name", "Personal Studio"),
              now)
@@ -67,7 +169,7 @@ def _apply_step_output(execution_id: str, step_name: str, output: dict, conn) ->
             conn.execute("UPDATE users SET metabase_user_id=? WHERE id=?", (mb_user_id, user_id))
         else:
             # user_id not yet on execution row — fall back to email lookup from context
-            ctx = _build_context(execution_id, conn)
+            ctx = _load_context(execution_id, conn)
             email = ctx.get("email", "").strip().lower()
             if email:
                 conn.execute("UPDATE users SET metabase_user_id=? WHERE email=?", (mb_user_id, email))
@@ -85,28 +187,28 @@ def _apply_step_output(execution_id: str, step_name: str, output: dict, conn) ->
     if step_name == "create_metabase_group" and output.get("metabase_group_id"):
         conn.execute(
             "INSERT OR IGNORE INTO system_groups (id,organization_id,tool,external_name,external_id,created_at) VALUES (?,?,?,?,?,?)",
-            (str(uuid.uuid4()), org_id, "metabase", output.get("metabase_group_name", "metabase"), output["metabase_group_id"], now)
+            (new_id(), org_id, "metabase", output.get("metabase_group_name", "metabase"), output["metabase_group_id"], now)
         )
 
     if step_name == "create_teams_channel" and output.get("teams_channel_id"):
         conn.execute(
             "INSERT OR IGNORE INTO system_groups (id,organization_id,tool,external_name,external_id,created_at) VALUES (?,?,?,?,?,?)",
-            (str(uuid.uuid4()), org_id, "teams", output.get("teams_channel_name", "teams"), output["teams_channel_id"], now)
+            (new_id(), org_id, "teams", output.get("teams_channel_name", "teams"), output["teams_channel_id"], now)
         )
 
     if step_name == "create_slack_group" and output.get("slack_group_id"):
         conn.execute(
             "INSERT OR IGNORE INTO system_groups (id,organization_id,tool,external_name,external_id,created_at) VALUES (?,?,?,?,?,?)",
-            (str(uuid.uuid4()), org_id, "slack", output.get("slack_group_handle", "slack"), output["slack_group_id"], now)
+            (new_id(), org_id, "slack", output.get("slack_group_handle", "slack"), output["slack_group_id"], now)
         )
 
 
-def _finalize_new_partner(execution_id: str, conn) -> None:
+def _finalize_new_partner(execution_id: bytes, conn) -> None:
     execution = conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone()
     if not execution or not execution["organization_id"]:
         return
     org_id = execution["organization_id"]
-    ctx = _build_context(execution_id, conn)
+    ctx = _load_context(execution_id, conn)
     now = _now()
 
     existing = conn.execute(
@@ -115,7 +217,7 @@ def _finalize_new_partner(execution_id: str, conn) -> None:
     if not existing:
         conn.execute(
             "INSERT INTO organization_integrations (id,organization_id,keycloak_confirmed,keycloak_cluster,metabase_collection_id,lms_confirmed,updated_at) VALUES (?,?,?,?,?,?,?)",
-            (str(uuid.uuid4()), org_id,
+            (new_id(), org_id,
              1 if ctx.get("keycloak_confirmed") else 0,
              ctx.get("keycloak_cluster"),
              ctx.get("metabase_collection_id"),
@@ -140,30 +242,30 @@ def _finalize_new_partner(execution_id: str, conn) -> None:
         if ctx.get(id_key):
             conn.execute(
                 "INSERT OR IGNORE INTO system_groups (id,organization_id,tool,external_name,external_id,created_at) VALUES (?,?,?,?,?,?)",
-                (str(uuid.uuid4()), org_id, tool, ctx.get(name_key, tool), ctx[id_key], now)
+                (new_id(), org_id, tool, ctx.get(name_key, tool), ctx[id_key], now)
             )
 
 
-def _finalize_new_partner_user(execution_id: str, conn) -> None:
+def _finalize_new_partner_user(execution_id: bytes, conn) -> None:
     execution = conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone()
     if not execution or not execution["user_id"] or not execution["requested_by"]:
         return
     user_id = execution["user_id"]
     requested_by = execution["requested_by"]
-    ctx = _build_context(execution_id, conn)
+    ctx = _load_context(execution_id, conn)
     now = _now()
 
     resources = conn.execute("SELECT id FROM resources").fetchall()
     for r in resources:
         conn.execute(
             "INSERT OR IGNORE INTO access_grants (id,user_id,resource_id,permission,granted_by,granted_at,execution_id) VALUES (?,?,?,?,?,?,?)",
-            (str(uuid.uuid4()), user_id, r["id"], "read", requested_by, now, execution_id)
+            (new_id(), user_id, r["id"], "read", requested_by, now, execution_id)
         )
 
 
 # ── manual input handlers ──────────────────────────────────────────────────
 
-def _handle_input_studio_companies(execution_id: str, data: dict, conn) -> None:
+def _handle_input_studio_companies(execution_id: bytes, data: dict, conn) -> None:
     org_name = data.get("organization_name", "")
     if not org_name:
         return
@@ -171,7 +273,7 @@ def _handle_input_studio_companies(execution_id: str, data: dict, conn) -> None:
 
     org = conn.execute("SELECT id FROM organizations WHERE name=?", (org_name,)).fetchone()
     if not org:
-        org_id = str(uuid.uuid4())
+        org_id = new_id()
         conn.execute(
             "INSERT INTO organizations (id,name,account_types,created_at) VALUES (?,?,?,?)",
             (org_id, org_name, '["partner"]', now)
@@ -184,7 +286,7 @@ def _handle_input_studio_companies(execution_id: str, data: dict, conn) -> None:
     if not conn.execute("SELECT id FROM organization_integrations WHERE organization_id=?", (org_id,)).fetchone():
         conn.execute(
             "INSERT INTO organization_integrations (id,organization_id,updated_at) VALUES (?,?,?)",
-            (str(uuid.uuid4()), org_id, now)
+            (new_id(), org_id, now)
         )
 
     for env, id_key, name_key in [
@@ -196,17 +298,17 @@ def _handle_input_studio_companies(execution_id: str, data: dict, conn) -> None:
             name = data.get(name_key) or f"{org_name} {env.upper()}"
             conn.execute(
                 "INSERT OR IGNORE INTO studio_companies (id,organization_id,studio_id,name,environment,created_at) VALUES (?,?,?,?,?,?)",
-                (str(uuid.uuid4()), org_id, studio_id, name, env, now)
+                (new_id(), org_id, studio_id, name, env, now)
             )
 
 
-def _handle_select_organization(execution_id: str, data: dict, conn) -> None:
+def _handle_select_organization(execution_id: bytes, data: dict, conn) -> None:
     org_id = data.get("organization_id", "")
     if org_id:
         conn.execute("UPDATE workflow_executions SET organization_id=? WHERE id=?", (org_id, execution_id))
 
 
-def _handle_input_user_details(execution_id: str, data: dict, conn) -> None:
+def _handle_input_user_details(execution_id: bytes, data: dict, conn) -> None:
     email = data.get("email", "")
     if not email:
         return
@@ -217,7 +319,7 @@ def _handle_input_user_details(execution_id: str, data: dict, conn) -> None:
     user = conn.execute("SELECT id FROM users WHERE email=?", (email,)).fetchone()
     if not user:
         import bcrypt, secrets
-        user_id = str(uuid.uuid4())
+        user_id = new_id()
         rand_pw = bcrypt.hashpw(secrets.token_bytes(16), bcrypt.gensalt()).decode()
         conn.execute(
             "INSERT INTO users (id,firstname,lastname,email,languages,skills,roles,organization_id,app_role,password_hash,created_at) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
@@ -239,7 +341,7 @@ def _handle_input_user_details(execution_id: str, data: dict, conn) -> None:
     conn.execute("UPDATE workflow_executions SET user_id=? WHERE id=?", (user_id, execution_id))
 
 
-def _handle_trigger_infrabot(execution_id: str, data: dict, conn) -> None:
+def _handle_trigger_infrabot(execution_id: bytes, data: dict, conn) -> None:
     execution = conn.execute("SELECT organization_id FROM workflow_executions WHERE id=?", (execution_id,)).fetchone()
     if not execution or not execution["organization_id"]:
         return
@@ -249,174 +351,350 @@ def _handle_trigger_infrabot(execution_id: str, data: dict, conn) -> None:
     )
 
 
-# ── core advance logic ─────────────────────────────────────────────────────
+def _apply_manual_input(execution_id: bytes, step_name: str, data: dict, conn) -> None:
+    if step_name == "input_studio_companies":
+        _handle_input_studio_companies(execution_id, data, conn)
+    elif step_name == "select_organization":
+        _handle_select_organization(execution_id, data, conn)
+    elif step_name == "input_user_details":
+        _handle_input_user_details(execution_id, data, conn)
+    elif step_name == "trigger_infrabot":
+        _handle_trigger_infrabot(execution_id, data, conn)
 
-def _advance(execution_id: str) -> None:
-    """Run the next pending step. Called in a background thread."""
-    with _lock:
-        conn = get_db()
-        try:
-            execution = conn.execute(
-                "SELECT status FROM workflow_executions WHERE id=?", (execution_id,)
-            ).fetchone()
-            if not execution or execution["status"] in ("completed", "failed"):
-                return
 
-            next_step = conn.execute("""
-                SELECT wse.id, wse.step_order, wsd.name as step_name, wsd.type as step_type, wsd.label
-                FROM workflow_step_executions wse
-                JOIN workflow_step_definitions wsd ON wsd.id = wse.step_definition_id
-                WHERE wse.execution_id=? AND wse.status='pending'
-                ORDER BY wse.step_order ASC LIMIT 1
-            """, (execution_id,)).fetchone()
-
-            if not next_step:
-                # All done
-                now = _now()
-                conn.execute(
-                    "UPDATE workflow_executions SET status='completed', completed_at=? WHERE id=?",
-                    (now, execution_id)
-                )
-                wf = conn.execute(
-                    "SELECT wd.name FROM workflow_definitions wd JOIN workflow_executions we ON we.workflow_definition_id=wd.id WHERE we.id=?",
-                    (execution_id,)
-                ).fetchone()
-                if wf:
-                    if wf["name"] == "new_partner":
-                        _finalize_new_partner(execution_id, conn)
-                    elif wf["name"] == "new_partner_user":
-                        _finalize_new_partner_user(execution_id, conn)
-                conn.commit()
-                return
+# ── core advance logic ─────────────────────────────────────────────────────
 
-            now = _now()
-            conn.execute(
-                "UPDATE workflow_step_executions SET status='running', started_at=? WHERE id=?",
-                (now, next_step["id"])
-            )
+def _complete_execution(execution_id: bytes, conn) -> None:
+    """Mark the execution completed and write its results; a no-op if another advance already did."""
+    done = conn.execute(
+        "UPDATE workflow_executions SET status='completed', completed_at=? WHERE id=? AND status!='completed'",
+        (now_ms(), execution_id)
+    ).rowcount
+    if not done:
+        return
+    wf = conn.execute(
+        "SELECT wd.name FROM workflow_definitions wd JOIN workflow_executions we ON we.workflow_definition_id=wd.id WHERE we.id=?",
+        (execution_id,)
+    ).fetchone()
+    if wf:
+        if wf["name"] == "new_partner":
+            _finalize_new_partner(execution_id, conn)
+        elif wf["name"] == "new_partner_user":
+            _finalize_new_partner_user(execution_id, conn)
+
+
+# A running step whose owner stopped renewing it; it's ready to be claimed again.
+# One without a lease was claimed by a process from before leases (during a
+# rolling deploy); it expires once it has run for a whole lease period.
+# Takes the two parameters from _expiry().
+_LEASE_EXPIRED = "(lease_expires_at < ? OR (lease_expires_at IS NULL AND started_at < ?))"
+# Step `wse` can be claimed: pending or lease expired, and every step it depends on is done.
+_READY = f"""(wse.status='pending' OR (wse.status='running' AND {_LEASE_EXPIRED}))
+          AND NOT EXISTS (
+              SELECT 1 FROM workflow_step_dependencies dep
+              JOIN workflow_step_executions prior
+                ON prior.execution_id = wse.execution_id AND prior.step_definition_id = dep.depends_on_id
+              WHERE dep.step_definition_id = wse.step_definition_id
+                AND prior.status NOT IN ('completed','skipped')
+          )"""
+
+
+def _finish_if_settled(execution_id: bytes, conn) -> None:
+    """
+    With no step left to claim: fail the execution once a failed step has no
+    sibling still running, or complete it once every step is done.
+    """
+    failed = conn.execute(
+        "SELECT 1 FROM workflow_step_executions WHERE execution_id=? AND status='failed' LIMIT 1",
+        (execution_id,)
+    ).fetchone()
+    if failed:
+        if not conn.execute(
+            "SELECT 1 FROM workflow_step_executions WHERE execution_id=? AND status='running' LIMIT 1",
+            (execution_id,)
+        ).fetchone():
             conn.execute(
-                "UPDATE workflow_executions SET current_step_order=?, status='running' WHERE id=?",
-                (next_step["step_order"], execution_id)
+                "UPDATE workflow_executions SET status='failed' WHERE id=? AND status IN ('running','awaiting_input')",
+                (execution_id,)
             )
-            conn.commit()
-
-            if next_step["step_type"] == "manual":
-                conn.execute(
-                    "UPDATE workflow_step_executions SET status='awaiting_input' WHERE id=?",
-                    (next_step["id"],)
-                )
-                conn.execute(
-                    "UPDATE workflow_executions SET status='awaiting_input' WHERE id=?",
-                    (execution_id,)
-                )
-                conn.commit()
-                return
-
-            # Auto step
-            ctx = _build_context(execution_id, conn)
-            result = execute_step(next_step["step_name"], ctx)
-            finished_at = _now()
-
-            if result["success"]:
-                output = result.get("output", {})
-                conn.execute(
-                    "UPDATE workflow_step_executions SET status='completed', output=?, completed_at=? WHERE id=?",
-                    (json.dumps(output), finished_at, next_step["id"])
-                )
-                _apply_step_output(execution_id, next_step["step_name"], output, conn)
-                conn.commit()
-                # Recurse for next step (still inside the lock — ok since we use one thread)
-                _advance_unlocked(execution_id, conn)
-            else:
-                conn.execute(
-                    "UPDATE workflow_step_executions SET status='failed', error=?, completed_at=? WHERE id=?",
-                    (result.get("error", "Unknown error"), finished_at, next_step["id"])
-                )
-                conn.execute("UPDATE workflow_executions SET status='failed' WHERE id=?", (execution_id,))
-                conn.commit()
-
-        finally:
-            conn.close()
+        return
+    unfinished = conn.execute(
+        "SELECT 1 FROM workflow_step_executions WHERE execution_id=? AND status NOT IN ('completed','skipped') LIMIT 1",
+        (execution_id,)
+    ).fetchone()
+    if not unfinished:
+        _complete_execution(execution_id, conn)
 
 
-def _advance_unlocked(execution_id: str, conn) -> None:
-    """Advance without acquiring the lock again (called from within _advance)."""
+def _claim_ready_steps(execution_id: bytes, limit: int, conn) -> list[dict[str, Any]]:
+    """
+    Claim the execution's ready steps: manual ones start awaiting input, and
+    up to `limit` auto ones are leased to this process and returned with the
+    context to run them in. With nothing left to claim, settles the execution.
+    """
     execution = conn.execute(
         "SELECT status FROM workflow_executions WHERE id=?", (execution_id,)
     ).fetchone()
     if not execution or execution["status"] in ("completed", "failed"):
-        return
+        return []
 
-    next_step = conn.execute("""
+    now = now_ms()
+    ready = conn.execute(f"""
         SELECT wse.id, wse.step_order, wsd.name as step_name, wsd.type as step_type
         FROM workflow_step_executions wse
         JOIN workflow_step_definitions wsd ON wsd.id = wse.step_definition_id
-        WHERE wse.execution_id=? AND wse.status='pending'
-        ORDER BY wse.step_order ASC LIMIT 1
-    """, (execution_id,)).fetchone()
-
-    if not next_step:
-        now = _now()
-        conn.execute(
-            "UPDATE workflow_executions SET status='completed', completed_at=? WHERE id=?",
-            (now, execution_id)
-        )
-        wf = conn.execute(
-            "SELECT wd.name FROM workflow_definitions wd JOIN workflow_executions we ON we.workflow_definition_id=wd.id WHERE we.id=?",
-            (execution_id,)
-        ).fetchone()
-        if wf:
-            if wf["name"] == "new_partner":
-                _finalize_new_partner(execution_id, conn)
-            elif wf["name"] == "new_partner_user":
-                _finalize_new_partner_user(execution_id, conn)
-        conn.commit()
-        return
-
-    now = _now()
+        WHERE wse.execution_id=?
+          AND {_READY}
+        ORDER BY wse.step_order ASC
+    """, (execution_id, *_expiry())).fetchall()
+
+    if not ready:
+        _finish_if_settled(execution_id, conn)
+        return []
+
+    lease = _lease_until()
+    claimed = []
+    leased = 0
+    for step in ready:
+        manual = step["step_type"] == "manual"
+        if not manual and leased >= limit:
+            continue
+        if conn.execute(
+            "UPDATE workflow_step_executions SET status=?, started_at=?, lease_owner=?, lease_expires_at=? "
+            f"WHERE id=? AND (status='pending' OR (status='running' AND {_LEASE_EXPIRED}))",
+            ("awaiting_input" if manual else "running", now,
+             None if manual else _owner, None if manual else lease, step["id"], *_expiry())
+        ).rowcount:
+            claimed.append(step)
+            leased += not manual
+    if not claimed:
+        return []  # taken by another advance
+
+    waiting = conn.execute(
+        "SELECT 1 FROM workflow_step_executions WHERE execution_id=? AND status='awaiting_input' LIMIT 1",
+        (execution_id,)
+    ).fetchone()
     conn.execute(
-        "UPDATE workflow_step_executions SET status='running', started_at=? WHERE id=?",
-        (now, next_step["id"])
+        "UPDATE workflow_executions SET current_step_order=?, status=? WHERE id=?",
+        (claimed[0]["step_order"], "awaiting_input" if waiting else "running", execution_id)
     )
+    auto = [step for step in claimed if step["step_type"] == "auto"]
+    if not auto:
+        return []
+    ctx = _load_context(execution_id, conn)
+    return [
+        {"id": step["id"], "step_name": step["step_name"], "step_order": step["step_order"], "context": ctx}
+        for step in auto
+    ]
+
+
+def _record_result(execution_id: bytes, step: dict[str, Any], result: dict[str, Any], conn) -> None:
+    """
+    Store an auto step's outcome. Dropped if the step's lease ran out and
+    another advance took it over meanwhile. A failed step doesn't stop its
+    independent siblings: they are still claimed and run, and the execution
+    fails once none is left (_finish_if_settled).
+    """
+    owned = "WHERE id=? AND status='running' AND lease_owner=?"
+    finished_at = now_ms()
+    if result["success"]:
+        output = result.get("output", {})
+        if not conn.execute(
+            f"UPDATE workflow_step_executions SET status='completed', output=?, completed_at=? {owned}",
+            (json.dumps(output), finished_at, step["id"], _owner)
+        ).rowcount:
+            log.warning("step %s of execution %s lost its lease; result dropped", step["step_name"], to_id(execution_id))
+            return
+        _merge_context(execution_id, output, step["step_order"], conn)
+        _apply_step_output(execution_id, step["step_name"], output, conn)
+        return
+    if not conn.execute(
+        f"UPDATE workflow_step_executions SET status='failed', error=?, completed_at=? {owned}",
+        (result.get("error", "Unknown error"), finished_at, step["id"], _owner)
+    ).rowcount:
+        log.warning("step %s of execution %s lost its lease; failure dropped", step["step_name"], to_id(execution_id))
+
+
+def _renew_leases(step_ids: list[bytes], conn) -> None:
+    """Extend this process's leases on steps still running."""
     conn.execute(
-        "UPDATE workflow_executions SET current_step_order=?, status='running' WHERE id=?",
-        (next_step["step_order"], execution_id)
+        f"UPDATE workflow_step_executions SET lease_expires_at=? "
+        f"WHERE id IN ({','.join('?' * len(step_ids))}) AND status='running' AND lease_owner=?",
+        (_lease_until(), *step_ids, _owner)
     )
 
-    if next_step["step_type"] == "manual":
-        conn.execute("UPDATE workflow_step_executions SET status='awaiting_input' WHERE id=?", (next_step["id"],))
-        conn.execute("UPDATE workflow_executions SET status='awaiting_input' WHERE id=?", (execution_id,))
-        conn.commit()
-        return
 
-    ctx = _build_context(execution_id, conn)
-    result = execute_step(next_step["step_name"], ctx)
-    finished_at = _now()
+def release_leases(conn) -> int:
+    """
+    Hand this process's running steps back: pending again, free for any
+    advance to claim at once instead of after their leases run out. Call it
+    only once no advance of this process is left running.
+    """
+    return conn.execute(
+        "UPDATE workflow_step_executions SET status='pending', started_at=NULL, lease_owner=NULL, lease_expires_at=NULL "
+        "WHERE status='running' AND lease_owner=?",
+        (_owner,)
+    ).rowcount
 
-    if result["success"]:
-        output = result.get("output", {})
-        conn.execute(
-            "UPDATE workflow_step_executions SET status='completed', output=?, completed_at=? WHERE id=?",
-            (json.dumps(output), finished_at, next_step["id"])
-        )
-        _apply_step_output(execution_id, next_step["step_name"], output, conn)
-        conn.commit()
-        _advance_unlocked(execution_id, conn)  # next step
-    else:
-        conn.execute(
-            "UPDATE workflow_step_executions SET status='failed', error=?, completed_at=? WHERE id=?",
-            (result.get("error", "Unknown error"), finished_at, next_step["id"])
-        )
-        conn.execute("UPDATE workflow_executions SET status='failed' WHERE id=?", (execution_id,))
-        conn.commit()
 
+async def _db(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a sync helper in one short transaction on a pooled connection."""
+    async with async_connection() as db:
+        return await db.run(fn, *args)
 
-# ── public API ─────────────────────────────────────────────────────────────
 
-def start_execution(execution_id: str) -> None:
-    """Create step records and kick off the workflow in a background thread."""
-    conn = get_db()
+async def _run_step(execution_id: bytes, step: dict[str, Any]) -> dict[str, Any]:
+    try:
+        return await execute_step(step["step_name"], step["context"])
+    except Exception as e:
+        log.exception("step %s of execution %s raised", step["step_name"], to_id(execution_id))
+        return {"success": False, "error": str(e)}
+
+
+def _transition(execution_id: bytes, finished: list[tuple[dict[str, Any], dict[str, Any]]], limit: int, conn) -> list[dict[str, Any]]:
+    """
+    One engine transition, committed as a whole: record the steps that just
+    finished, then claim up to `limit` steps they made ready.
+    """
+    for step, result in finished:
+        _record_result(execution_id, step, result, conn)
+    return _claim_ready_steps(execution_id, limit, conn) if limit > 0 else []
+
+
+async def _advance(execution_id: bytes) -> None:
+    """Run the execution's ready auto steps, concurrently, until none is left to run."""
+    running: dict[asyncio.Future, dict[str, Any]] = {}
+    finished: list[tuple[dict[str, Any], dict[str, Any]]] = []
+    try:
+        while True:
+            # Each transition commits before the steps it claims run: no
+            # connection or write lock is held while a step waits on a service.
+            claimed = await _db(_transition, execution_id, finished, ENGINE_STEP_CONCURRENCY - len(running))
+            for step in claimed:
+                running[asyncio.ensure_future(_run_step(execution_id, step))] = step
+            if not running:
+                return
+            done: set = set()
+            while not done:
+                done, _ = await asyncio.wait(
+                    running, timeout=ENGINE_LEASE_SECONDS / 3, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    await _db(_renew_leases, [step["id"] for step in running.values()])
+            if len(done) < len(running) and ENGINE_GROUP_COMMIT_MS > 0:
+                # Steps finishing close together share one commit (and one fsync).
+                more, _ = await asyncio.wait(
+                    [task for task in running if task not in done], timeout=ENGINE_GROUP_COMMIT_MS / 1000
+                )
+                done |= more
+            finished = [(running.pop(task), task.result()) for task in done]
+    finally:
+        # Cancelled (a worker shutting down): don't leave its steps running unowned.
+        for task in running:
+            task.cancel()
+
+
+# ── background hand-off ────────────────────────────────────────────────────
+
+class EngineBusy(RuntimeError):
+    """Every worker is busy and the queue is full; nothing was written."""
+
+
+def _take_slot() -> None:
+    """Take a pool slot for one advance; _spawn() hands it to the advance, which gives it back."""
+    if not ENGINE_EXTERNAL and not _slots.acquire(blocking=False):
+        raise EngineBusy("The workflow engine is busy, try again shortly")
+
+
+@contextmanager
+def _reservation() -> Iterator[None]:
+    """Take a pool slot for the advance queued at the end of the block; given back if the block fails."""
+    _take_slot()
+    try:
+        yield
+    except BaseException:
+        if not ENGINE_EXTERNAL:
+            _slots.release()
+        raise
+
+
+def _done(future: Future) -> None:
+    _slots.release()
+    if not future.cancelled() and future.exception() is not None:
+        log.error("advancing execution failed", exc_info=future.exception())
+
+
+def _engine_loop() -> asyncio.AbstractEventLoop:
+    """The engine's event loop, started in a daemon thread on first use."""
+    global _loop
+    with _loop_guard:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="hyopps-engine", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+async def _run(execution_id: bytes) -> None:
+    global _running
+    if _running is None:
+        _running = asyncio.Semaphore(ENGINE_WORKERS)
+    async with _running:
+        await _advance(execution_id)
+
+
+def _dequeue(execution_id: bytes) -> None:
+    with _queued_guard:
+        _queued[execution_id] -= 1
+        if not _queued[execution_id]:
+            del _queued[execution_id]
+
+
+def _spawn(execution_id: bytes) -> Future:
+    """Queue an advance on the slot taken by _take_slot(); given back if queueing fails."""
+    if ENGINE_EXTERNAL:
+        return Future()  # a worker process advances it; nothing here to wait for
+    with _queued_guard:
+        _queued[execution_id] = _queued.get(execution_id, 0) + 1
     try:
+        future = asyncio.run_coroutine_threadsafe(_run(execution_id), _engine_loop())
+    except BaseException:
+        _dequeue(execution_id)
+        _slots.release()
+        raise
+    future.add_done_callback(_done)
+    future.add_done_callback(lambda _: _dequeue(execution_id))
+    return future
+
+
+async def settle(future: Future, timeout: float) -> bool:
+    """Wait up to `timeout` seconds for a queued advance; returns whether it has finished."""
+    if ENGINE_EXTERNAL:
+        return False
+    if timeout > 0 and not future.done():
+        await asyncio.wait([asyncio.wrap_future(future)], timeout=timeout)
+    return future.done()
+
+
+# ── public API ─────────────────────────────────────────────────────────────
+
+def queue_advance(execution_id: bytes) -> Future:
+    """Queue an advance of an execution as it stands; raises EngineBusy when every slot is taken."""
+    _take_slot()
+    return _spawn(execution_id)
+
+
+def start_execution(
+    execution_id: bytes, conn, inputs: Optional[dict[str, dict]] = None, completed_by: Optional[str] = None
+) -> Future:
+    """
+    Create step records and queue the workflow's first advance. `inputs`
+    completes manual steps known up front (by step name, e.g. the partner's
+    own select_organization) in the same transaction, so the execution never
+    waits on them, whether or not this process runs the advance.
+    """
+    inputs = inputs or {}
+    with _reservation():
         execution = conn.execute(
             "SELECT workflow_definition_id FROM workflow_executions WHERE id=?", (execution_id,)
         ).fetchone()
@@ -424,24 +702,32 @@ def start_execution(execution_id: str) -> None:
             "SELECT * FROM workflow_step_definitions WHERE workflow_definition_id=? ORDER BY step_order ASC",
             (execution["workflow_definition_id"],)
         ).fetchall()
+        conn.execute(
+            "INSERT INTO execution_contexts (execution_id, context) VALUES (?,?)", (execution_id, "{}")
+        )
+        now = now_ms()
         for step in steps:
+            data = inputs.get(step["name"]) if step["type"] == "manual" else None
+            if data is None:
+                conn.execute(
+                    "INSERT INTO workflow_step_executions (id,execution_id,step_definition_id,step_order,status) VALUES (?,?,?,?,?)",
+                    (new_key(), execution_id, step["id"], step["step_order"], "pending")
+                )
+                continue
             conn.execute(
-                "INSERT INTO workflow_step_executions (id,execution_id,step_definition_id,step_order,status) VALUES (?,?,?,?,?)",
-                (str(uuid.uuid4()), execution_id, step["id"], step["step_order"], "pending")
+                "INSERT INTO workflow_step_executions (id,execution_id,step_definition_id,step_order,status,manual_input,completed_by,started_at,completed_at) "
+                "VALUES (?,?,?,?,?,?,?,?,?)",
+                (new_key(), execution_id, step["id"], step["step_order"], "completed", json.dumps(data), completed_by, now, now)
             )
+            _apply_manual_input(execution_id, step["name"], data, conn)
+            _merge_context(execution_id, data, step["step_order"], conn)
         conn.execute("UPDATE workflow_executions SET status='running' WHERE id=?", (execution_id,))
         conn.commit()
-    finally:
-        conn.close()
-
-    thread = threading.Thread(target=_advance, args=(execution_id,), daemon=True)
-    thread.start()
-    thread.join(timeout=2)  # wait briefly so first step resolves before returning
+    return _spawn(execution_id)
 
 
-def submit_manual_input(execution_id: str, step_exec_id: str, data: dict, completed_by: str) -> None:
-    conn = get_db()
-    try:
+def submit_manual_input(execution_id: bytes, step_exec_id: bytes, data: dict, completed_by: str, conn) -> Future:
+    with _reservation():
         step_exec = conn.execute(
             "SELECT wse.*, wsd.name as step_name FROM workflow_step_executions wse "
             "JOIN workflow_step_definitions wsd ON wsd.id=wse.step_definition_id "
@@ -451,33 +737,18 @@ def submit_manual_input(execution_id: str, step_exec_id: str, data: dict, comple
         if not step_exec:
             raise ValueError("Step not found or not awaiting input")
 
-        step_name = step_exec["step_name"]
-
-        if step_name == "input_studio_companies":
-            _handle_input_studio_companies(execution_id, data, conn)
-        elif step_name == "select_organization":
-            _handle_select_organization(execution_id, data, conn)
-        elif step_name == "input_user_details":
-            _handle_input_user_details(execution_id, data, conn)
-        elif step_name == "trigger_infrabot":
-            _handle_trigger_infrabot(execution_id, data, conn)
-
+        _apply_manual_input(execution_id, step_exec["step_name"], data, conn)
         conn.execute(
             "UPDATE workflow_step_executions SET status='completed', manual_input=?, completed_by=?, completed_at=? WHERE id=?",
-            (json.dumps(data), completed_by, _now(), step_exec_id)
+            (json.dumps(data), completed_by, now_ms(), step_exec_id)
         )
+        _merge_context(execution_id, data, step_exec["step_order"], conn)
         conn.commit()
-    finally:
-        conn.close()
-
-    thread = threading.Thread(target=_advance, args=(execution_id,), daemon=True)
-    thread.start()
-    thread.join(timeout=2)
+    return _spawn(execution_id)
 
 
-def retry_step(execution_id: str, step_exec_id: str) -> None:
-    conn = get_db()
-    try:
+def retry_step(execution_id: bytes, step_exec_id: bytes, conn) -> Future:
+    with _reservation():
         step_exec = conn.execute(
             "SELECT id FROM workflow_step_executions WHERE id=? AND execution_id=? AND status='failed'",
             (step_exec_id, execution_id)
@@ -490,9 +761,93 @@ def retry_step(execution_id: str, step_exec_id: str) -> None:
         )
         conn.execute("UPDATE workflow_executions SET status='running' WHERE id=?", (execution_id,))
         conn.commit()
-    finally:
-        conn.close()
+    return _spawn(execution_id)
+
+
+# ── crash recovery ─────────────────────────────────────────────────────────
+
+def recover_stranded(conn) -> int:
+    """
+    Queue an advance for each execution a dead process left behind: one with
+    a running step whose lease ran out, or one left running with no step in
+    flight for a whole lease period (its queued advance was lost). Executions
+    with an advance already queued or running in this process are left to it.
+    The claim decides which advance, in which process, gets each step, so
+    every process may sweep at once. Returns how many were queued.
+    """
+    now, stale = _expiry()
+    rows = conn.execute(f"""
+        SELECT we.id FROM workflow_executions we
+        WHERE we.status IN ('running','awaiting_input') AND we.id IN (
+            SELECT execution_id FROM workflow_step_executions WHERE status='running' AND {_LEASE_EXPIRED}
+        )
+        UNION
+        SELECT we.id FROM workflow_executions we
+        WHERE we.status='running'
+          AND NOT EXISTS (
+              SELECT 1 FROM workflow_step_executions wse
+              WHERE wse.execution_id=we.id AND wse.status IN ('running','awaiting_input')
+          )
+          AND coalesce(
+              (SELECT max(wse.completed_at) FROM workflow_step_executions wse WHERE wse.execution_id=we.id),
+              we.created_at
+          ) < ?
+    """, (now, stale, stale)).fetchall()
+    with _queued_guard:
+        rows = [row for row in rows if row["id"] not in _queued]
+    queued = 0
+    for row in rows:
+        try:
+            queue_advance(row["id"])
+        except EngineBusy:
+            break  # the next sweep picks up the rest
+        queued += 1
+    return queued
+
 
-    thread = threading.Thread(target=_advance, args=(execution_id,), daemon=True)
-    thread.start()
-    thread.join(timeout=2)
+async def recovery_loop() -> None:
+    """Background task: sweep at startup, then once per ENGINE_RECOVERY_INTERVAL until cancelled."""
+    while True:
+        try:
+            async with async_connection() as db:
+                queued = await db.run(recover_stranded)
+            if queued:
+                log.warning("resumed %d stranded executions", queued)
+        except Exception:
+            log.exception("engine recovery sweep failed")
+        if ENGINE_RECOVERY_INTERVAL <= 0:
+            return
+        await asyncio.sleep(ENGINE_RECOVERY_INTERVAL)
+
+
+def runnable_executions(limit: int, conn) -> list[bytes]:
+    """
+    Up to `limit` unfinished executions, oldest first, that an advance would
+    move: a step is ready to claim, or no step is left to run and only
+    completing or failing it remains. Engine workers poll this.
+    """
+    rows = conn.execute(f"""
+        SELECT we.id FROM workflow_executions we
+        WHERE we.status IN ('running','awaiting_input') AND (
+            EXISTS (
+                SELECT 1 FROM workflow_step_executions wse
+                WHERE wse.execution_id=we.id AND {_READY}
+            )
+            OR NOT EXISTS (
+                SELECT 1 FROM workflow_step_executions wse
+                WHERE wse.execution_id=we.id AND wse.status NOT IN ('completed','skipped')
+            )
+            OR (
+                EXISTS (
+                    SELECT 1 FROM workflow_step_executions wse
+                    WHERE wse.execution_id=we.id AND wse.status='failed'
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM workflow_step_executions wse
+                    WHERE wse.execution_id=we.id AND wse.status='running'
+                )
+            )
+        )
+        ORDER BY we.created_at, we.id LIMIT ?
+    """, (*_expiry(), limit)).fetchall()
+    return [row["id"] for row in rows]
@@ -0,0 +1,64 @@
+"""
+Row ids: time-ordered UUIDv7s (RFC 9562).
+
+A UUID4 lands at a random spot in the primary-key index, so every insert
+dirties a random leaf page and splits pages all over the tree. A UUIDv7 leads
+with the millisecond timestamp, so new rows append at the right edge of the
+index the way an INTEGER key would. Existing UUID4 ids stay valid alongside them.
+
+Most tables keep ids as 8-4-4-4-12 strings (new_id()). The execution tables,
+which grow with every onboarding, store them as 16-byte keys (new_key(); BLOB
+on SQLite, BYTEA on PostgreSQL, see migration 16): the engine passes keys
+around as they are, and the API turns them into the same string form at its
+boundary (to_id() / to_key()).
+"""
+
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def _uuid7() -> uuid.UUID:
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # Random start with headroom, so ids stay unguessable but can count up.
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            # Same millisecond (or the clock stepped back): count up in rand_a,
+            # borrowing the next millisecond if the 12-bit counter runs out.
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | rand_b
+    return uuid.UUID(int=value)
+
+
+def new_id() -> str:
+    """A new UUIDv7 string; ids from one process sort in creation order."""
+    return str(_uuid7())
+
+
+def new_key() -> bytes:
+    """A new UUIDv7 as a 16-byte key for the execution tables; sorts like new_id()."""
+    return _uuid7().bytes
+
+
+def to_key(public_id: str) -> bytes:
+    """The stored key of an id in string form; ValueError if it isn't a UUID."""
+    return uuid.UUID(public_id).bytes
+
+
+def to_id(key: bytes) -> str:
+    """The string form the API shows for a stored key."""
+    return str(uuid.UUID(bytes=bytes(key)))
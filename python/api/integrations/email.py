@@ -1,7 +1,9 @@
 """
 Email integration — sends onboarding documentation links to newly provisioned users.
 
-Uses Python stdlib smtplib (no extra dependencies).
+Sends with aiosmtplib when it is installed (pip install aiosmtplib), so the
+workflow engine waits on SMTP without a thread. Otherwise falls back to stdlib
+smtplib on a worker thread — no extra dependencies needed.
 
 Credentials (python/.env):
     SMTP_HOST=smtp.example.com
@@ -11,6 +13,7 @@ Credentials (python/.env):
     EMAIL_FROM=HyOpps <noreply@example.com>   # optional, defaults to SMTP_USER
 """
 
+import asyncio
 import os
 import smtplib
 from email.mime.multipart import MIMEMultipart
@@ -22,6 +25,11 @@ try:
 except ImportError:
     pass
 
+try:
+    import aiosmtplib
+except ImportError:  # optional; smtplib on a worker thread instead
+    aiosmtplib = None
+
 
 def _smtp_config() -> dict:
     return {
@@ -43,7 +51,15 @@ def _check_smtp_config() -> None:
         raise RuntimeError("SMTP_PASSWORD is not configured")
 
 
-def send_documentation_email(
+def _send_smtplib(cfg: dict, to_email: str, msg: MIMEMultipart) -> None:
+    with smtplib.SMTP(cfg["host"], cfg["port"]) as server:
+        server.ehlo()
+        server.starttls()
+        server.login(cfg["user"], cfg["password"])
+        server.sendmail(cfg["from_addr"], [to_email], msg.as_string())
+
+
+async def send_documentation_email(
     to_email: str,
     firstname: str,
     org_name: str,
@@ -109,10 +125,18 @@ def send_documentation_email(
     msg.attach(MIMEText(plain, "plain"))
     msg.attach(MIMEText(html, "html"))
 
-    with smtplib.SMTP(cfg["host"], cfg["port"]) as server:
-        server.ehlo()
-        server.starttls()
-        server.login(cfg["user"], cfg["password"])
-        server.sendmail(cfg["from_addr"], [to_email], msg.as_string())
+    if aiosmtplib is not None:
+        await aiosmtplib.send(
+            msg,
+            sender=cfg["from_addr"],
+            recipients=[to_email],
+            hostname=cfg["host"],
+            port=cfg["port"],
+            username=cfg["user"],
+            password=cfg["password"],
+            start_tls=True,
+        )
+    else:
+        await asyncio.to_thread(_send_smtplib, cfg, to_email, msg)
 
     return {"sent": True, "links_sent": len(links)}
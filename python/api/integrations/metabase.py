@@ -3,15 +3,21 @@ Metabase integration — user provisioning and permission group membership manag
 
 Authentication: API key sent as `x-api-key` header (requires Metabase v0.46+).
 
+Calls are async (httpx.AsyncClient), so the workflow engine and the API can
+wait on Metabase without holding a thread. Every public function takes an
+optional `client` to reuse one connection for several calls; without it a
+client is opened for that call alone.
+
 Credentials (python/.env):
     METABASE_URL=https://your-instance.metabase.com
     METABASE_API_KEY=mb_your_api_key_here
 """
 
 import os
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
-import requests
+import httpx
 
 try:
     from dotenv import load_dotenv
@@ -36,6 +42,16 @@ def _headers() -> dict:
     }
 
 
+@asynccontextmanager
+async def _session(client: Optional[httpx.AsyncClient]) -> AsyncIterator[httpx.AsyncClient]:
+    """Use the caller's client, or open one for a single call."""
+    if client is not None:
+        yield client
+        return
+    async with httpx.AsyncClient(headers=_headers(), timeout=_TIMEOUT) as own:
+        yield own
+
+
 def _check_config() -> None:
     if not _base():
         raise RuntimeError("METABASE_URL is not configured")
@@ -45,14 +61,13 @@ def _check_config() -> None:
 
 # ── User lookup ─────────────────────────────────────────────────────────────
 
-def get_user_by_email(email: str) -> Optional[dict]:
+async def get_user_by_email(email: str, client: Optional[httpx.AsyncClient] = None) -> Optional[dict]:
     """Return the Metabase user dict for the given email, or None if not found."""
-    resp = requests.get(
-        f"{_base()}/api/user",
-        params={"query": email},
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
+    async with _session(client) as http:
+        resp = await http.get(
+            f"{_base()}/api/user",
+            params={"query": email},
+        )
     resp.raise_for_status()
     data = resp.json()
     # Metabase v0.41+ wraps results: {"data": [...], "total": ...}
@@ -64,28 +79,24 @@ def get_user_by_email(email: str) -> Optional[dict]:
     return None
 
 
-def create_user(email: str, firstname: str, lastname: str) -> dict:
+async def create_user(email: str, firstname: str, lastname: str, client: Optional[httpx.AsyncClient] = None) -> dict:
     """Create a new Metabase user and return the created user dict."""
-    resp = requests.post(
-        f"{_base()}/api/user",
-        json={"email": email, "first_name": firstname, "last_name": lastname},
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
+    async with _session(client) as http:
+        resp = await http.post(
+            f"{_base()}/api/user",
+            json={"email": email, "first_name": firstname, "last_name": lastname},
+        )
     resp.raise_for_status()
     return resp.json()
 
 
 # ── Group listing ────────────────────────────────────────────────────────────
 
-def list_groups() -> list:
+async def list_groups(client: Optional[httpx.AsyncClient] = None) -> list:
     """Return all Metabase permission groups, excluding built-in system groups."""
     _check_config()
-    resp = requests.get(
-        f"{_base()}/api/permissions/group",
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
+    async with _session(client) as http:
+        resp = await http.get(f"{_base()}/api/permissions/group")
     resp.raise_for_status()
     groups = resp.json()
     return [
@@ -97,14 +108,13 @@ def list_groups() -> list:
 
 # ── Membership management ────────────────────────────────────────────────────
 
-def add_to_group(user_id: int, group_id: int) -> None:
+async def add_to_group(user_id: int, group_id: int, client: Optional[httpx.AsyncClient] = None) -> None:
     """Add a Metabase user to a permission group."""
-    resp = requests.post(
-        f"{_base()}/api/permissions/membership",
-        json={"group_id": group_id, "user_id": user_id},
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
+    async with _session(client) as http:
+        resp = await http.post(
+            f"{_base()}/api/permissions/membership",
+            json={"group_id": group_id, "user_id": user_id},
+        )
     if resp.status_code in (200, 201):
         return
     if resp.status_code == 400:
@@ -119,16 +129,13 @@ def add_to_group(user_id: int, group_id: int) -> None:
     resp.raise_for_status()
 
 
-def _find_membership_id(mb_user_id: int, group_id: int) -> Optional[int]:
+async def _find_membership_id(mb_user_id: int, group_id: int, client: Optional[httpx.AsyncClient] = None) -> Optional[int]:
     """
     Lookup the membership_id for a user in a specific group.
     GET /api/permissions/membership returns {user_id_str: [{membership_id, group_id, user_id, ...}]}.
     """
-    resp = requests.get(
-        f"{_base()}/api/permissions/membership",
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
+    async with _session(client) as http:
+        resp = await http.get(f"{_base()}/api/permissions/membership")
     resp.raise_for_status()
     data = resp.json()
     # Keyed by user_id string; each entry has group_id and membership_id
@@ -139,48 +146,38 @@ def _find_membership_id(mb_user_id: int, group_id: int) -> Optional[int]:
     return None
 
 
-def remove_from_group(mb_user_id: int, group_id: int) -> bool:
+async def remove_from_group(mb_user_id: int, group_id: int, client: Optional[httpx.AsyncClient] = None) -> bool:
     """
     Remove a Metabase user from a permission group.
     Returns True if removed, False if the membership didn't exist.
     """
-    membership_id = _find_membership_id(mb_user_id, group_id)
-    if membership_id is None:
-        return False
-    resp = requests.delete(
-        f"{_base()}/api/permissions/membership/{membership_id}",
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
+    async with _session(client) as http:
+        membership_id = await _find_membership_id(mb_user_id, group_id, http)
+        if membership_id is None:
+            return False
+        resp = await http.delete(f"{_base()}/api/permissions/membership/{membership_id}")
     resp.raise_for_status()
     return True
 
 
-def get_user_group_memberships(mb_user_id: int) -> list:
+async def get_user_group_memberships(mb_user_id: int, client: Optional[httpx.AsyncClient] = None) -> list:
     """
     Return all non-system permission group memberships for a Metabase user.
     Each entry: {group_id, group_name, membership_id}
     Uses GET /api/user/:id which directly includes group_memberships for the user,
     then cross-references GET /permissions/group for group names and existence checks.
     """
-    # Fetch the user directly — response includes user_group_memberships: [{id: group_id, is_group_manager: bool}, ...]
-    user_resp = requests.get(
-        f"{_base()}/api/user/{mb_user_id}",
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
-    user_resp.raise_for_status()
-    # Metabase returns "user_group_memberships" where each entry's "id" is the group_id
-    raw_memberships = user_resp.json().get("user_group_memberships", [])
-    if not raw_memberships:
-        return []
-
-    # Build group name + existence lookup
-    groups_resp = requests.get(
-        f"{_base()}/api/permissions/group",
-        headers=_headers(),
-        timeout=_TIMEOUT,
-    )
+    async with _session(client) as http:
+        # Fetch the user directly — response includes user_group_memberships: [{id: group_id, is_group_manager: bool}, ...]
+        user_resp = await http.get(f"{_base()}/api/user/{mb_user_id}")
+        user_resp.raise_for_status()
+        # Metabase returns "user_group_memberships" where each entry's "id" is the group_id
+        raw_memberships = user_resp.json().get("user_group_memberships", [])
+        if not raw_memberships:
+            return []
+
+        # Build group name + existence lookup
+        groups_resp = await http.get(f"{_base()}/api/permissions/group")
     groups_resp.raise_for_status()
     group_names = {g["id"]: g["name"] for g in groups_resp.json()}
 
@@ -204,7 +201,13 @@ def get_user_group_memberships(mb_user_id: int) -> list:
 
 # ── High-level provisioning ──────────────────────────────────────────────────
 
-def provision_user(email: str, firstname: str, lastname: str, group_id: int) -> dict:
+async def provision_user(
+    email: str,
+    firstname: str,
+    lastname: str,
+    group_id: int,
+    client: Optional[httpx.AsyncClient] = None,
+) -> dict:
     """
     Ensure the user exists in Metabase and is a member of the given permission group.
 
@@ -217,19 +220,21 @@ def provision_user(email: str, firstname: str, lastname: str, group_id: int) ->
     _check_config()
     normalized = email.strip().lower()
 
-    existing = get_user_by_email(normalized)
-    if existing:
-        add_to_group(existing["id"], group_id)
-        return {
-            "email": normalized,
-            "metabase_user_id": existing["id"],
-            "metabase_group_id": group_id,
-            "user_exists": True,
-            "created": False,
-        }
-
-    new_user = create_user(normalized, firstname, lastname)
-    add_to_group(new_user["id"], group_id)
+    # One client for the whole find-or-create, so its connection is reused.
+    async with _session(client) as http:
+        existing = await get_user_by_email(normalized, http)
+        if existing:
+            await add_to_group(existing["id"], group_id, http)
+            return {
+                "email": normalized,
+                "metabase_user_id": existing["id"],
+                "metabase_group_id": group_id,
+                "user_exists": True,
+                "created": False,
+            }
+
+        new_user = await create_user(normalized, firstname, lastname, http)
+        await add_to_group(new_user["id"], group_id, http)
     return {
         "email": normalized,
         "metabase_user_id": new_user["id"],
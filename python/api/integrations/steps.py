@@ -8,9 +8,9 @@ def _fake_id(prefix: str) -> str:
     return f"{prefix}-{suffix}"
 
 
-def execute_step(step_name: str, context: dict[str, Any]) -> dict[str, Any]:
+async def execute_step(step_name: str, context: dict[str, Any]) -> dict[str, Any]:
     """
-    Step dispatcher for all auto steps.
+    Step dispatcher for all auto steps, run as a coroutine on the engine loop.
     Real integrations are called where available; stubs are used where pending.
     Returns: {"success": bool, "output": dict, "error": str}
     """
@@ -55,7 +55,7 @@ def execute_step(step_name: str, context: dict[str, Any]) -> dict[str, Any]:
         return {"success": True, "output": {"added_companies": str(ids)}}
 
     elif step_name == "add_user_to_metabase_group":
-        from ..database import get_db
+        from ..database import async_connection
         from .metabase import provision_user
 
         email = str(context.get("email", "")).strip().lower()
@@ -69,14 +69,11 @@ def execute_step(step_name: str, context: dict[str, Any]) -> dict[str, Any]:
             return {"success": False, "error": "Missing organization_id in workflow context"}
 
         # Look up the org's Metabase permission group ID from system_groups
-        conn = get_db()
-        try:
-            row = conn.execute(
+        async with async_connection() as db:
+            row = await db.fetchone(
                 "SELECT external_id FROM system_groups WHERE organization_id=? AND tool='metabase'",
                 (org_id,)
-            ).fetchone()
-        finally:
-            conn.close()
+            )
 
         if not row or not row["external_id"]:
             return {"success": False, "error": "No Metabase group configured for this organization. Set it via the org detail page."}
@@ -87,7 +84,7 @@ def execute_step(step_name: str, context: dict[str, Any]) -> dict[str, Any]:
             return {"success": False, "error": f"Invalid Metabase group ID '{row['external_id']}' — must be an integer"}
 
         try:
-            result = provision_user(email, firstname, lastname, group_id)
+            result = await provision_user(email, firstname, lastname, group_id)
             return {"success": True, "output": {
                 "metabase_user_id": str(result["metabase_user_id"]),
                 "metabase_group_id": str(result["metabase_group_id"]),
@@ -120,7 +117,7 @@ def execute_step(step_name: str, context: dict[str, Any]) -> dict[str, Any]:
         }}
 
     elif step_name == "share_documentation":
-        from ..database import get_db
+        from ..database import async_connection
         from .email import send_documentation_email
 
         email = str(context.get("email", "")).strip()
@@ -132,21 +129,18 @@ def execute_step(step_name: str, context: dict[str, Any]) -> dict[str, Any]:
         if not org_id:
             return {"success": False, "error": "Missing organization_id in workflow context"}
 
-        conn = get_db()
-        try:
-            org = conn.execute("SELECT name FROM organizations WHERE id=?", (org_id,)).fetchone()
-            docs_row = conn.execute(
+        async with async_connection() as db:
+            org = await db.fetchone("SELECT name FROM organizations WHERE id=?", (org_id,))
+            docs_row = await db.fetchone(
                 "SELECT internal_docu, generique_docu, add_docu FROM organization_documentation WHERE organization_id=?",
                 (org_id,)
-            ).fetchone()
-        finally:
-            conn.close()
+            )
 
         org_name = org["name"] if org else ""
         docs = dict(docs_row) if docs_row else {}
 
         try:
-            result = send_documentation_email(email, firstname, org_name, docs)
+            result = await send_documentation_email(email, firstname, org_name, docs)
             return {"success": True, "output": {
                 "sent_to": email,
                 "channels": "email",
@@ -15,11 +15,13 @@ Required env vars (set in python/.env):
     AZURE_CLIENT_ID      - Application (client) ID
     AZURE_CLIENT_SECRET  - Client secret value
     TEAMS_TEAM_ID        - Microsoft 365 Group / Team ID
+
+All calls are async and share one httpx.AsyncClient per add_user_to_teams().
 """
 
 import os
 
-import requests
+import httpx
 
 try:
     from dotenv import load_dotenv
@@ -30,7 +32,7 @@ except ImportError:
 
 # ── Auth ────────────────────────────────────────────────────────────────────
 
-def _get_access_token() -> str:
+async def _get_access_token(http: httpx.AsyncClient) -> str:
     tenant_id = os.environ.get("AZURE_TENANT_ID", "")
     client_id = os.environ.get("AZURE_CLIENT_ID", "")
     client_secret = os.environ.get("AZURE_CLIENT_SECRET", "")
@@ -42,19 +44,19 @@ def _get_access_token() -> str:
         )
 
     url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-    resp = requests.post(url, data={
+    resp = await http.post(url, data={
         "grant_type": "client_credentials",
         "client_id": client_id,
         "client_secret": client_secret,
         "scope": "https://graph.microsoft.com/.default",
-    }, timeout=15)
+    })
     resp.raise_for_status()
     return resp.json()["access_token"]
 
 
 # ── User invite / resolve ─────────────────────────────────────────────────────
 
-def _get_or_invite_user(email: str, display_name: str, token: str) -> tuple:
+async def _get_or_invite_user(email: str, display_name: str, token: str, http: httpx.AsyncClient) -> tuple:
     """
     Call the Graph invitations endpoint.
     - New user  → creates a B2B guest, returns their new object ID.
@@ -62,7 +64,7 @@ def _get_or_invite_user(email: str, display_name: str, token: str) -> tuple:
     Returns (user_object_id: str, newly_invited: bool).
     Requires: User.Invite.All
     """
-    resp = requests.post(
+    resp = await http.post(
         "https://graph.microsoft.com/v1.0/invitations",
         json={
             "invitedUserEmailAddress": email,
@@ -76,7 +78,6 @@ def _get_or_invite_user(email: str, display_name: str, token: str) -> tuple:
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json",
         },
-        timeout=15,
     )
     resp.raise_for_status()
     data = resp.json()
@@ -88,13 +89,13 @@ def _get_or_invite_user(email: str, display_name: str, token: str) -> tuple:
 
 # ── Team membership ──────────────────────────────────────────────────────────
 
-def _add_to_team(team_id: str, user_object_id: str, token: str) -> None:
+async def _add_to_team(team_id: str, user_object_id: str, token: str, http: httpx.AsyncClient) -> None:
     """
     Add the user to the Teams team as a regular member.
     409 means already a member — treated as success.
     Requires: TeamMember.ReadWrite.All
     """
-    resp = requests.post(
+    resp = await http.post(
         f"https://graph.microsoft.com/v1.0/teams/{team_id}/members",
         json={
             "@odata.type": "#microsoft.graph.aadUserConversationMember",
@@ -105,7 +106,6 @@ def _add_to_team(team_id: str, user_object_id: str, token: str) -> None:
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json",
         },
-        timeout=15,
     )
     if resp.status_code == 409:
         return  # already a member — idempotent
@@ -114,7 +114,7 @@ def _add_to_team(team_id: str, user_object_id: str, token: str) -> None:
 
 # ── Public interface ─────────────────────────────────────────────────────────
 
-def add_user_to_teams(email: str, display_name: str) -> dict:
+async def add_user_to_teams(email: str, display_name: str) -> dict:
     """
     Invite the partner user to Azure AD (if not already there) and
     add them to the configured TEAMS_TEAM_ID.
@@ -129,9 +129,10 @@ def add_user_to_teams(email: str, display_name: str) -> dict:
             "Find it in Teams Admin Center → Teams → select team → Team ID."
         )
 
-    token = _get_access_token()
-    user_object_id, newly_invited = _get_or_invite_user(email, display_name, token)
-    _add_to_team(team_id, user_object_id, token)
+    async with httpx.AsyncClient(timeout=15) as http:
+        token = await _get_access_token(http)
+        user_object_id, newly_invited = await _get_or_invite_user(email, display_name, token, http)
+        await _add_to_team(team_id, user_object_id, token, http)
 
     return {
         "teams_user_object_id": user_object_id,
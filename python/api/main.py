@@ -1,16 +1,33 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from .database import create_schema, seed_data
-from .routes import auth, executions, organizations, users, partner, metabase_routes
+from .database import create_schema, seed_data, get_db, get_backend, close_pool
+from .archive import ARCHIVE_AFTER_DAYS, archive_loop
+from .backup import BACKUP_INTERVAL, backup_loop
+from .maintenance import MAINTENANCE_INTERVAL, maintenance_loop
+from .engine.workflow import ENGINE_EXTERNAL, recovery_loop
+from .routes import auth, executions, organizations, users, partner, metabase_routes, admin, search
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_schema()
     seed_data()
+    background = []
+    if not ENGINE_EXTERNAL:
+        background.append(asyncio.create_task(recovery_loop()))
+    if ARCHIVE_AFTER_DAYS > 0:
+        background.append(asyncio.create_task(archive_loop()))
+    if MAINTENANCE_INTERVAL > 0:
+        background.append(asyncio.create_task(maintenance_loop()))
+    if BACKUP_INTERVAL > 0 and get_backend().name == "sqlite":
+        background.append(asyncio.create_task(backup_loop()))
     yield
+    for task in background:
+        task.cancel()
+    close_pool()
 
 
 app = FastAPI(
@@ -33,17 +50,16 @@ app.include_router(organizations.router, prefix="/api/organizations", tags=["org
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(partner.router, prefix="/api/partner", tags=["partner"])
 app.include_router(metabase_routes.router, prefix="/api/metabase", tags=["metabase"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
 
 
 @app.get("/api/workflow-definitions")
-def list_workflow_definitions():
-    from .database import get_db
-    conn = get_db()
-    rows = conn.execute("SELECT * FROM workflow_definitions").fetchall()
-    conn.close()
+async def list_workflow_definitions(conn=Depends(get_db, scope="function")):
+    rows = await conn.fetchall("SELECT * FROM workflow_definitions")
     return [dict(r) for r in rows]
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
@@ -0,0 +1,188 @@
+"""
+Housekeeping for the SQLite database, run from the API process.
+
+  analyze     ANALYZE (sampled via analysis_limit) so the planner has statistics
+  checkpoint  wal_checkpoint(TRUNCATE), so the -wal file doesn't grow without bound
+  vacuum      incremental_vacuum in small steps, returning free pages to the OS
+
+maintenance_loop() wakes every MAINTENANCE_INTERVAL seconds and runs each
+task whose interval has elapsed or whose threshold (WAL size, free pages) is
+crossed, in each database file (main, and the execution file when split).
+Results and timings are kept in memory for GET /api/admin/maintenance.
+PostgreSQL's autovacuum covers the same ground, so there the loop is idle.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .database import connection, get_backend
+
+# Seconds between threshold checks; 0 disables the background loop.
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "60"))
+ANALYZE_INTERVAL = float(os.getenv("ANALYZE_INTERVAL", str(6 * 3600)))
+# Rows sampled per index by ANALYZE; 0 means exact (slow on big tables).
+ANALYZE_LIMIT = int(os.getenv("ANALYZE_LIMIT", "1000"))
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "3600"))
+# Checkpoint early once the -wal file passes this size.
+WAL_CHECKPOINT_BYTES = int(os.getenv("WAL_CHECKPOINT_BYTES", str(64 * 1024 * 1024)))
+VACUUM_INTERVAL = float(os.getenv("VACUUM_INTERVAL", str(24 * 3600)))
+# Vacuum early once this many pages sit on the freelist.
+VACUUM_FREE_PAGES = int(os.getenv("VACUUM_FREE_PAGES", "2048"))
+# Pages released per incremental_vacuum step; each step briefly holds the write lock.
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "256"))
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_status: dict[str, dict[str, Any]] = {}
+_started = time.monotonic()
+
+
+def _schemas() -> list[str]:
+    return get_backend().schemas()
+
+
+def _wal_bytes(schema: str) -> int:
+    try:
+        return os.path.getsize(get_backend().schema_path(schema) + "-wal")
+    except OSError:
+        return 0
+
+
+def _free_pages(conn, schema: str) -> int:
+    return conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+
+
+def _analyze(conn) -> dict:
+    conn.execute(f"PRAGMA analysis_limit={ANALYZE_LIMIT}")
+    conn.execute("ANALYZE")  # every attached database
+    return {}
+
+
+def _checkpoint(conn) -> dict:
+    result = {}
+    for schema in _schemas():
+        busy, wal_pages, checkpointed = conn.execute(f"PRAGMA {schema}.wal_checkpoint(TRUNCATE)").fetchone()
+        result[schema] = {"busy": bool(busy), "wal_pages": wal_pages, "checkpointed_pages": checkpointed}
+    return result
+
+
+def _vacuum_schema(conn, schema: str) -> dict:
+    if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != 2:
+        return {"skipped": "auto_vacuum is not INCREMENTAL; see README"}
+    freed = 0
+    while True:
+        free = _free_pages(conn, schema)
+        if not free:
+            return {"freed_pages": freed}
+        step = min(free, VACUUM_STEP_PAGES)
+        # The pragma frees one page per step of the statement and returns no
+        # rows, so execute() would stop after the first page; executescript()
+        # runs it to completion (and is only safe outside a transaction).
+        conn.commit()
+        conn.executescript(f"PRAGMA {schema}.incremental_vacuum({step})")
+        freed += step
+        time.sleep(0.01)  # let queued writers in between steps
+
+
+def _vacuum(conn) -> dict:
+    return {schema: _vacuum_schema(conn, schema) for schema in _schemas()}
+
+
+TASKS: dict[str, Callable[[Any], dict]] = {
+    "analyze": _analyze,
+    "checkpoint": _checkpoint,
+    "vacuum": _vacuum,
+}
+
+
+def _due(task: str, now: float, conn) -> bool:
+    last = _status.get(task, {}).get("finished_monotonic")
+    since = now - (_started if last is None else last)
+    if task == "analyze":
+        if last is None:
+            # First pass: only if the database was never analyzed.
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone() is None
+        return since >= ANALYZE_INTERVAL
+    if task == "checkpoint":
+        return since >= CHECKPOINT_INTERVAL or any(_wal_bytes(db) >= WAL_CHECKPOINT_BYTES for db in _schemas())
+    if task == "vacuum":
+        free = [_free_pages(conn, db) for db in _schemas()]
+        return any(f >= VACUUM_FREE_PAGES for f in free) or (any(free) and since >= VACUUM_INTERVAL)
+    return False
+
+
+def _run(task: str, conn) -> dict:
+    started = time.monotonic()
+    entry = _status.setdefault(task, {"runs": 0})
+    try:
+        result = TASKS[task](conn)
+        conn.commit()
+        entry.update(result=result, error=None)
+    except Exception as e:
+        conn.rollback()
+        entry.update(result=None, error=str(e))
+        log.exception("maintenance task %s failed", task)
+    duration = time.monotonic() - started
+    entry.update(
+        runs=entry["runs"] + 1,
+        last_run=datetime.utcnow().isoformat(),
+        duration_ms=round(duration * 1000, 1),
+        finished_monotonic=time.monotonic(),
+    )
+    log.info("maintenance %s took %.1f ms: %s", task, duration * 1000, entry["result"] or entry["error"])
+    return entry
+
+
+def run_maintenance(tasks: Optional[list[str]] = None) -> list[str]:
+    """Run `tasks` now, or whichever tasks are due if None. Returns the tasks that ran."""
+    if get_backend().name != "sqlite":
+        return []
+    with _lock, connection() as conn:
+        now = time.monotonic()
+        todo = tasks if tasks is not None else [t for t in TASKS if _due(t, now, conn)]
+        for task in todo:
+            _run(task, conn)
+        return todo
+
+
+def maintenance_status() -> dict:
+    backend = get_backend()
+    if backend.name != "sqlite":
+        return {"backend": backend.name, "enabled": False, "tasks": {}}
+    with connection() as conn:
+        databases = {
+            schema: {
+                "path": backend.schema_path(schema),
+                "page_count": conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0],
+                "freelist_pages": _free_pages(conn, schema),
+                "page_size": conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0],
+                "auto_vacuum": ("none", "full", "incremental")[
+                    conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0]
+                ],
+                "wal_bytes": _wal_bytes(schema),
+            }
+            for schema in backend.schemas()
+        }
+    tasks = {
+        name: {k: v for k, v in _status.get(name, {"runs": 0}).items() if k != "finished_monotonic"}
+        for name in TASKS
+    }
+    return {"backend": backend.name, "enabled": MAINTENANCE_INTERVAL > 0, "databases": databases, "tasks": tasks}
+
+
+async def maintenance_loop() -> None:
+    """Background task: run due maintenance every MAINTENANCE_INTERVAL until cancelled."""
+    while True:
+        try:
+            await run_in_threadpool(run_maintenance)
+        except Exception:
+            log.exception("maintenance pass failed")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
@@ -0,0 +1,1349 @@
+"""
+Versioned schema migrations, tracked in PRAGMA user_version.
+
+Each migration brings the schema from version N-1 to N and is registered with
+@migration(N). run_migrations() reads user_version once, so a current database
+costs a single pragma read at startup — no sqlite_master or table_info scans.
+
+Pending migrations run under migration_lock(), a file lock beside the
+database, so of several workers starting together one migrates and the others
+wait and then find the schema current. Each migration also runs under BEGIN
+IMMEDIATE and re-checks the version once it holds the write lock. Migrations
+that rebuild a table use rebuild_table(), which copies rows in bounded
+batches (one short write transaction each) while triggers mirror concurrent
+writes, so a large table never holds the write lock for long; the migration
+lock only keeps a second worker from starting the same rebuild.
+
+The PostgreSQL backend keeps its own migrations with the same version numbers
+in storage/postgres_migrations.py; a schema change needs an entry in both.
+
+EXECUTION_TABLES may live in an attached `exec` database (see storage/sqlite.py).
+Unqualified table names resolve to either file, but a new index or trigger on
+one of them must name its schema: use schema_of(conn, table).
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process migration lock
+    fcntl = None
+
+MIGRATION_BATCH_ROWS = int(os.getenv("MIGRATION_BATCH_ROWS", "1000"))
+# Pause between rebuild batches so other writers can take the lock.
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", "0.01"))
+# The engine's lease length (engine/workflow.py); migration 14 grants running steps one.
+ENGINE_LEASE_SECONDS = float(os.getenv("ENGINE_LEASE_SECONDS", "60"))
+
+_MIGRATIONS: list[tuple[int, bool, Callable]] = []
+
+
+def migration(version: int, transactional: bool = True):
+    """
+    Register a migration. Transactional migrations run inside the runner's
+    BEGIN IMMEDIATE; non-transactional ones (online rebuilds) manage their own
+    short transactions and must be safe to re-run after an interruption.
+    """
+    def register(fn: Callable) -> Callable:
+        _MIGRATIONS.append((version, transactional, fn))
+        _MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version() -> int:
+    return _MIGRATIONS[-1][0] if _MIGRATIONS else 0
+
+
+@contextmanager
+def migration_lock(conn) -> Iterator[None]:
+    """
+    Exclusive across processes while held: flock on a file beside the main
+    database. The OS drops it if the holder dies, so an interrupted migration
+    never blocks the next start. Not taken for in-memory databases.
+    """
+    path = next((r[2] for r in conn.execute("PRAGMA database_list").fetchall() if r[1] == "main"), "")
+    if not path or fcntl is None:
+        yield
+        return
+    with open(path + ".migrate-lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def run_migrations(conn) -> None:
+    """Apply every migration newer than the database's user_version."""
+    if schema_version(conn) >= latest_version():
+        return
+    if conn.in_transaction:
+        conn.commit()
+    # Non-transactional migrations run outside the version check below, so
+    # only the lock keeps two workers from both starting the same rebuild.
+    with migration_lock(conn):
+        for version, transactional, fn in _MIGRATIONS:
+            if schema_version(conn) >= version:
+                continue
+            if not transactional:
+                fn(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have applied it while we waited for the lock.
+                if schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                if transactional:
+                    fn(conn)
+                conn.execute(f"PRAGMA user_version={version}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+
+# ── helpers ────────────────────────────────────────────────────────────────
+
+def execute_script(conn, script: str) -> None:
+    """
+    Run a multi-statement script inside the current transaction.
+    Unlike executescript(), this never issues an implicit COMMIT.
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            if statement.strip().strip(";").strip():
+                conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+
+# Tables that grow with every execution; moved together so their triggers and
+# foreign keys among themselves keep working.
+EXECUTION_TABLES = (
+    "workflow_executions",
+    "workflow_step_executions",
+    "execution_counts",
+    "step_values",
+    "workflow_executions_archive",
+    "workflow_step_executions_archive",
+    "error_documents",
+    "error_index",
+    "execution_contexts",
+)
+
+_CREATE_TABLE = re.compile(r'^CREATE\s+(VIRTUAL\s+)?TABLE\s+"?\w+"?', re.IGNORECASE)
+_REFERENCES = re.compile(
+    r"\s+REFERENCES\s+\"?(\w+)\"?\s*\([^)]*\)"
+    r"(?:\s+ON\s+(?:DELETE|UPDATE)\s+(?:SET\s+NULL|SET\s+DEFAULT|CASCADE|RESTRICT|NO\s+ACTION))*",
+    re.IGNORECASE,
+)
+_CREATE_NAMED = re.compile(r"^(CREATE\s+(?:UNIQUE\s+)?(?:INDEX|TRIGGER)\s+(?:IF\s+NOT\s+EXISTS\s+)?)", re.IGNORECASE)
+
+
+def schema_of(conn, table: str) -> str:
+    """'exec' if `table` lives in the attached execution database, else 'main'."""
+    attached = {r[1] for r in conn.execute("PRAGMA database_list").fetchall()}
+    if "exec" in attached and conn.execute(
+        "SELECT 1 FROM exec.sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone():
+        return "exec"
+    return "main"
+
+
+def _local_references(create_sql: str) -> str:
+    """`create_sql` without its foreign keys to tables outside EXECUTION_TABLES."""
+    return _REFERENCES.sub(lambda m: m.group(0) if m.group(1) in EXECUTION_TABLES else "", create_sql)
+
+
+def _execution_tables_in_main(conn) -> set[str]:
+    return {
+        r[0] for r in conn.execute(
+            f"SELECT name FROM main.sqlite_master WHERE type='table' AND name IN ({','.join('?' * len(EXECUTION_TABLES))})",
+            EXECUTION_TABLES
+        ).fetchall()
+    }
+
+
+def split_execution_tables(conn, attached: bool) -> None:
+    """
+    Move EXECUTION_TABLES from the main database into the attached `exec` one,
+    with their rows, indexes and triggers. Foreign keys into main tables are
+    dropped (SQLite can't enforce them across files); the app already clears
+    those references itself before deleting users or organizations.
+    Does nothing once the tables have moved.
+    """
+    in_main = _execution_tables_in_main(conn)
+    if not attached:
+        if len(in_main) < len(EXECUTION_TABLES):
+            raise RuntimeError(
+                "The execution tables live in a separate database file; set HYOPPS_EXEC_DB_PATH to it"
+            )
+        return
+    if not in_main:
+        return
+
+    if conn.in_transaction:
+        conn.commit()
+    # Foreign keys can only be toggled outside a transaction; with them on,
+    # dropping the old tables would cascade into the rows just copied.
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have moved them while we waited for the lock.
+            in_main = _execution_tables_in_main(conn)
+            if not in_main:
+                conn.rollback()
+                return
+            dependents = []
+            for table in EXECUTION_TABLES:
+                if table not in in_main:
+                    continue
+                create_sql = conn.execute(
+                    "SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (table,)
+                ).fetchone()[0]
+                create_sql = _local_references(create_sql)
+                conn.execute(_CREATE_TABLE.sub(rf"CREATE \1TABLE exec.{table}", create_sql.strip(), count=1))
+                if create_sql.lstrip().upper().startswith("CREATE VIRTUAL"):
+                    # External-content FTS5 index: rebuilt from its content
+                    # table, which EXECUTION_TABLES lists (and so copies) first.
+                    conn.execute(f"INSERT INTO exec.{table} ({table}) VALUES ('rebuild')")
+                else:
+                    conn.execute(f"INSERT INTO exec.{table} SELECT * FROM main.{table}")
+                dependents += [
+                    r[0] for r in conn.execute(
+                        "SELECT sql FROM main.sqlite_master WHERE tbl_name=? AND type IN ('index','trigger') "
+                        "AND sql IS NOT NULL",
+                        (table,)
+                    ).fetchall()
+                ]
+            # Children first, so no drop trips over a reference.
+            for table in reversed(EXECUTION_TABLES):
+                if table in in_main:
+                    conn.execute(f"DROP TABLE main.{table}")
+            # Recreated after the copy, so the counter triggers don't count rows twice.
+            for sql in dependents:
+                conn.execute(_CREATE_NAMED.sub(r"\1exec.", sql.strip(), count=1))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+
+
+def _columns(conn, table: str) -> list[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def rebuild_table(conn, table: str, create_sql: str, batch_rows: int = 0) -> None:
+    """
+    Recreate `table` from `create_sql` (with a `{name}` placeholder) without a
+    long write lock — the documented create/copy/drop/rename procedure, online:
+
+      1. create the new table plus triggers mirroring writes on the old one;
+      2. copy rows in rowid batches, one short transaction each;
+      3. swap in a single short transaction with foreign keys off, then
+         recreate the table's indexes and triggers.
+
+    Columns are matched by name, so added columns take their defaults. Every
+    step is idempotent, so an interrupted rebuild resumes on the next start.
+    """
+    batch_rows = batch_rows or MIGRATION_BATCH_ROWS
+    new = f"_rebuild_{table}"
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(create_sql.replace("{name}", f"IF NOT EXISTS {new}"))
+        cols = [c for c in _columns(conn, table) if c in set(_columns(conn, new))]
+        col_list = ", ".join(cols)
+        new_vals = ", ".join(f"NEW.{c}" for c in cols)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {new}_ins AFTER INSERT ON {table} BEGIN
+                INSERT OR REPLACE INTO {new} (rowid, {col_list}) VALUES (NEW.rowid, {new_vals});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {new}_upd AFTER UPDATE ON {table} BEGIN
+                DELETE FROM {new} WHERE rowid=OLD.rowid;
+                INSERT OR REPLACE INTO {new} (rowid, {col_list}) VALUES (NEW.rowid, {new_vals});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {new}_del AFTER DELETE ON {table} BEGIN
+                DELETE FROM {new} WHERE rowid=OLD.rowid;
+            END
+        """)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    # Rows already mirrored by the triggers are newer than the old table's
+    # snapshot, so the batch copy only fills gaps (INSERT OR IGNORE).
+    last = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            upper = conn.execute(
+                f"SELECT max(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                (last, batch_rows)
+            ).fetchone()[0]
+            if upper is None:
+                conn.rollback()
+                break
+            conn.execute(
+                f"INSERT OR IGNORE INTO {new} (rowid, {col_list}) "
+                f"SELECT rowid, {col_list} FROM {table} WHERE rowid > ? AND rowid <= ?",
+                (last, upper)
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        last = upper
+        time.sleep(MIGRATION_BATCH_PAUSE)
+
+    # Swap. Foreign keys must be off (and can only be toggled outside a
+    # transaction) or dropping the old table would cascade into child rows.
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            dependents = [
+                r[0] for r in conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE tbl_name=? AND type IN ('index','trigger') "
+                    "AND sql IS NOT NULL AND name NOT LIKE ?",
+                    (table, f"{new}%")
+                ).fetchall()
+            ]
+            for suffix in ("ins", "upd", "del"):
+                conn.execute(f"DROP TRIGGER IF EXISTS {new}_{suffix}")
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {new} RENAME TO {table}")
+            for sql in dependents:
+                conn.execute(sql)
+            violations = conn.execute(f"PRAGMA foreign_key_check({table})").fetchall()
+            if violations:
+                raise RuntimeError(f"Rebuild of {table} left {len(violations)} foreign key violations")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+
+
+# ── migrations ─────────────────────────────────────────────────────────────
+
+@migration(1)
+def _baseline(conn) -> None:
+    """Base tables. Older databases get the columns added since their creation."""
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    if "users" in existing and "metabase_user_id" not in _columns(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN metabase_user_id INTEGER")
+    execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS organizations (
+        id            TEXT PRIMARY KEY,
+        name          TEXT NOT NULL UNIQUE,
+        account_types TEXT NOT NULL DEFAULT '["partner"]',
+        created_at    TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS users (
+        id               TEXT PRIMARY KEY,
+        firstname        TEXT NOT NULL,
+        lastname         TEXT NOT NULL,
+        email            TEXT NOT NULL UNIQUE,
+        languages        TEXT NOT NULL DEFAULT '[]',
+        skills           TEXT NOT NULL DEFAULT '[]',
+        roles            TEXT NOT NULL DEFAULT '[]',
+        organization_id  TEXT REFERENCES organizations(id),
+        app_role         TEXT NOT NULL DEFAULT 'user' CHECK (app_role IN ('admin', 'user', 'partner_admin')),
+        password_hash    TEXT NOT NULL,
+        metabase_user_id INTEGER,
+        created_at       TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS studio_companies (
+        id              TEXT PRIMARY KEY,
+        organization_id TEXT NOT NULL REFERENCES organizations(id),
+        studio_id       TEXT NOT NULL UNIQUE,
+        name            TEXT NOT NULL,
+        environment     TEXT NOT NULL CHECK (environment IN ('test', 'prod')),
+        created_at      TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS user_studio_access (
+        id                TEXT PRIMARY KEY,
+        user_id           TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        studio_company_id TEXT NOT NULL REFERENCES studio_companies(id) ON DELETE CASCADE,
+        granted_at        TEXT DEFAULT (datetime('now')),
+        revoked_at        TEXT,
+        UNIQUE (user_id, studio_company_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS system_groups (
+        id              TEXT PRIMARY KEY,
+        organization_id TEXT NOT NULL REFERENCES organizations(id),
+        tool            TEXT NOT NULL,
+        external_name   TEXT NOT NULL,
+        external_id     TEXT,
+        created_at      TEXT DEFAULT (datetime('now')),
+        UNIQUE (organization_id, tool)
+    );
+
+    CREATE TABLE IF NOT EXISTS organization_integrations (
+        id                      TEXT PRIMARY KEY,
+        organization_id         TEXT NOT NULL UNIQUE REFERENCES organizations(id),
+        keycloak_confirmed      INTEGER DEFAULT 0,
+        keycloak_cluster        TEXT,
+        metabase_collection_id  TEXT,
+        lms_confirmed           INTEGER DEFAULT 0,
+        updated_at              TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS resources (
+        id          TEXT PRIMARY KEY,
+        name        TEXT NOT NULL UNIQUE,
+        type        TEXT,
+        has_api     INTEGER DEFAULT 1,
+        created_at  TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_definitions (
+        id          TEXT PRIMARY KEY,
+        name        TEXT NOT NULL UNIQUE,
+        description TEXT,
+        created_at  TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_step_definitions (
+        id                     TEXT PRIMARY KEY,
+        workflow_definition_id TEXT NOT NULL REFERENCES workflow_definitions(id),
+        step_order             INTEGER NOT NULL,
+        name                   TEXT NOT NULL,
+        label                  TEXT NOT NULL,
+        type                   TEXT NOT NULL CHECK (type IN ('auto', 'manual')),
+        description            TEXT,
+        UNIQUE (workflow_definition_id, step_order)
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_executions (
+        id                     TEXT PRIMARY KEY,
+        workflow_definition_id TEXT NOT NULL REFERENCES workflow_definitions(id),
+        organization_id        TEXT REFERENCES organizations(id),
+        user_id                TEXT REFERENCES users(id),
+        requested_by           TEXT REFERENCES users(id),
+        status                 TEXT NOT NULL DEFAULT 'pending'
+                               CHECK (status IN ('pending','running','awaiting_input','completed','failed')),
+        current_step_order     INTEGER DEFAULT 1,
+        created_at             TEXT DEFAULT (datetime('now')),
+        completed_at           TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_step_executions (
+        id                 TEXT PRIMARY KEY,
+        execution_id       TEXT NOT NULL REFERENCES workflow_executions(id),
+        step_definition_id TEXT NOT NULL REFERENCES workflow_step_definitions(id),
+        step_order         INTEGER NOT NULL,
+        status             TEXT NOT NULL DEFAULT 'pending'
+                           CHECK (status IN ('pending','running','awaiting_input','completed','failed','skipped')),
+        manual_input       TEXT,
+        output             TEXT,
+        error              TEXT,
+        completed_by       TEXT REFERENCES users(id),
+        started_at         TEXT,
+        completed_at       TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS access_grants (
+        id           TEXT PRIMARY KEY,
+        user_id      TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        resource_id  TEXT NOT NULL REFERENCES resources(id),
+        permission   TEXT NOT NULL DEFAULT 'read'
+                     CHECK (permission IN ('read','write','admin')),
+        granted_by   TEXT REFERENCES users(id),
+        granted_at   TEXT DEFAULT (datetime('now')),
+        revoked_at   TEXT,
+        execution_id TEXT REFERENCES workflow_executions(id),
+        UNIQUE (user_id, resource_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS user_studio_companies (
+        id         TEXT PRIMARY KEY,
+        user_id    TEXT NOT NULL UNIQUE REFERENCES users(id) ON DELETE CASCADE,
+        studio_id  TEXT NOT NULL UNIQUE,
+        name       TEXT NOT NULL,
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS organization_documentation (
+        id              TEXT PRIMARY KEY,
+        organization_id TEXT NOT NULL UNIQUE REFERENCES organizations(id),
+        internal_docu   TEXT,
+        generique_docu  TEXT,
+        add_docu        TEXT,
+        updated_at      TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+
+_USERS_V2 = """
+CREATE TABLE {name} (
+    id               TEXT PRIMARY KEY,
+    firstname        TEXT NOT NULL,
+    lastname         TEXT NOT NULL,
+    email            TEXT NOT NULL UNIQUE,
+    languages        TEXT NOT NULL DEFAULT '[]',
+    skills           TEXT NOT NULL DEFAULT '[]',
+    roles            TEXT NOT NULL DEFAULT '[]',
+    organization_id  TEXT REFERENCES organizations(id),
+    app_role         TEXT NOT NULL DEFAULT 'user' CHECK (app_role IN ('admin', 'user', 'partner_admin')),
+    password_hash    TEXT NOT NULL,
+    metabase_user_id INTEGER,
+    created_at       TEXT DEFAULT (datetime('now'))
+)
+"""
+
+
+@migration(2, transactional=False)
+def _users_partner_admin_role(conn) -> None:
+    """Allow app_role='partner_admin'. SQLite can't ALTER a CHECK, so rebuild users."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='users'").fetchone()
+    if row and "partner_admin" not in row[0]:
+        rebuild_table(conn, "users", _USERS_V2)
+
+
+@migration(3)
+def _hot_path_indexes(conn) -> None:
+    execute_script(conn, """
+    -- Engine: next pending step, completed-step context and step lists per execution.
+    CREATE INDEX IF NOT EXISTS idx_wse_execution_status_order
+        ON workflow_step_executions (execution_id, status, step_order);
+    CREATE INDEX IF NOT EXISTS idx_wse_completed_by
+        ON workflow_step_executions (completed_by) WHERE completed_by IS NOT NULL;
+
+    -- Execution lists: newest first, optionally narrowed by status or organization.
+    CREATE INDEX IF NOT EXISTS idx_we_created
+        ON workflow_executions (created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_we_status_created
+        ON workflow_executions (status, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_we_org_created
+        ON workflow_executions (organization_id, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_we_user
+        ON workflow_executions (user_id) WHERE user_id IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_we_requested_by
+        ON workflow_executions (requested_by) WHERE requested_by IS NOT NULL;
+
+    -- Directory lookups and the FK sweeps in delete_user / delete_organization.
+    CREATE INDEX IF NOT EXISTS idx_users_created
+        ON users (created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_users_org_created
+        ON users (organization_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_studio_companies_org
+        ON studio_companies (organization_id);
+    CREATE INDEX IF NOT EXISTS idx_user_studio_access_company
+        ON user_studio_access (studio_company_id);
+    CREATE INDEX IF NOT EXISTS idx_access_grants_granted_by
+        ON access_grants (granted_by) WHERE granted_by IS NOT NULL;
+    """)
+
+
+@migration(4)
+def _executions_by_workflow_index(conn) -> None:
+    """Keyset pages of executions filtered by workflow type."""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_we_workflow_created
+            ON workflow_executions (workflow_definition_id, created_at, id)
+    """)
+
+
+@migration(5)
+def _directory_indexes(conn) -> None:
+    """Keyset pages and case-insensitive prefix search for the user and organization directories."""
+    execute_script(conn, """
+    -- LIKE is case-insensitive, so only NOCASE indexes can serve `LIKE 'abc%'`.
+    CREATE INDEX IF NOT EXISTS idx_users_email_nocase
+        ON users (email COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_users_lastname_nocase
+        ON users (lastname COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_organizations_name_nocase
+        ON organizations (name COLLATE NOCASE, id);
+
+    -- Replaces (organization_id, created_at): the cursor needs id as tie-breaker.
+    DROP INDEX IF EXISTS idx_users_org_created;
+    CREATE INDEX IF NOT EXISTS idx_users_org_created_id
+        ON users (organization_id, created_at, id);
+    """)
+
+
+# Adds one to the counter rows an execution belongs to: global ('', ''), its
+# workflow, and — once it has one — its organization and organization × workflow.
+_COUNT_EXECUTION = """
+    INSERT INTO execution_counts (organization_id, workflow_definition_id, status, count)
+    SELECT o.id, w.id, NEW.status, 1
+    FROM (SELECT '' AS id UNION ALL SELECT NEW.organization_id WHERE NEW.organization_id IS NOT NULL) AS o,
+         (SELECT '' AS id UNION ALL SELECT NEW.workflow_definition_id) AS w
+    WHERE true
+    ON CONFLICT DO UPDATE SET count=count+1;
+"""
+
+_UNCOUNT_EXECUTION = """
+    UPDATE execution_counts SET count=count-1
+    WHERE status=OLD.status
+      AND organization_id IN ('', coalesce(OLD.organization_id, ''))
+      AND workflow_definition_id IN ('', OLD.workflow_definition_id);
+"""
+
+
+@migration(6)
+def _execution_counts(conn) -> None:
+    """
+    Per-status execution counters, kept in step with workflow_executions by
+    triggers so every status transition updates them in its own transaction.
+    '' in organization_id / workflow_definition_id means "all".
+    """
+    execute_script(conn, f"""
+    CREATE TABLE IF NOT EXISTS execution_counts (
+        organization_id TEXT NOT NULL DEFAULT '',
+        workflow_definition_id TEXT NOT NULL DEFAULT '',
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (organization_id, workflow_definition_id, status)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_we_count_insert
+    AFTER INSERT ON workflow_executions
+    BEGIN
+        {_COUNT_EXECUTION}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_we_count_update
+    AFTER UPDATE OF status, organization_id, workflow_definition_id ON workflow_executions
+    WHEN OLD.status IS NOT NEW.status
+      OR OLD.organization_id IS NOT NEW.organization_id
+      OR OLD.workflow_definition_id IS NOT NEW.workflow_definition_id
+    BEGIN
+        {_UNCOUNT_EXECUTION}
+        {_COUNT_EXECUTION}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_we_count_delete
+    AFTER DELETE ON workflow_executions
+    BEGIN
+        {_UNCOUNT_EXECUTION}
+    END;
+
+    -- Backfill from existing history; the write lock keeps the triggers from double-counting.
+    INSERT INTO execution_counts (organization_id, workflow_definition_id, status, count)
+    SELECT '', '', status, count(*)
+        FROM workflow_executions GROUP BY status
+    UNION ALL
+    SELECT '', workflow_definition_id, status, count(*)
+        FROM workflow_executions GROUP BY workflow_definition_id, status
+    UNION ALL
+    SELECT organization_id, '', status, count(*)
+        FROM workflow_executions WHERE organization_id IS NOT NULL
+        GROUP BY organization_id, status
+    UNION ALL
+    SELECT organization_id, workflow_definition_id, status, count(*)
+        FROM workflow_executions WHERE organization_id IS NOT NULL
+        GROUP BY organization_id, workflow_definition_id, status;
+    """)
+
+
+def _user_attribute_rows(row: str, source: str = "") -> str:
+    """SELECT of one row per element of `row`'s JSON array columns; `source` prefixes the FROM list."""
+    return " UNION ALL ".join(
+        f"""
+        SELECT {row}.id, '{kind}', j.value
+        FROM {source}json_each(CASE WHEN json_valid({row}.{column}) THEN {row}.{column} ELSE '[]' END) AS j
+        WHERE j.type='text'"""
+        for kind, column in (("language", "languages"), ("skill", "skills"), ("role", "roles"))
+    )
+
+
+def _step_value_rows(row: str, source: str = "") -> str:
+    """SELECT of one row per top-level scalar field of `row`'s output and manual_input objects."""
+    return " UNION ALL ".join(
+        f"""
+        SELECT {row}.id, {row}.execution_id, '{column}', j.key, CAST(j.value AS TEXT)
+        FROM {source}json_each(CASE WHEN json_valid({row}.{column}) THEN {row}.{column} ELSE '{{}}' END) AS j
+        WHERE j.type NOT IN ('object', 'array', 'null') AND j.key IS NOT NULL"""
+        for column in ("output", "manual_input")
+    )
+
+
+_INSERT_USER_ATTRIBUTES = "INSERT OR IGNORE INTO user_attributes (user_id, kind, value)"
+_INSERT_STEP_VALUES = "INSERT OR IGNORE INTO step_values (step_execution_id, execution_id, source, key, value)"
+
+
+@migration(7)
+def _json_value_indexes(conn) -> None:
+    """
+    Queryable copies of the JSON payload columns, maintained by triggers:
+    user_attributes for users.languages/skills/roles and step_values for the
+    scalar fields of step output/manual_input. The JSON columns stay the
+    source of truth; these tables only exist to be indexed.
+    """
+    execute_script(conn, f"""
+    CREATE TABLE IF NOT EXISTS user_attributes (
+        kind    TEXT NOT NULL CHECK (kind IN ('language', 'skill', 'role')),
+        value   TEXT NOT NULL COLLATE NOCASE,
+        user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        PRIMARY KEY (kind, value, user_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_user_attributes_user ON user_attributes (user_id);
+
+    CREATE TRIGGER IF NOT EXISTS trg_users_attributes_insert
+    AFTER INSERT ON users
+    BEGIN
+        {_INSERT_USER_ATTRIBUTES} {_user_attribute_rows("NEW")};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_users_attributes_update
+    AFTER UPDATE OF languages, skills, roles ON users
+    BEGIN
+        DELETE FROM user_attributes WHERE user_id=OLD.id;
+        {_INSERT_USER_ATTRIBUTES} {_user_attribute_rows("NEW")};
+    END;
+
+    CREATE TABLE IF NOT EXISTS step_values (
+        key               TEXT NOT NULL,
+        value             TEXT NOT NULL,
+        source            TEXT NOT NULL CHECK (source IN ('output', 'manual_input')),
+        step_execution_id TEXT NOT NULL REFERENCES workflow_step_executions(id) ON DELETE CASCADE,
+        execution_id      TEXT NOT NULL,
+        PRIMARY KEY (key, value, step_execution_id, source)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_step_values_step ON step_values (step_execution_id);
+
+    CREATE TRIGGER IF NOT EXISTS trg_wse_values_insert
+    AFTER INSERT ON workflow_step_executions
+    WHEN NEW.output IS NOT NULL OR NEW.manual_input IS NOT NULL
+    BEGIN
+        {_INSERT_STEP_VALUES} {_step_value_rows("NEW")};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_wse_values_update
+    AFTER UPDATE OF output, manual_input ON workflow_step_executions
+    BEGIN
+        DELETE FROM step_values WHERE step_execution_id=OLD.id;
+        {_INSERT_STEP_VALUES} {_step_value_rows("NEW")};
+    END;
+
+    -- Backfill existing rows.
+    {_INSERT_USER_ATTRIBUTES} {_user_attribute_rows("u", "users AS u, ")};
+    {_INSERT_STEP_VALUES} {_step_value_rows("s", "workflow_step_executions AS s, ")};
+    """)
+
+
+_ACCESS_GRANTS_V8 = """
+CREATE TABLE {name} (
+    id           TEXT PRIMARY KEY,
+    user_id      TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    resource_id  TEXT NOT NULL REFERENCES resources(id),
+    permission   TEXT NOT NULL DEFAULT 'read'
+                 CHECK (permission IN ('read','write','admin')),
+    granted_by   TEXT REFERENCES users(id),
+    granted_at   TEXT DEFAULT (datetime('now')),
+    revoked_at   TEXT,
+    execution_id TEXT,
+    UNIQUE (user_id, resource_id)
+)
+"""
+
+
+@migration(8, transactional=False)
+def _access_grants_soft_execution_ref(conn) -> None:
+    """
+    Drop the foreign key on access_grants.execution_id: grants outlive their
+    execution's move to the archive tables, so the id may point at either.
+    """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='access_grants'").fetchone()
+    if row and "REFERENCES workflow_executions" in row[0]:
+        rebuild_table(conn, "access_grants", _ACCESS_GRANTS_V8)
+
+
+@migration(9)
+def _execution_archive(conn) -> None:
+    """
+    Cold storage for finished executions (see api/archive.py). The archive
+    tables mirror the hot ones without foreign keys, so referenced users and
+    organizations can still be deleted. Archiving is not a deletion as far as
+    the counters go: the delete trigger skips rows already copied to the archive.
+    """
+    execute_script(conn, f"""
+    CREATE TABLE IF NOT EXISTS workflow_executions_archive (
+        id                     TEXT PRIMARY KEY,
+        workflow_definition_id TEXT NOT NULL,
+        organization_id        TEXT,
+        user_id                TEXT,
+        requested_by           TEXT,
+        status                 TEXT NOT NULL,
+        current_step_order     INTEGER,
+        created_at             TEXT,
+        completed_at           TEXT,
+        archived_at            TEXT DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_step_executions_archive (
+        id                 TEXT PRIMARY KEY,
+        execution_id       TEXT NOT NULL,
+        step_definition_id TEXT NOT NULL,
+        step_order         INTEGER NOT NULL,
+        status             TEXT NOT NULL,
+        manual_input       TEXT,
+        output             TEXT,
+        error              TEXT,
+        completed_by       TEXT,
+        started_at         TEXT,
+        completed_at       TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_wse_archive_execution
+        ON workflow_step_executions_archive (execution_id, step_order);
+
+    DROP TRIGGER IF EXISTS trg_we_count_delete;
+    CREATE TRIGGER trg_we_count_delete
+    AFTER DELETE ON workflow_executions
+    WHEN NOT EXISTS (SELECT 1 FROM workflow_executions_archive WHERE id=OLD.id)
+    BEGIN
+        {_UNCOUNT_EXECUTION}
+    END;
+    """)
+
+
+_SEARCH_TOKENIZE = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+
+def _search_document_triggers(kind: str, table: str, columns: str, parent: str, title: str, body: str) -> str:
+    """Triggers mirroring `table` rows into search_documents as `kind` documents."""
+    insert = f"""
+        INSERT INTO search_documents (kind, ref_id, parent_id, title, body)
+        VALUES ('{kind}', NEW.id, {parent}, {title}, {body});"""
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert
+    AFTER INSERT ON {table}
+    BEGIN {insert}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update
+    AFTER UPDATE OF {columns} ON {table}
+    BEGIN
+        DELETE FROM search_documents WHERE kind='{kind}' AND ref_id=OLD.id; {insert}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete
+    AFTER DELETE ON {table}
+    BEGIN
+        DELETE FROM search_documents WHERE kind='{kind}' AND ref_id=OLD.id;
+    END;
+    """
+
+
+def _fts_sync_triggers(documents: str, index: str, columns: str, schema: str = "main") -> str:
+    """Keep the external-content FTS5 table `index` in step with `documents` (insert / delete only)."""
+    new = ", ".join(f"NEW.{c}" for c in columns.split(", "))
+    old = ", ".join(f"OLD.{c}" for c in columns.split(", "))
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_{documents}_fts_insert
+    AFTER INSERT ON {documents}
+    BEGIN
+        INSERT INTO {index} (rowid, {columns}) VALUES (NEW.id, {new});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_{documents}_fts_delete
+    AFTER DELETE ON {documents}
+    BEGIN
+        INSERT INTO {index} ({index}, rowid, {columns}) VALUES ('delete', OLD.id, {old});
+    END;
+    """
+
+
+@migration(10)
+def _full_text_search(conn) -> None:
+    """
+    FTS5 indexes for GET /api/search. search_documents holds one row per user,
+    organization and step definition, error_documents one per step execution
+    with an error; triggers keep both in step with their source rows and the
+    FTS5 tables index them as external content. The error side lives next to
+    workflow_step_executions, since triggers can't reach across database files.
+    """
+    execute_script(conn, f"""
+    CREATE TABLE IF NOT EXISTS search_documents (
+        id        INTEGER PRIMARY KEY,
+        kind      TEXT NOT NULL CHECK (kind IN ('user', 'organization', 'step')),
+        ref_id    TEXT NOT NULL,
+        parent_id TEXT,
+        title     TEXT NOT NULL,
+        body      TEXT NOT NULL DEFAULT '',
+        UNIQUE (kind, ref_id)
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        title, body, content='search_documents', content_rowid='id', {_SEARCH_TOKENIZE}
+    );
+    {_fts_sync_triggers("search_documents", "search_index", "title, body")}
+    {_search_document_triggers(
+        "user", "users", "firstname, lastname, email, organization_id",
+        "NEW.organization_id", "NEW.firstname || ' ' || NEW.lastname", "NEW.email",
+    )}
+    {_search_document_triggers(
+        "organization", "organizations", "name", "NULL", "NEW.name", "''",
+    )}
+    {_search_document_triggers(
+        "step", "workflow_step_definitions", "workflow_definition_id, name, label",
+        "NEW.workflow_definition_id", "NEW.label", "NEW.name",
+    )}
+
+    -- Backfill; the triggers above index the rows as they go in.
+    INSERT OR IGNORE INTO search_documents (kind, ref_id, parent_id, title, body)
+    SELECT 'user', id, organization_id, firstname || ' ' || lastname, email FROM users
+    UNION ALL
+    SELECT 'organization', id, NULL, name, '' FROM organizations
+    UNION ALL
+    SELECT 'step', id, workflow_definition_id, label, name FROM workflow_step_definitions;
+    """)
+
+    schema = schema_of(conn, "workflow_step_executions")
+    execute_script(conn, f"""
+    CREATE TABLE IF NOT EXISTS {schema}.error_documents (
+        id                INTEGER PRIMARY KEY,
+        step_execution_id TEXT NOT NULL UNIQUE,
+        execution_id      TEXT NOT NULL,
+        error             TEXT NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.error_index USING fts5(
+        error, content='error_documents', content_rowid='id', {_SEARCH_TOKENIZE}
+    );
+    {_fts_sync_triggers("error_documents", "error_index", "error", schema)}
+
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_wse_search_insert
+    AFTER INSERT ON workflow_step_executions
+    WHEN NEW.error IS NOT NULL
+    BEGIN
+        INSERT INTO error_documents (step_execution_id, execution_id, error)
+        VALUES (NEW.id, NEW.execution_id, NEW.error);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_wse_search_update
+    AFTER UPDATE OF error ON workflow_step_executions
+    BEGIN
+        DELETE FROM error_documents WHERE step_execution_id=OLD.id;
+        INSERT INTO error_documents (step_execution_id, execution_id, error)
+        SELECT NEW.id, NEW.execution_id, NEW.error WHERE NEW.error IS NOT NULL;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_wse_search_delete
+    AFTER DELETE ON workflow_step_executions
+    WHEN OLD.error IS NOT NULL
+    BEGIN
+        DELETE FROM error_documents WHERE step_execution_id=OLD.id;
+    END;
+
+    INSERT OR IGNORE INTO {schema}.error_documents (step_execution_id, execution_id, error)
+    SELECT id, execution_id, error FROM {schema}.workflow_step_executions WHERE error IS NOT NULL;
+    """)
+
+
+# Steps of the seeded workflows that don't simply wait for the step before
+# them, as (workflow, step, step it waits for). Independent auto steps share
+# a prerequisite and run in parallel.
+SEEDED_STEP_DEPENDENCIES = [
+    ("new_partner", "clone_metabase_collection", "trigger_infrabot"),
+    ("new_partner", "create_metabase_group", "trigger_infrabot"),
+    ("new_partner", "create_teams_channel", "trigger_infrabot"),
+    ("new_partner", "create_slack_group", "trigger_infrabot"),
+    ("new_partner", "grant_metabase_db_access", "clone_metabase_collection"),
+    ("new_partner", "grant_metabase_db_access", "create_metabase_group"),
+    ("new_partner", "lms_setup", "grant_metabase_db_access"),
+    ("new_partner", "lms_setup", "create_teams_channel"),
+    ("new_partner", "lms_setup", "create_slack_group"),
+    ("new_partner_user", "add_user_to_studio_companies", "input_user_details"),
+    ("new_partner_user", "add_user_to_metabase_group", "input_user_details"),
+    ("new_partner_user", "add_user_to_teams_channel", "input_user_details"),
+    ("new_partner_user", "add_user_to_slack_group", "input_user_details"),
+    ("new_partner_user", "create_studio_user_company", "input_user_details"),
+    ("new_partner_user", "send_studio_invite", "add_user_to_studio_companies"),
+    ("new_partner_user", "send_studio_invite", "create_studio_user_company"),
+    ("new_partner_user", "share_documentation", "add_user_to_metabase_group"),
+    ("new_partner_user", "share_documentation", "add_user_to_teams_channel"),
+    ("new_partner_user", "share_documentation", "add_user_to_slack_group"),
+    ("new_partner_user", "share_documentation", "send_studio_invite"),
+]
+
+
+def step_dependency_backfill() -> list[str]:
+    """
+    Statements giving every step definition without dependencies its
+    prerequisites: those in SEEDED_STEP_DEPENDENCIES, else the step before it.
+    Plain SQL for both backends; used by migration 11 and the seed data.
+    """
+    declared = ", ".join(f"('{wf}', '{step}', '{dep}')" for wf, step, dep in SEEDED_STEP_DEPENDENCIES)
+    undeclared = "NOT EXISTS (SELECT 1 FROM workflow_step_dependencies x WHERE x.step_definition_id = s.id)"
+    return [
+        f"""
+        INSERT INTO workflow_step_dependencies (step_definition_id, depends_on_id)
+        SELECT s.id, d.id
+        FROM (VALUES {declared}) AS v
+        JOIN workflow_definitions wd ON wd.name = v.column1
+        JOIN workflow_step_definitions s ON s.workflow_definition_id = wd.id AND s.name = v.column2
+        JOIN workflow_step_definitions d ON d.workflow_definition_id = wd.id AND d.name = v.column3
+        WHERE {undeclared}
+        """,
+        f"""
+        INSERT INTO workflow_step_dependencies (step_definition_id, depends_on_id)
+        SELECT s.id, p.id
+        FROM workflow_step_definitions s
+        JOIN workflow_step_definitions p
+          ON p.workflow_definition_id = s.workflow_definition_id AND p.step_order = s.step_order - 1
+        WHERE {undeclared}
+        """,
+    ]
+
+
+@migration(11)
+def _step_dependencies(conn) -> None:
+    """
+    Steps declare the steps they wait for; the engine runs every step whose
+    prerequisites are done, so independent auto steps run in parallel. A step
+    without rows here has no prerequisites. Existing definitions keep their
+    linear order except for the seeded workflows' independent steps.
+    """
+    execute_script(conn, """
+    CREATE TABLE IF NOT EXISTS workflow_step_dependencies (
+        step_definition_id TEXT NOT NULL REFERENCES workflow_step_definitions(id) ON DELETE CASCADE,
+        depends_on_id      TEXT NOT NULL REFERENCES workflow_step_definitions(id) ON DELETE CASCADE,
+        PRIMARY KEY (step_definition_id, depends_on_id)
+    );
+    """)
+    for sql in step_dependency_backfill():
+        conn.execute(sql)
+
+
+def lease_grace() -> str:
+    """Lease expiry granted to steps found running when leases are introduced."""
+    return (datetime.utcnow() + timedelta(seconds=ENGINE_LEASE_SECONDS)).isoformat()
+
+
+def merged_step_contexts(conn, sql: str) -> dict[str, tuple[dict, dict]]:
+    """
+    Context per execution from `sql`'s (execution_id, step_order, output,
+    manual_input) rows in step order, merged the way the engine merges them,
+    with the step_order that set each key.
+    """
+    contexts: dict[str, tuple[dict, dict]] = {}
+    for row in conn.execute(sql).fetchall():
+        ctx, orders = contexts.setdefault(row["execution_id"], ({}, {}))
+        for values in (row["output"], row["manual_input"]):
+            if values:
+                values = json.loads(values)
+                ctx.update(values)
+                orders.update(dict.fromkeys(values, row["step_order"]))
+    return contexts
+
+
+@migration(12)
+def _ordered_execution_count_locks(conn) -> None:
+    """
+    No-op: PostgreSQL's migration 12 fixes the lock order of the execution
+    counters. SQLite runs one writer at a time, so it has nothing to order.
+    """
+
+
+@migration(13)
+def _execution_contexts(conn) -> None:
+    """
+    The merged context of each execution, kept up to date as its steps
+    complete, so the engine reads it in one lookup instead of decoding every
+    completed step. Backfilled for unfinished executions; completed ones
+    don't read their context again.
+    """
+    schema = schema_of(conn, "workflow_executions")
+    execute_script(conn, f"""
+    CREATE TABLE IF NOT EXISTS {schema}.execution_contexts (
+        execution_id TEXT PRIMARY KEY REFERENCES workflow_executions(id) ON DELETE CASCADE,
+        context      TEXT NOT NULL DEFAULT '{{}}'
+    );
+    INSERT OR IGNORE INTO {schema}.execution_contexts (execution_id)
+    SELECT id FROM {schema}.workflow_executions WHERE status!='completed';
+    """)
+    contexts = merged_step_contexts(conn, f"""
+        SELECT s.execution_id, s.step_order, s.output, s.manual_input
+        FROM {schema}.workflow_step_executions s
+        JOIN {schema}.workflow_executions we ON we.id=s.execution_id
+        WHERE we.status!='completed' AND s.status='completed'
+        ORDER BY s.execution_id, s.step_order
+    """)
+    for execution_id, (ctx, _) in contexts.items():
+        conn.execute(
+            f"UPDATE {schema}.execution_contexts SET context=? WHERE execution_id=?",
+            (json.dumps(ctx), execution_id)
+        )
+
+
+@migration(14)
+def _step_leases(conn) -> None:
+    """
+    Leases on running steps: the engine process running each one and until
+    when. A lease that runs out unrenewed means that process died mid-step.
+    Steps already running belong to processes of the previous release, which
+    may still be up during a rolling deploy: they get one lease period to finish.
+    """
+    schema = schema_of(conn, "workflow_step_executions")
+    # The archive gets them too, so archived steps read the same as hot ones.
+    for table in ("workflow_step_executions", "workflow_step_executions_archive"):
+        conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN lease_owner TEXT")
+        conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN lease_expires_at TEXT")
+    conn.execute(
+        f"UPDATE {schema}.workflow_step_executions SET lease_expires_at=? WHERE status='running'",
+        (lease_grace(),)
+    )
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS {schema}.idx_wse_running_lease
+            ON workflow_step_executions (lease_expires_at) WHERE status='running'
+    """)
+
+
+@migration(15)
+def _context_key_orders(conn) -> None:
+    """
+    Which step set each key of an execution's context. Parallel steps finish
+    in any order; with this the engine lets the later step in step order win
+    a key, as a sequential run would. Unfinished executions are re-merged in
+    step order.
+    """
+    schema = schema_of(conn, "execution_contexts")
+    conn.execute(f"ALTER TABLE {schema}.execution_contexts ADD COLUMN key_orders TEXT NOT NULL DEFAULT '{{}}'")
+    contexts = merged_step_contexts(conn, f"""
+        SELECT s.execution_id, s.step_order, s.output, s.manual_input
+        FROM {schema}.workflow_step_executions s
+        JOIN {schema}.execution_contexts c ON c.execution_id=s.execution_id
+        JOIN {schema}.workflow_executions we ON we.id=s.execution_id
+        WHERE we.status!='completed' AND s.status='completed'
+        ORDER BY s.execution_id, s.step_order
+    """)
+    for execution_id, (ctx, orders) in contexts.items():
+        conn.execute(
+            f"UPDATE {schema}.execution_contexts SET context=?, key_orders=? WHERE execution_id=?",
+            (json.dumps(ctx), json.dumps(orders), execution_id)
+        )
+
+
+def _epoch_ms(value: str) -> str:
+    """SQL for the epoch milliseconds of an ISO-8601 text expression (or of 'now')."""
+    return f"CAST(round((julianday({value}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+# The tables migration 16 rebuilds, parents first, and their new definitions.
+_KEYED_TABLES_V16 = {
+    "workflow_executions": f"""
+CREATE TABLE {{name}} (
+    id                     BLOB PRIMARY KEY,
+    workflow_definition_id TEXT NOT NULL REFERENCES workflow_definitions(id),
+    organization_id        TEXT REFERENCES organizations(id),
+    user_id                TEXT REFERENCES users(id),
+    requested_by           TEXT REFERENCES users(id),
+    status                 TEXT NOT NULL DEFAULT 'pending'
+                           CHECK (status IN ('pending','running','awaiting_input','completed','failed')),
+    current_step_order     INTEGER DEFAULT 1,
+    created_at             INTEGER DEFAULT ({_epoch_ms("'now'")}),
+    completed_at           INTEGER
+)
+""",
+    "workflow_step_executions": """
+CREATE TABLE {name} (
+    id                 BLOB PRIMARY KEY,
+    execution_id       BLOB NOT NULL REFERENCES workflow_executions(id),
+    step_definition_id TEXT NOT NULL REFERENCES workflow_step_definitions(id),
+    step_order         INTEGER NOT NULL,
+    status             TEXT NOT NULL DEFAULT 'pending'
+                       CHECK (status IN ('pending','running','awaiting_input','completed','failed','skipped')),
+    manual_input       TEXT,
+    output             TEXT,
+    error              TEXT,
+    completed_by       TEXT REFERENCES users(id),
+    started_at         INTEGER,
+    completed_at       INTEGER,
+    lease_owner        TEXT,
+    lease_expires_at   INTEGER
+)
+""",
+    "execution_contexts": """
+CREATE TABLE {name} (
+    execution_id BLOB PRIMARY KEY REFERENCES workflow_executions(id) ON DELETE CASCADE,
+    context      TEXT NOT NULL DEFAULT '{}',
+    key_orders   TEXT NOT NULL DEFAULT '{}'
+)
+""",
+    "step_values": """
+CREATE TABLE {name} (
+    key               TEXT NOT NULL,
+    value             TEXT NOT NULL,
+    source            TEXT NOT NULL CHECK (source IN ('output', 'manual_input')),
+    step_execution_id BLOB NOT NULL REFERENCES workflow_step_executions(id) ON DELETE CASCADE,
+    execution_id      BLOB NOT NULL,
+    PRIMARY KEY (key, value, step_execution_id, source)
+) WITHOUT ROWID
+""",
+    "error_documents": """
+CREATE TABLE {name} (
+    id                INTEGER PRIMARY KEY,
+    step_execution_id BLOB NOT NULL UNIQUE,
+    execution_id      BLOB NOT NULL,
+    error             TEXT NOT NULL
+)
+""",
+    "workflow_executions_archive": f"""
+CREATE TABLE {{name}} (
+    id                     BLOB PRIMARY KEY,
+    workflow_definition_id TEXT NOT NULL,
+    organization_id        TEXT,
+    user_id                TEXT,
+    requested_by           TEXT,
+    status                 TEXT NOT NULL,
+    current_step_order     INTEGER,
+    created_at             INTEGER,
+    completed_at           INTEGER,
+    archived_at            INTEGER DEFAULT ({_epoch_ms("'now'")})
+)
+""",
+    "workflow_step_executions_archive": """
+CREATE TABLE {name} (
+    id                 BLOB PRIMARY KEY,
+    execution_id       BLOB NOT NULL,
+    step_definition_id TEXT NOT NULL,
+    step_order         INTEGER NOT NULL,
+    status             TEXT NOT NULL,
+    manual_input       TEXT,
+    output             TEXT,
+    error              TEXT,
+    completed_by       TEXT,
+    started_at         INTEGER,
+    completed_at       INTEGER,
+    lease_owner        TEXT,
+    lease_expires_at   INTEGER
+)
+""",
+    "access_grants": _ACCESS_GRANTS_V8.replace("execution_id TEXT", "execution_id BLOB"),
+}
+
+# Columns migration 16 converts, on both backends: UUID text to 16-byte keys
+# and ISO text to epoch milliseconds.
+EXECUTION_KEY_COLUMNS = {
+    "workflow_executions": ("id",),
+    "workflow_step_executions": ("id", "execution_id"),
+    "execution_contexts": ("execution_id",),
+    "step_values": ("step_execution_id", "execution_id"),
+    "error_documents": ("step_execution_id", "execution_id"),
+    "workflow_executions_archive": ("id",),
+    "workflow_step_executions_archive": ("id", "execution_id"),
+    "access_grants": ("execution_id",),
+}
+EXECUTION_TIME_COLUMNS = {
+    "workflow_executions": ("created_at", "completed_at"),
+    "workflow_step_executions": ("started_at", "completed_at", "lease_expires_at"),
+    "workflow_executions_archive": ("created_at", "completed_at", "archived_at"),
+    "workflow_step_executions_archive": ("started_at", "completed_at", "lease_expires_at"),
+}
+
+
+def _uuid_key(value):
+    return None if value is None else uuid.UUID(value).bytes
+
+
+def _unconverted_v16(conn) -> list[str]:
+    """Tables of migration 16 not converted yet, going by their first key column."""
+    pending = []
+    for table, keys in EXECUTION_KEY_COLUMNS.items():
+        schema = schema_of(conn, table)
+        types = {r[1]: r[2] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()}
+        if types[keys[0]].upper() != "BLOB":
+            pending.append(table)
+    return pending
+
+
+@migration(16, transactional=False)
+def _binary_execution_keys(conn) -> None:
+    """
+    The execution tables' ids become 16-byte BLOB keys (a UUID's bytes rather
+    than its 36-character text) and their timestamps INTEGER epoch
+    milliseconds, as do the columns pointing at them from step_values,
+    error_documents, execution_contexts and access_grants. Every index over
+    them shrinks, and comparisons are on bytes and integers. The API still
+    shows string ids and ISO text (see ids.py, timestamps.py).
+
+    Processes of the previous release read and write the old types, so stop
+    them before this runs: a column type change can't be mirrored online the
+    way rebuild_table() mirrors a copy. The rebuild is one write transaction;
+    error_documents keeps its ids, so the FTS index over it stays valid.
+    """
+    pending = _unconverted_v16(conn)
+    if not pending:
+        return
+    if conn.in_transaction:
+        conn.commit()
+    conn.create_function("uuid_key", 1, _uuid_key, deterministic=True)
+    # As in split_execution_tables(): dropping the old tables must not cascade.
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have converted them while we waited for the lock.
+            pending = _unconverted_v16(conn)
+            dependents = []
+            for table in pending:
+                schema = schema_of(conn, table)
+                create_sql = _KEYED_TABLES_V16[table].replace("{name}", f"{schema}._v16_{table}")
+                conn.execute(_local_references(create_sql) if schema == "exec" else create_sql)
+                cols = [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+                values = [
+                    f"uuid_key({c})" if c in EXECUTION_KEY_COLUMNS[table]
+                    else _epoch_ms(c) if c in EXECUTION_TIME_COLUMNS.get(table, ())
+                    else c
+                    for c in cols
+                ]
+                conn.execute(
+                    f"INSERT INTO {schema}._v16_{table} ({', '.join(cols)}) "
+                    f"SELECT {', '.join(values)} FROM {schema}.{table}"
+                )
+                dependents += [
+                    (schema, r[0]) for r in conn.execute(
+                        f"SELECT sql FROM {schema}.sqlite_master WHERE tbl_name=? AND type IN ('index','trigger') "
+                        "AND sql IS NOT NULL",
+                        (table,)
+                    ).fetchall()
+                ]
+            for table in reversed(pending):
+                conn.execute(f"DROP TABLE {schema_of(conn, table)}.{table}")
+            for table in pending:
+                schema = schema_of(conn, f"_v16_{table}")
+                conn.execute(f"ALTER TABLE {schema}._v16_{table} RENAME TO {table}")
+            for schema, sql in dependents:
+                conn.execute(_CREATE_NAMED.sub(rf"\1{schema}.", sql.strip(), count=1))
+            for table in pending:
+                violations = conn.execute(f"PRAGMA {schema_of(conn, table)}.foreign_key_check({table})").fetchall()
+                if violations:
+                    raise RuntimeError(f"Conversion of {table} left {len(violations)} foreign key violations")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
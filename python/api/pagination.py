@@ -0,0 +1,53 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints.
+
+A cursor is the sort key of the last row on the previous page, encoded as
+URL-safe base64 JSON. Pages are fetched with a row-value comparison such as
+`(created_at, id) < (?, ?)`, which walks the matching index from where the
+previous page stopped — the cost of a page doesn't grow with its depth.
+"""
+
+import json
+import base64
+import binascii
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decode a cursor into its `size` key values; raises 400 on anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def page(rows: list, limit: int, key: Callable[[Any], tuple]) -> dict:
+    """
+    Build a page response from `limit + 1` fetched rows.
+    The extra row only signals that another page exists and is not returned.
+    """
+    items = rows[:limit]
+    next_cursor: Optional[str] = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(*key(items[-1]))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def prefix_pattern(q: str) -> str:
+    """LIKE pattern matching values that start with `q`; use with ESCAPE '\\'."""
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
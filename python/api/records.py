@@ -0,0 +1,113 @@
+"""
+Read views over database rows, used in place of `dict(row)` plus eager json.loads.
+
+A Record wraps the row the driver returned (sqlite3.Row, or a dict from
+psycopg) without copying it. Columns holding JSON text are decoded on first
+access and cached, so a field nobody reads is never parsed; so are the
+execution tables' 16-byte keys and epoch-millisecond timestamps, which read
+as the API's string ids and ISO-8601 text (see ids.py, timestamps.py). Records are
+Mappings: `rec["email"]`, `rec.get(...)` and `dict(rec)` work as on a dict,
+and FastAPI serializes them like one. Keys set on a record (e.g. a route
+attaching `steps`) are kept next to the row and come after its columns.
+"""
+
+import json
+from collections.abc import Mapping
+from typing import Any, ClassVar, Iterator, Optional
+
+from .ids import to_id
+from .timestamps import to_iso
+
+
+class Record(Mapping):
+    """One row; JSON columns listed in `json_fields` decode lazily."""
+
+    __slots__ = ("_row", "_values")
+
+    # Column -> JSON text used when the column is NULL or empty ("" decodes to None).
+    json_fields: ClassVar[dict[str, str]] = {}
+    # Columns holding a 16-byte key, read as its string id.
+    key_fields: ClassVar[frozenset[str]] = frozenset()
+    # Columns holding epoch milliseconds, read as ISO-8601 text.
+    time_fields: ClassVar[frozenset[str]] = frozenset()
+
+    def __init__(self, row: Any):
+        self._row = row
+        self._values: Optional[dict[str, Any]] = None  # decoded fields and keys set later
+
+    def __getitem__(self, key: str) -> Any:
+        values = self._values
+        if values is not None and key in values:
+            return values[key]
+        try:
+            value = self._row[key]
+        except IndexError:  # sqlite3.Row signals a missing key this way
+            raise KeyError(key) from None
+        if key in self.json_fields:
+            text = value or self.json_fields[key]
+            value = json.loads(text) if text else None
+        elif key in self.key_fields and value is not None:
+            value = to_id(value)
+        elif key in self.time_fields:
+            value = to_iso(value)
+        else:
+            return value
+        if values is None:
+            values = self._values = {}
+        values[key] = value
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._values is None:
+            self._values = {}
+        self._values[key] = value
+
+    def keys(self) -> list[str]:
+        columns = list(self._row.keys())
+        if self._values:
+            present = set(columns)
+            columns += [k for k in self._values if k not in present]
+        return columns
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class UserRecord(Record):
+    __slots__ = ()
+    json_fields = {"languages": "[]", "skills": "[]", "roles": "[]"}
+
+
+class OrganizationRecord(Record):
+    __slots__ = ()
+    json_fields = {"account_types": '["partner"]'}
+
+
+class ExecutionRecord(Record):
+    """A workflow_executions row, hot or archived."""
+
+    __slots__ = ()
+    key_fields = frozenset({"id"})
+    time_fields = frozenset({"created_at", "completed_at", "archived_at"})
+
+
+class StepRecord(Record):
+    """A workflow_step_executions row; manual_input / output are None when empty."""
+
+    __slots__ = ()
+    json_fields = {"manual_input": "", "output": ""}
+    key_fields = frozenset({"id", "execution_id"})
+    time_fields = frozenset({"started_at", "completed_at", "lease_expires_at"})
+
+
+class AccessGrantRecord(Record):
+    """An access_grants row; execution_id is the execution that granted it."""
+
+    __slots__ = ()
+    key_fields = frozenset({"execution_id"})
@@ -0,0 +1,45 @@
+from fastapi import HTTPException, Response
+from ..engine.workflow import settle
+from ..ids import to_id, to_key
+from ..pagination import decode_cursor
+from ..records import ExecutionRecord
+from ..timestamps import to_ms
+
+# Longest `wait` a caller may ask the engine endpoints for, in seconds.
+MAX_WAIT = 30.0
+
+
+def row_key(public_id: str, what: str) -> bytes:
+    """The stored key of an execution or step id from a URL; 404 if it can't be one."""
+    try:
+        return to_key(public_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"{what} not found")
+
+
+def time_param(name: str, value: str) -> int:
+    """An ISO date or datetime query parameter as stored (epoch milliseconds); 400 if unparsable."""
+    try:
+        return to_ms(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}")
+
+
+def execution_cursor(cursor: str) -> list:
+    """A cursor from an execution list (created_at, id as the API shows them) as stored values."""
+    created_at, public_id = decode_cursor(cursor, 2)
+    try:
+        return [to_ms(created_at), to_key(public_id)]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def engine_response(conn, response: Response, execution_id: bytes, future, wait: float, base: str) -> ExecutionRecord:
+    """
+    The execution row; 202 with a Location under `base` to poll if the engine
+    hasn't finished within `wait` (always, when workers run the engine).
+    """
+    if not await settle(future, wait):
+        response.status_code = 202
+        response.headers["Location"] = f"{base}/{to_id(execution_id)}"
+    return ExecutionRecord(await conn.fetchone("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)))
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
+from ..auth import require_admin
+from ..backup import BackupFailed, create_backup, list_backups
+from ..maintenance import TASKS, maintenance_status, run_maintenance
+
+router = APIRouter()
+
+
+@router.get("/maintenance")
+async def get_maintenance_status(admin=Depends(require_admin)):
+    """Database size figures and the last run of each maintenance task."""
+    return await run_in_threadpool(maintenance_status)
+
+
+@router.post("/maintenance/{task}")
+async def run_maintenance_task(task: str, admin=Depends(require_admin)):
+    """Run one maintenance task (analyze, checkpoint, vacuum) now."""
+    if task not in TASKS:
+        raise HTTPException(status_code=404, detail=f"Unknown maintenance task: {task}")
+    ran = await run_in_threadpool(run_maintenance, [task])
+    if not ran:
+        raise HTTPException(status_code=409, detail="Maintenance is handled by the database server on this backend")
+    return (await run_in_threadpool(maintenance_status))["tasks"][task]
+
+
+@router.get("/backups")
+async def get_backups(admin=Depends(require_admin)):
+    """Snapshots on disk, newest first, with their SHA-256 checksums."""
+    return await run_in_threadpool(list_backups)
+
+
+@router.post("/backups", status_code=201)
+async def take_backup(admin=Depends(require_admin)):
+    """Take an online snapshot of the database now."""
+    try:
+        return await run_in_threadpool(create_backup)
+    except BackupFailed as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
 from ..database import get_db
 from ..auth import verify_password, create_token, get_current_user
 from ..models import LoginRequest
@@ -7,12 +8,10 @@ router = APIRouter()
 
 
 @router.post("/login")
-def login(body: LoginRequest):
-    conn = get_db()
-    user = conn.execute("SELECT * FROM users WHERE email=?", (body.email,)).fetchone()
-    conn.close()
+async def login(body: LoginRequest, conn=Depends(get_db, scope="function")):
+    user = await conn.fetchone("SELECT * FROM users WHERE email=?", (body.email,))
 
-    if not user or not verify_password(body.password, user["password_hash"]):
+    if not user or not await run_in_threadpool(verify_password, body.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     token = create_token(user["id"])
@@ -29,5 +28,5 @@ def login(body: LoginRequest):
 
 
 @router.get("/me")
-def me(current_user: dict = Depends(get_current_user)):
+async def me(current_user: dict = Depends(get_current_user)):
     return current_user
@@ -1,25 +1,66 @@
-import json
-import uuid
-from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from ..database import get_db
+from ..ids import new_key
+from ..pagination import DEFAULT_LIMIT, MAX_LIMIT, page
+from ..counters import execution_counts
+from ..records import ExecutionRecord, StepRecord
 from ..auth import require_admin
 from ..models import CreateExecutionRequest, ManualInputRequest
-from ..engine.workflow import start_execution, submit_manual_input, retry_step
+from ..engine.workflow import EngineBusy, start_execution, submit_manual_input, retry_step
+from ..timestamps import now_ms
+from . import MAX_WAIT, engine_response, execution_cursor, row_key, time_param
 
 router = APIRouter()
 
 
-def _parse_step(row) -> dict:
-    d = dict(row)
-    d["manual_input"] = json.loads(d["manual_input"]) if d.get("manual_input") else None
-    d["output"] = json.loads(d["output"]) if d.get("output") else None
-    return d
-
-
 @router.get("")
-def list_executions(status: str = None, admin=Depends(require_admin)):
-    conn = get_db()
+async def list_executions(
+    status: Optional[str] = None,
+    workflow_type: Optional[str] = None,
+    organization_id: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    output_key: Optional[str] = None,
+    output_value: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    admin=Depends(require_admin),
+    conn=Depends(get_db, scope="function"),
+):
+    """
+    Newest-first page of executions. `created_from` is inclusive and `created_to`
+    exclusive (ISO dates or datetimes). `output_key` / `output_value` match
+    executions with a step whose output or manual input has that top-level
+    field (and value, compared as text), e.g. `output_key=metabase_user_id&output_value=123`.
+    Pass `next_cursor` back as `cursor`.
+    """
+    where, params = [], []
+    if status:
+        where.append("we.status=?")
+        params.append(status)
+    if workflow_type:
+        where.append("we.workflow_definition_id=(SELECT id FROM workflow_definitions WHERE name=?)")
+        params.append(workflow_type)
+    if organization_id:
+        where.append("we.organization_id=?")
+        params.append(organization_id)
+    if created_from:
+        where.append("we.created_at>=?")
+        params.append(time_param("created_from", created_from))
+    if created_to:
+        where.append("we.created_at<?")
+        params.append(time_param("created_to", created_to))
+    if output_value is not None and not output_key:
+        raise HTTPException(status_code=422, detail="output_value requires output_key")
+    if output_key:
+        match = "key=?" if output_value is None else "key=? AND value=?"
+        where.append(f"we.id IN (SELECT execution_id FROM step_values WHERE {match})")
+        params.extend([output_key] if output_value is None else [output_key, output_value])
+    if cursor:
+        where.append("(we.created_at, we.id) < (?, ?)")
+        params.extend(execution_cursor(cursor))
+
     query = """
         SELECT we.*, wd.name as workflow_name, wd.description as workflow_description,
                o.name as organization_name,
@@ -31,109 +72,144 @@ def list_executions(status: str = None, admin=Depends(require_admin)):
         LEFT JOIN users u ON u.id=we.user_id
         LEFT JOIN users rb ON rb.id=we.requested_by
     """
-    params = []
-    if status:
-        query += " WHERE we.status=?"
-        params.append(status)
-    query += " ORDER BY we.created_at DESC"
-    rows = conn.execute(query, params).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
-
-
-@router.get("/{execution_id}")
-def get_execution(execution_id: str, admin=Depends(require_admin)):
-    conn = get_db()
-    execution = conn.execute("""
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY we.created_at DESC, we.id DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = [ExecutionRecord(r) for r in await conn.fetchall(query, params)]
+    return page(rows, limit, key=lambda r: (r["created_at"], r["id"]))
+
+
+@router.get("/stats")
+async def execution_stats(
+    organization_id: Optional[str] = None,
+    workflow_type: Optional[str] = None,
+    admin=Depends(require_admin),
+    conn=Depends(get_db, scope="function"),
+):
+    """Execution counts per status, optionally for one organization and/or workflow type."""
+    workflow_definition_id = ""
+    if workflow_type:
+        wd = await conn.fetchone("SELECT id FROM workflow_definitions WHERE name=?", (workflow_type,))
+        if not wd:
+            raise HTTPException(status_code=400, detail=f"Unknown workflow type: {workflow_type}")
+        workflow_definition_id = wd["id"]
+    return await execution_counts(conn, organization_id or "", workflow_definition_id)
+
+
+async def _load_execution(conn, execution_id: bytes, archive: bool) -> Optional[ExecutionRecord]:
+    """Execution with its steps from the hot tables, or from the archive tables if `archive`."""
+    suffix = "_archive" if archive else ""
+    execution = await conn.fetchone(f"""
         SELECT we.*, wd.name as workflow_name, wd.description as workflow_description,
                o.name as organization_name,
                u.email as user_email,
                rb.email as requested_by_email
-        FROM workflow_executions we
+        FROM workflow_executions{suffix} we
         JOIN workflow_definitions wd ON wd.id=we.workflow_definition_id
         LEFT JOIN organizations o ON o.id=we.organization_id
         LEFT JOIN users u ON u.id=we.user_id
         LEFT JOIN users rb ON rb.id=we.requested_by
         WHERE we.id=?
-    """, (execution_id,)).fetchone()
-
+    """, (execution_id,))
     if not execution:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Execution not found")
+        return None
 
-    steps = conn.execute("""
+    steps = await conn.fetchall(f"""
         SELECT wse.*, wsd.name as step_name, wsd.label, wsd.type as step_type, wsd.description,
                cb.email as completed_by_email
-        FROM workflow_step_executions wse
+        FROM workflow_step_executions{suffix} wse
         JOIN workflow_step_definitions wsd ON wsd.id=wse.step_definition_id
         LEFT JOIN users cb ON cb.id=wse.completed_by
         WHERE wse.execution_id=?
         ORDER BY wse.step_order ASC
-    """, (execution_id,)).fetchall()
-    conn.close()
+    """, (execution_id,))
 
-    result = dict(execution)
-    result["steps"] = [_parse_step(s) for s in steps]
+    result = ExecutionRecord(execution)
+    result["archived"] = archive
+    result["steps"] = [StepRecord(s) for s in steps]
+    return result
+
+
+@router.get("/{execution_id}")
+async def get_execution(execution_id: str, admin=Depends(require_admin), conn=Depends(get_db, scope="function")):
+    """One execution with its steps; executions moved to cold storage are served from the archive."""
+    execution_id = row_key(execution_id, "Execution")
+    result = await _load_execution(conn, execution_id, archive=False)
+    if result is None:
+        result = await _load_execution(conn, execution_id, archive=True)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Execution not found")
     return result
 
 
 @router.post("", status_code=201)
-def create_execution(body: CreateExecutionRequest, admin=Depends(require_admin)):
-    conn = get_db()
-    wf_def = conn.execute(
+async def create_execution(
+    body: CreateExecutionRequest,
+    response: Response,
+    wait: float = Query(0, ge=0, le=MAX_WAIT),
+    admin=Depends(require_admin),
+    conn=Depends(get_db, scope="function"),
+):
+    """
+    Create an execution and queue its first step. Returns 201 if the engine
+    finished within `wait` seconds, else 202 right away with a Location to poll.
+    """
+    wf_def = await conn.fetchone(
         "SELECT * FROM workflow_definitions WHERE name=?", (body.workflow_type,)
-    ).fetchone()
+    )
     if not wf_def:
-        conn.close()
         raise HTTPException(status_code=400, detail=f"Unknown workflow type: {body.workflow_type}")
 
-    execution_id = str(uuid.uuid4())
-    now = datetime.utcnow().isoformat()
-    conn.execute(
+    execution_id = new_key()
+    await conn.execute(
         "INSERT INTO workflow_executions (id,workflow_definition_id,requested_by,status,created_at) VALUES (?,?,?,?,?)",
-        (execution_id, wf_def["id"], admin["id"], "pending", now)
+        (execution_id, wf_def["id"], admin["id"], "pending", now_ms())
     )
-    conn.commit()
-    conn.close()
-
-    start_execution(execution_id)
 
-    conn = get_db()
-    result = dict(conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone())
-    conn.close()
-    return result
+    try:
+        future = await conn.run(start_execution, execution_id)
+    except EngineBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return await engine_response(conn, response, execution_id, future, wait, "/api/executions")
 
 
 @router.post("/{execution_id}/steps/{step_exec_id}/input")
-def submit_step_input(
+async def submit_step_input(
     execution_id: str,
     step_exec_id: str,
     body: ManualInputRequest,
-    admin=Depends(require_admin)
+    response: Response,
+    wait: float = Query(0, ge=0, le=MAX_WAIT),
+    admin=Depends(require_admin),
+    conn=Depends(get_db, scope="function"),
 ):
+    """Complete a manual step; returns 202 if the engine hasn't moved on within `wait` seconds."""
+    execution_id, step_exec_id = row_key(execution_id, "Execution"), row_key(step_exec_id, "Step")
     try:
-        submit_manual_input(execution_id, step_exec_id, body.to_dict(), admin["id"])
+        future = await conn.run(submit_manual_input, execution_id, step_exec_id, body.to_dict(), admin["id"])
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-
-    conn = get_db()
-    result = dict(conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone())
-    conn.close()
-    return result
+    except EngineBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return await engine_response(conn, response, execution_id, future, wait, "/api/executions")
 
 
 @router.post("/{execution_id}/steps/{step_exec_id}/retry")
-def retry_step_endpoint(
+async def retry_step_endpoint(
     execution_id: str,
     step_exec_id: str,
-    admin=Depends(require_admin)
+    response: Response,
+    wait: float = Query(0, ge=0, le=MAX_WAIT),
+    admin=Depends(require_admin),
+    conn=Depends(get_db, scope="function"),
 ):
+    """Reset a failed step to pending; returns 202 if the engine hasn't rerun it within `wait` seconds."""
+    execution_id, step_exec_id = row_key(execution_id, "Execution"), row_key(step_exec_id, "Step")
     try:
-        retry_step(execution_id, step_exec_id)
+        future = await conn.run(retry_step, execution_id, step_exec_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-
-    conn = get_db()
-    result = dict(conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone())
-    conn.close()
-    return result
+    except EngineBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return await engine_response(conn, response, execution_id, future, wait, "/api/executions")
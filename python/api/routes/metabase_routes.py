@@ -5,22 +5,22 @@ router = APIRouter()
 
 
 @router.get("/groups")
-def list_metabase_groups(admin=Depends(require_admin)):
+async def list_metabase_groups(admin=Depends(require_admin)):
     """Return all non-system Metabase permission groups for use in admin dropdowns."""
     from ..integrations.metabase import list_groups
     try:
-        return list_groups()
+        return await list_groups()
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Metabase error: {str(e)}")
 
 
 @router.get("/debug/user/{mb_user_id}")
-def debug_metabase_user(mb_user_id: int, admin=Depends(require_admin)):
+async def debug_metabase_user(mb_user_id: int, admin=Depends(require_admin)):
     """Return the raw Metabase API response for a user — for debugging group_memberships structure."""
-    import requests as req
-    from ..integrations.metabase import _base, _headers, _TIMEOUT
+    from ..integrations.metabase import _base, _session
     try:
-        resp = req.get(f"{_base()}/api/user/{mb_user_id}", headers=_headers(), timeout=_TIMEOUT)
+        async with _session(None) as http:
+            resp = await http.get(f"{_base()}/api/user/{mb_user_id}")
         return {"status_code": resp.status_code, "body": resp.json()}
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
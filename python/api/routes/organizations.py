@@ -1,8 +1,11 @@
 import json
-import uuid
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
 from ..database import get_db
+from ..ids import new_id
+from ..pagination import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, page, prefix_pattern
+from ..records import OrganizationRecord
 from ..auth import require_admin
 from ..models import UpdateOrganizationRequest, UpsertSystemGroupRequest, UpsertDocumentationRequest
 
@@ -10,42 +13,56 @@ router = APIRouter()
 
 
 @router.get("")
-def list_organizations(admin=Depends(require_admin)):
-    conn = get_db()
-    rows = conn.execute("SELECT * FROM organizations ORDER BY name ASC").fetchall()
-    conn.close()
-    result = []
-    for r in rows:
-        d = dict(r)
-        d["account_types"] = json.loads(d.get("account_types") or '["partner"]')
-        result.append(d)
-    return result
+async def list_organizations(
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    admin=Depends(require_admin),
+    conn=Depends(get_db, scope="function"),
+):
+    """
+    Alphabetical page of organizations. `q` is a case-insensitive prefix of the
+    name. Pass `next_cursor` back as `cursor`.
+    """
+    where, params = [], []
+    if q:
+        where.append("name LIKE ? ESCAPE '\\'")
+        params.append(prefix_pattern(q))
+    if cursor:
+        # Expanded form of (name, id) > (?, ?) so SQLite can seek the NOCASE index.
+        name, org_id = decode_cursor(cursor, 2)
+        where.append("name >= ? COLLATE NOCASE AND (name > ? COLLATE NOCASE OR id > ?)")
+        params.extend([name, name, org_id])
+
+    query = "SELECT * FROM organizations"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY name COLLATE NOCASE, id LIMIT ?"
+    params.append(limit + 1)
+    rows = await conn.fetchall(query, params)
+    return page([OrganizationRecord(r) for r in rows], limit, key=lambda r: (r["name"], r["id"]))
 
 
 @router.get("/{org_id}")
-def get_organization(org_id: str, admin=Depends(require_admin)):
-    conn = get_db()
-    org = conn.execute("SELECT * FROM organizations WHERE id=?", (org_id,)).fetchone()
+async def get_organization(org_id: str, admin=Depends(require_admin), conn=Depends(get_db, scope="function")):
+    org = await conn.fetchone("SELECT * FROM organizations WHERE id=?", (org_id,))
     if not org:
-        conn.close()
         raise HTTPException(status_code=404, detail="Organization not found")
 
-    system_groups = conn.execute(
+    system_groups = await conn.fetchall(
         "SELECT * FROM system_groups WHERE organization_id=?", (org_id,)
-    ).fetchall()
-    studio_companies = conn.execute(
+    )
+    studio_companies = await conn.fetchall(
         "SELECT * FROM studio_companies WHERE organization_id=?", (org_id,)
-    ).fetchall()
-    integrations = conn.execute(
+    )
+    integrations = await conn.fetchone(
         "SELECT * FROM organization_integrations WHERE organization_id=?", (org_id,)
-    ).fetchone()
-    documentation = conn.execute(
+    )
+    documentation = await conn.fetchone(
         "SELECT * FROM organization_documentation WHERE organization_id=?", (org_id,)
-    ).fetchone()
-    conn.close()
+    )
 
-    result = dict(org)
-    result["account_types"] = json.loads(result.get("account_types") or '["partner"]')
+    result = OrganizationRecord(org)
     result["system_groups"] = [dict(g) for g in system_groups]
     result["studio_companies"] = [dict(sc) for sc in studio_companies]
     result["integrations"] = dict(integrations) if integrations else None
@@ -54,18 +71,15 @@ def get_organization(org_id: str, admin=Depends(require_admin)):
 
 
 @router.put("/{org_id}")
-def update_organization(org_id: str, body: UpdateOrganizationRequest, admin=Depends(require_admin)):
-    conn = get_db()
-    org = conn.execute("SELECT id FROM organizations WHERE id=?", (org_id,)).fetchone()
+async def update_organization(org_id: str, body: UpdateOrganizationRequest, admin=Depends(require_admin), conn=Depends(get_db, scope="function")):
+    org = await conn.fetchone("SELECT id FROM organizations WHERE id=?", (org_id,))
     if not org:
-        conn.close()
         raise HTTPException(status_code=404, detail="Organization not found")
 
     fields = {}
     if body.name is not None:
-        existing = conn.execute("SELECT id FROM organizations WHERE name=? AND id!=?", (body.name, org_id)).fetchone()
+        existing = await conn.fetchone("SELECT id FROM organizations WHERE name=? AND id!=?", (body.name, org_id))
         if existing:
-            conn.close()
             raise HTTPException(status_code=409, detail="Organization name already in use")
         fields["name"] = body.name
     if body.account_types is not None:
@@ -73,29 +87,25 @@ def update_organization(org_id: str, body: UpdateOrganizationRequest, admin=Depe
 
     if fields:
         set_clause = ", ".join(f"{k}=?" for k in fields)
-        conn.execute(f"UPDATE organizations SET {set_clause} WHERE id=?", (*fields.values(), org_id))
-        conn.commit()
-    conn.close()
+        await conn.execute(f"UPDATE organizations SET {set_clause} WHERE id=?", (*fields.values(), org_id))
     return {"ok": True}
 
 
 @router.put("/{org_id}/groups")
-def upsert_org_system_group(org_id: str, body: UpsertSystemGroupRequest, admin=Depends(require_admin)):
+async def upsert_org_system_group(org_id: str, body: UpsertSystemGroupRequest, admin=Depends(require_admin), conn=Depends(get_db, scope="function")):
     """Create or update a system group record (metabase/teams/slack) for an org."""
     allowed_tools = ("metabase", "teams", "slack")
     if body.tool not in allowed_tools:
         raise HTTPException(status_code=422, detail=f"tool must be one of {allowed_tools}")
 
-    conn = get_db()
-    org = conn.execute("SELECT id FROM organizations WHERE id=?", (org_id,)).fetchone()
+    org = await conn.fetchone("SELECT id FROM organizations WHERE id=?", (org_id,))
     if not org:
-        conn.close()
         raise HTTPException(status_code=404, detail="Organization not found")
 
-    existing = conn.execute(
+    existing = await conn.fetchone(
         "SELECT id FROM system_groups WHERE organization_id=? AND tool=?",
         (org_id, body.tool)
-    ).fetchone()
+    )
 
     now = datetime.utcnow().isoformat()
     if existing:
@@ -106,62 +116,52 @@ def upsert_org_system_group(org_id: str, body: UpsertSystemGroupRequest, admin=D
             fields["external_name"] = body.external_name
         if fields:
             set_clause = ", ".join(f"{k}=?" for k in fields)
-            conn.execute(f"UPDATE system_groups SET {set_clause} WHERE id=?", (*fields.values(), existing["id"]))
+            await conn.execute(f"UPDATE system_groups SET {set_clause} WHERE id=?", (*fields.values(), existing["id"]))
     else:
-        conn.execute(
+        await conn.execute(
             "INSERT INTO system_groups (id,organization_id,tool,external_name,external_id,created_at) VALUES (?,?,?,?,?,?)",
-            (str(uuid.uuid4()), org_id, body.tool, body.external_name or body.tool, body.external_id, now)
+            (new_id(), org_id, body.tool, body.external_name or body.tool, body.external_id, now)
         )
-    conn.commit()
-    conn.close()
     return {"ok": True}
 
 
 @router.put("/{org_id}/documentation")
-def upsert_org_documentation(org_id: str, body: UpsertDocumentationRequest, admin=Depends(require_admin)):
+async def upsert_org_documentation(org_id: str, body: UpsertDocumentationRequest, admin=Depends(require_admin), conn=Depends(get_db, scope="function")):
     """Create or update the documentation links for an organization."""
-    conn = get_db()
-    org = conn.execute("SELECT id FROM organizations WHERE id=?", (org_id,)).fetchone()
+    org = await conn.fetchone("SELECT id FROM organizations WHERE id=?", (org_id,))
     if not org:
-        conn.close()
         raise HTTPException(status_code=404, detail="Organization not found")
 
-    existing = conn.execute(
+    existing = await conn.fetchone(
         "SELECT id FROM organization_documentation WHERE organization_id=?", (org_id,)
-    ).fetchone()
+    )
     now = datetime.utcnow().isoformat()
 
     if existing:
-        conn.execute(
+        await conn.execute(
             "UPDATE organization_documentation SET internal_docu=?, generique_docu=?, add_docu=?, updated_at=? WHERE organization_id=?",
             (body.internal_docu, body.generique_docu, body.add_docu, now, org_id)
         )
     else:
-        conn.execute(
+        await conn.execute(
             "INSERT INTO organization_documentation (id,organization_id,internal_docu,generique_docu,add_docu,updated_at) VALUES (?,?,?,?,?,?)",
-            (str(uuid.uuid4()), org_id, body.internal_docu, body.generique_docu, body.add_docu, now)
+            (new_id(), org_id, body.internal_docu, body.generique_docu, body.add_docu, now)
         )
-    conn.commit()
-    conn.close()
     return {"ok": True}
 
 
 @router.delete("/{org_id}")
-def delete_organization(org_id: str, admin=Depends(require_admin)):
-    conn = get_db()
-    org = conn.execute("SELECT id FROM organizations WHERE id=?", (org_id,)).fetchone()
+async def delete_organization(org_id: str, admin=Depends(require_admin), conn=Depends(get_db, scope="function")):
+    org = await conn.fetchone("SELECT id FROM organizations WHERE id=?", (org_id,))
     if not org:
-        conn.close()
         raise HTTPException(status_code=404, detail="Organization not found")
     # Null out nullable FK references
-    conn.execute("UPDATE users SET organization_id=NULL WHERE organization_id=?", (org_id,))
-    conn.execute("UPDATE workflow_executions SET organization_id=NULL WHERE organization_id=?", (org_id,))
+    await conn.execute("UPDATE users SET organization_id=NULL WHERE organization_id=?", (org_id,))
+    await conn.execute("UPDATE workflow_executions SET organization_id=NULL WHERE organization_id=?", (org_id,))
     # Delete child rows with NOT NULL FK (cascade won't help without schema-level CASCADE)
-    conn.execute("DELETE FROM organization_integrations WHERE organization_id=?", (org_id,))
-    conn.execute("DELETE FROM system_groups WHERE organization_id=?", (org_id,))
-    conn.execute("DELETE FROM studio_companies WHERE organization_id=?", (org_id,))
-    conn.execute("DELETE FROM organization_documentation WHERE organization_id=?", (org_id,))
-    conn.execute("DELETE FROM organizations WHERE id=?", (org_id,))
-    conn.commit()
-    conn.close()
+    await conn.execute("DELETE FROM organization_integrations WHERE organization_id=?", (org_id,))
+    await conn.execute("DELETE FROM system_groups WHERE organization_id=?", (org_id,))
+    await conn.execute("DELETE FROM studio_companies WHERE organization_id=?", (org_id,))
+    await conn.execute("DELETE FROM organization_documentation WHERE organization_id=?", (org_id,))
+    await conn.execute("DELETE FROM organizations WHERE id=?", (org_id,))
     return {"ok": True}
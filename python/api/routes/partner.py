@@ -3,25 +3,23 @@ Partner-admin routes — scoped to the partner_admin's own organization.
 Accessible to both 'partner_admin' and 'admin' roles.
 """
 
-import json
-import uuid
-from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends
+from functools import partial
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from ..database import get_db
+from ..ids import new_key
+from ..pagination import DEFAULT_LIMIT, MAX_LIMIT, page
+from ..counters import execution_counts
+from ..records import ExecutionRecord, OrganizationRecord, StepRecord
 from ..auth import require_partner_admin
 from ..models import ManualInputRequest
-from ..engine.workflow import start_execution, submit_manual_input, retry_step
+from ..engine.workflow import EngineBusy, start_execution, submit_manual_input, retry_step
+from ..timestamps import now_ms
+from . import MAX_WAIT, engine_response, execution_cursor, row_key, time_param
 
 router = APIRouter()
 
 
-def _parse_step(row) -> dict:
-    d = dict(row)
-    d["manual_input"] = json.loads(d["manual_input"]) if d.get("manual_input") else None
-    d["output"] = json.loads(d["output"]) if d.get("output") else None
-    return d
-
-
 def _get_org_id(user: dict) -> str:
     """Return the org_id to scope queries. Admins must not hit this path without an org."""
     org_id = user.get("organization_id")
@@ -33,25 +31,21 @@ def _get_org_id(user: dict) -> str:
 # ── Organization overview ────────────────────────────────────────────────────
 
 @router.get("/me")
-def get_partner_overview(user=Depends(require_partner_admin)):
+async def get_partner_overview(user=Depends(require_partner_admin), conn=Depends(get_db, scope="function")):
     org_id = _get_org_id(user)
-    conn = get_db()
-    org = conn.execute("SELECT * FROM organizations WHERE id=?", (org_id,)).fetchone()
+    org = await conn.fetchone("SELECT * FROM organizations WHERE id=?", (org_id,))
     if not org:
-        conn.close()
         raise HTTPException(status_code=404, detail="Organization not found")
 
-    users = conn.execute(
+    users = await conn.fetchall(
         "SELECT id, firstname, lastname, email, app_role, created_at FROM users WHERE organization_id=? ORDER BY created_at DESC",
         (org_id,)
-    ).fetchall()
-    integrations = conn.execute(
+    )
+    integrations = await conn.fetchone(
         "SELECT * FROM organization_integrations WHERE organization_id=?", (org_id,)
-    ).fetchone()
-    conn.close()
+    )
 
-    result = dict(org)
-    result["account_types"] = json.loads(result.get("account_types") or '["partner"]')
+    result = OrganizationRecord(org)
     result["users"] = [dict(u) for u in users]
     result["integrations"] = dict(integrations) if integrations else None
     return result
@@ -60,10 +54,33 @@ def get_partner_overview(user=Depends(require_partner_admin)):
 # ── Executions (scoped to org) ───────────────────────────────────────────────
 
 @router.get("/executions")
-def list_partner_executions(user=Depends(require_partner_admin)):
+async def list_partner_executions(
+    status: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    user=Depends(require_partner_admin),
+    conn=Depends(get_db, scope="function"),
+):
     org_id = _get_org_id(user)
-    conn = get_db()
-    rows = conn.execute("""
+    where = ["we.organization_id=?", "wd.name='new_partner_user'"]
+    params: list = [org_id]
+    if status:
+        where.append("we.status=?")
+        params.append(status)
+    if created_from:
+        where.append("we.created_at>=?")
+        params.append(time_param("created_from", created_from))
+    if created_to:
+        where.append("we.created_at<?")
+        params.append(time_param("created_to", created_to))
+    if cursor:
+        where.append("(we.created_at, we.id) < (?, ?)")
+        params.extend(execution_cursor(cursor))
+    params.append(limit + 1)
+
+    rows = await conn.fetchall(f"""
         SELECT we.*, wd.name as workflow_name,
                u.email as user_email,
                rb.email as requested_by_email
@@ -71,151 +88,152 @@ def list_partner_executions(user=Depends(require_partner_admin)):
         JOIN workflow_definitions wd ON wd.id=we.workflow_definition_id
         LEFT JOIN users u ON u.id=we.user_id
         LEFT JOIN users rb ON rb.id=we.requested_by
-        WHERE we.organization_id=? AND wd.name='new_partner_user'
-        ORDER BY we.created_at DESC
-    """, (org_id,)).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+        WHERE {" AND ".join(where)}
+        ORDER BY we.created_at DESC, we.id DESC
+        LIMIT ?
+    """, params)
+    return page([ExecutionRecord(r) for r in rows], limit, key=lambda r: (r["created_at"], r["id"]))
 
 
-@router.get("/executions/{execution_id}")
-def get_partner_execution(execution_id: str, user=Depends(require_partner_admin)):
+@router.get("/executions/stats")
+async def partner_execution_stats(user=Depends(require_partner_admin), conn=Depends(get_db, scope="function")):
+    """Counts per status of the organization's user-onboarding executions."""
     org_id = _get_org_id(user)
-    conn = get_db()
-    execution = conn.execute("""
+    wd = await conn.fetchone("SELECT id FROM workflow_definitions WHERE name='new_partner_user'")
+    if not wd:
+        raise HTTPException(status_code=500, detail="new_partner_user workflow not found")
+    return await execution_counts(conn, org_id, wd["id"])
+
+
+async def _load_execution(conn, execution_id: bytes, org_id: str, archive: bool) -> Optional[ExecutionRecord]:
+    """The org's execution with its steps, from the hot tables or the archive tables."""
+    suffix = "_archive" if archive else ""
+    execution = await conn.fetchone(f"""
         SELECT we.*, wd.name as workflow_name,
                o.name as organization_name,
                u.email as user_email,
                rb.email as requested_by_email
-        FROM workflow_executions we
+        FROM workflow_executions{suffix} we
         JOIN workflow_definitions wd ON wd.id=we.workflow_definition_id
         LEFT JOIN organizations o ON o.id=we.organization_id
         LEFT JOIN users u ON u.id=we.user_id
         LEFT JOIN users rb ON rb.id=we.requested_by
         WHERE we.id=? AND we.organization_id=?
-    """, (execution_id, org_id)).fetchone()
-
+    """, (execution_id, org_id))
     if not execution:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Execution not found")
+        return None
 
-    steps = conn.execute("""
+    steps = await conn.fetchall(f"""
         SELECT wse.*, wsd.name as step_name, wsd.label, wsd.type as step_type, wsd.description,
                cb.email as completed_by_email
-        FROM workflow_step_executions wse
+        FROM workflow_step_executions{suffix} wse
         JOIN workflow_step_definitions wsd ON wsd.id=wse.step_definition_id
         LEFT JOIN users cb ON cb.id=wse.completed_by
         WHERE wse.execution_id=?
         ORDER BY wse.step_order ASC
-    """, (execution_id,)).fetchall()
-    conn.close()
+    """, (execution_id,))
+
+    result = ExecutionRecord(execution)
+    result["archived"] = archive
+    result["steps"] = [StepRecord(s) for s in steps]
+    return result
+
 
-    result = dict(execution)
-    result["steps"] = [_parse_step(s) for s in steps]
+@router.get("/executions/{execution_id}")
+async def get_partner_execution(execution_id: str, user=Depends(require_partner_admin), conn=Depends(get_db, scope="function")):
+    org_id = _get_org_id(user)
+    execution_id = row_key(execution_id, "Execution")
+    result = await _load_execution(conn, execution_id, org_id, archive=False)
+    if result is None:
+        result = await _load_execution(conn, execution_id, org_id, archive=True)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Execution not found")
     return result
 
 
 @router.post("/executions", status_code=201)
-def create_partner_execution(user=Depends(require_partner_admin)):
+async def create_partner_execution(
+    response: Response,
+    wait: float = Query(0, ge=0, le=MAX_WAIT),
+    user=Depends(require_partner_admin),
+    conn=Depends(get_db, scope="function"),
+):
     """
-    Start a new_partner_user workflow for the partner_admin's org.
-    The select_organization step is auto-submitted so the workflow
-    lands at input_user_details immediately.
+    Start a new_partner_user workflow for the partner_admin's org. Its
+    select_organization step is completed with the partner's org as the
+    execution is created, so the workflow goes straight to input_user_details;
+    202 if it isn't there within `wait` seconds.
     """
     org_id = _get_org_id(user)
-    conn = get_db()
-    wf_def = conn.execute(
+    wf_def = await conn.fetchone(
         "SELECT * FROM workflow_definitions WHERE name='new_partner_user'"
-    ).fetchone()
+    )
     if not wf_def:
-        conn.close()
         raise HTTPException(status_code=500, detail="new_partner_user workflow not found")
 
-    execution_id = str(uuid.uuid4())
-    now = datetime.utcnow().isoformat()
-    conn.execute(
-        "INSERT INTO workflow_executions (id,workflow_definition_id,requested_by,status,created_at) VALUES (?,?,?,?,?)",
-        (execution_id, wf_def["id"], user["id"], "pending", now)
+    execution_id = new_key()
+    await conn.execute(
+        "INSERT INTO workflow_executions (id,workflow_definition_id,organization_id,requested_by,status,created_at) VALUES (?,?,?,?,?,?)",
+        (execution_id, wf_def["id"], org_id, user["id"], "pending", now_ms())
     )
-    conn.commit()
-    conn.close()
-
-    # Start the workflow — will pause at select_organization (manual step)
-    start_execution(execution_id)
 
-    # Auto-submit select_organization with the partner's org
-    conn = get_db()
-    select_org_step = conn.execute("""
-        SELECT wse.id FROM workflow_step_executions wse
-        JOIN workflow_step_definitions wsd ON wsd.id=wse.step_definition_id
-        WHERE wse.execution_id=? AND wsd.name='select_organization'
-          AND wse.status='awaiting_input'
-    """, (execution_id,)).fetchone()
-    conn.close()
-
-    if select_org_step:
-        submit_manual_input(
-            execution_id,
-            select_org_step["id"],
-            {"organization_id": org_id},
-            user["id"]
-        )
-
-    conn = get_db()
-    result = dict(conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone())
-    conn.close()
-    return result
+    start = partial(start_execution, inputs={"select_organization": {"organization_id": org_id}}, completed_by=user["id"])
+    try:
+        future = await conn.run(start, execution_id)
+    except EngineBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return await engine_response(conn, response, execution_id, future, wait, "/api/partner/executions")
 
 
 @router.post("/executions/{execution_id}/steps/{step_exec_id}/input")
-def submit_partner_step_input(
+async def submit_partner_step_input(
     execution_id: str,
     step_exec_id: str,
     body: ManualInputRequest,
-    user=Depends(require_partner_admin)
+    response: Response,
+    wait: float = Query(0, ge=0, le=MAX_WAIT),
+    user=Depends(require_partner_admin),
+    conn=Depends(get_db, scope="function"),
 ):
     org_id = _get_org_id(user)
+    execution_id, step_exec_id = row_key(execution_id, "Execution"), row_key(step_exec_id, "Step")
     # Verify execution belongs to this org
-    conn = get_db()
-    ex = conn.execute(
+    ex = await conn.fetchone(
         "SELECT id FROM workflow_executions WHERE id=? AND organization_id=?", (execution_id, org_id)
-    ).fetchone()
-    conn.close()
+    )
     if not ex:
         raise HTTPException(status_code=404, detail="Execution not found")
 
     try:
-        submit_manual_input(execution_id, step_exec_id, body.to_dict(), user["id"])
+        future = await conn.run(submit_manual_input, execution_id, step_exec_id, body.to_dict(), user["id"])
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-
-    conn = get_db()
-    result = dict(conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone())
-    conn.close()
-    return result
+    except EngineBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return await engine_response(conn, response, execution_id, future, wait, "/api/partner/executions")
 
 
 @router.post("/executions/{execution_id}/steps/{step_exec_id}/retry")
-def retry_partner_step(
+async def retry_partner_step(
     execution_id: str,
     step_exec_id: str,
-    user=Depends(require_partner_admin)
+    response: Response,
+    wait: float = Query(0, ge=0, le=MAX_WAIT),
+    user=Depends(require_partner_admin),
+    conn=Depends(get_db, scope="function"),
 ):
     org_id = _get_org_id(user)
-    conn = get_db()
-    ex = conn.execute(
+    execution_id, step_exec_id = row_key(execution_id, "Execution"), row_key(step_exec_id, "Step")
+    ex = await conn.fetchone(
         "SELECT id FROM workflow_executions WHERE id=? AND organization_id=?", (execution_id, org_id)
-    ).fetchone()
-    conn.close()
+    )
     if not ex:
         raise HTTPException(status_code=404, detail="Execution not found")
 
     try:
-        retry_step(execution_id, step_exec_id)
+        future = await conn.run(retry_step, execution_id, step_exec_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-
-    conn = get_db()
-    result = dict(conn.execute("SELECT * FROM workflow_executions WHERE id=?", (execution_id,)).fetchone())
-    conn.close()
-    return result
+    except EngineBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return await engine_response(conn, response, execution_id, future, wait, "/api/partner/executions")
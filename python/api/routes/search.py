@@ -0,0 +1,116 @@
+import re
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from ..database import get_db, get_backend
+from ..ids import to_id
+from ..pagination import MAX_LIMIT
+from ..auth import require_admin
+
+router = APIRouter()
+
+# Hit type -> key its parent_id is returned under.
+HIT_TYPES = {
+    "user": "organization_id",
+    "organization": None,
+    "step": "workflow_definition_id",
+    "error": "execution_id",
+}
+
+_WORD = re.compile(r"[^\W_]+")
+
+# FTS5 (see migration 10): bm25() is lower-is-better, so negate it into a score.
+_SQLITE_DOCUMENTS = """
+    SELECT d.kind AS type, d.ref_id AS id, d.parent_id, d.title,
+           snippet(search_index, -1, '<mark>', '</mark>', '…', 12) AS snippet,
+           -bm25(search_index, 10.0, 1.0) AS score
+    FROM search_index JOIN search_documents d ON d.id=search_index.rowid
+    WHERE search_index MATCH ? AND d.kind IN ({kinds})
+    ORDER BY bm25(search_index, 10.0, 1.0) LIMIT ?
+"""
+_SQLITE_ERRORS = """
+    SELECT 'error' AS type, e.step_execution_id AS id, e.execution_id AS parent_id, sd.label AS title,
+           snippet(error_index, 0, '<mark>', '</mark>', '…', 12) AS snippet,
+           -bm25(error_index) AS score
+    FROM error_index
+    JOIN error_documents e ON e.id=error_index.rowid
+    LEFT JOIN workflow_step_executions s ON s.id=e.step_execution_id
+    LEFT JOIN workflow_step_definitions sd ON sd.id=s.step_definition_id
+    WHERE error_index MATCH ?
+    ORDER BY bm25(error_index) LIMIT ?
+"""
+
+# PostgreSQL (see postgres_migrations 10): a generated tsvector with a GIN index.
+_PG_DOCUMENTS = """
+    SELECT d.kind AS type, d.ref_id AS id, d.parent_id, d.title,
+           ts_headline('simple', d.title || ' ' || d.body, q,
+                       'StartSel=<mark>, StopSel=</mark>, MaxWords=12, MinWords=4') AS snippet,
+           ts_rank(d.document, q) AS score
+    FROM search_documents d, to_tsquery('simple', ?) AS q
+    WHERE d.document @@ q AND d.kind IN ({kinds})
+    ORDER BY score DESC LIMIT ?
+"""
+_PG_ERRORS = """
+    SELECT 'error' AS type, e.step_execution_id AS id, e.execution_id AS parent_id, sd.label AS title,
+           ts_headline('simple', e.error, q,
+                       'StartSel=<mark>, StopSel=</mark>, MaxWords=12, MinWords=4') AS snippet,
+           ts_rank(e.document, q) AS score
+    FROM error_documents e
+    CROSS JOIN to_tsquery('simple', ?) AS q
+    LEFT JOIN workflow_step_executions s ON s.id=e.step_execution_id
+    LEFT JOIN workflow_step_definitions sd ON sd.id=s.step_definition_id
+    WHERE e.document @@ q
+    ORDER BY score DESC LIMIT ?
+"""
+
+
+def _match_expression(words: list[str], postgres: bool) -> str:
+    """Every word must match, each as a prefix ("jan acm" finds jane@acme.com)."""
+    if postgres:
+        return " & ".join(f"{w}:*" for w in words)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=1),
+    type: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_LIMIT),
+    admin=Depends(require_admin),
+    conn=Depends(get_db, scope="function"),
+):
+    """
+    Full-text search over user names and emails, organization names, step
+    labels and step error messages, best match first. Words match as prefixes
+    and all of them must match. `type` is a comma-separated subset of user,
+    organization, step, error. Errors of archived executions aren't searched.
+    """
+    types = [t.strip() for t in type.split(",") if t.strip()] if type else list(HIT_TYPES)
+    unknown = [t for t in types if t not in HIT_TYPES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown search type: {', '.join(unknown)}")
+    words = _WORD.findall(q.lower())
+    if not words:
+        return {"items": []}
+
+    postgres = get_backend().name == "postgres"
+    match = _match_expression(words, postgres)
+    rows = []
+    kinds = [t for t in types if t != "error"]
+    if kinds:
+        query = (_PG_DOCUMENTS if postgres else _SQLITE_DOCUMENTS).format(kinds=",".join("?" * len(kinds)))
+        rows += await conn.fetchall(query, [match, *kinds, limit])
+    if "error" in types:
+        rows += await conn.fetchall(_PG_ERRORS if postgres else _SQLITE_ERRORS, [match, limit])
+
+    items = []
+    for r in sorted(rows, key=lambda r: r["score"], reverse=True)[:limit]:
+        hit = dict(r)
+        parent_id = hit.pop("parent_id")
+        if hit["type"] == "error":
+            # Step and execution keys (see migration 16), shown as the API's string ids.
+            hit["id"], parent_id = to_id(hit["id"]), to_id(parent_id)
+        if HIT_TYPES[hit["type"]]:
+            hit[HIT_TYPES[hit["type"]]] = parent_id
+        hit["score"] = round(hit["score"], 4)
+        items.append(hit)
+    return {"items": items}
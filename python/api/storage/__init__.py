@@ -0,0 +1,19 @@
+"""
+Storage backends. SQLite is the default; set DATABASE_URL to a
+postgresql:// URL to share one PostgreSQL database between several API and
+engine processes (requires `pip install "psycopg[binary,pool]"`).
+"""
+
+import os
+
+from .base import Backend
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+
+def create_backend() -> Backend:
+    if DATABASE_URL.startswith(("postgresql://", "postgres://")):
+        from .postgres import PostgresBackend
+        return PostgresBackend(DATABASE_URL)
+    from .sqlite import SQLiteBackend
+    return SQLiteBackend()
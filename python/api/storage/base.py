@@ -0,0 +1,49 @@
+"""
+Interface shared by the storage backends.
+
+Connections handed out by a backend behave like sqlite3 connections as far as
+the rest of the app is concerned: `execute(sql, params)` takes SQLite-dialect
+SQL with `?` placeholders and returns a cursor, rows support `row["col"]` and
+`dict(row)`, and `commit()` / `rollback()` end the implicit transaction.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+
+class OwnThreadMixin:
+    """Gives a connection the single worker thread its async calls run on."""
+
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    def executor(self) -> ThreadPoolExecutor:
+        # One thread per connection, created on first async use: calls on a
+        # connection are serialized anyway, and a request's transaction never
+        # waits behind another request's statements for a free worker.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hyopps-db")
+        return self._executor
+
+    def _shutdown_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class Backend:
+    """A pool of connections to one database plus the schema that lives in it."""
+
+    name = ""
+
+    def acquire(self) -> Any:
+        raise NotImplementedError
+
+    def release(self, conn: Any) -> None:
+        """Return a connection, rolling back anything left uncommitted."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def migrate(self, conn: Any) -> None:
+        """Bring the schema up to date; safe to call from several processes at once."""
+        raise NotImplementedError
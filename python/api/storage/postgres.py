@@ -0,0 +1,100 @@
+"""
+PostgreSQL backend: a psycopg 3 connection pool shared by request handlers
+and engine threads, so several API / engine processes can work on one
+database without SQLite's database-wide write lock.
+
+Routes and the engine keep writing SQLite-dialect SQL; `translate` rewrites
+each statement once (placeholders, INSERT OR IGNORE, case-insensitive LIKE)
+and the result is cached.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Any
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+except ImportError as e:  # pragma: no cover - optional dependency
+    raise ImportError(
+        'DATABASE_URL points at PostgreSQL but psycopg is not installed: pip install "psycopg[binary,pool]"'
+    ) from e
+
+from .base import Backend, OwnThreadMixin
+from .postgres_migrations import run_migrations
+
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "2"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "20"))
+# Seconds to wait for a free connection before failing the request.
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_INSERT_OR_IGNORE = re.compile(r"\bINSERT\s+OR\s+IGNORE\s+INTO\b", re.IGNORECASE)
+_LIKE = re.compile(r"\bLIKE\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def translate(sql: str) -> str:
+    """Rewrite one SQLite-dialect statement for PostgreSQL."""
+    parts = _QUOTED.split(sql)
+    ignore = False
+    for i in range(0, len(parts), 2):  # even parts are outside quotes
+        part = parts[i].replace("%", "%%").replace("?", "%s")
+        part, n = _INSERT_OR_IGNORE.subn("INSERT INTO", part)
+        ignore = ignore or bool(n)
+        # SQLite's LIKE is case-insensitive; PostgreSQL's isn't.
+        parts[i] = _LIKE.sub("ILIKE", part)
+    for i in range(1, len(parts), 2):
+        parts[i] = parts[i].replace("%", "%%")
+    out = "".join(parts)
+    if ignore:
+        out = out.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
+    return out
+
+
+class PgConnection(OwnThreadMixin, psycopg.Connection):
+    """psycopg connection that accepts the app's SQLite-dialect statements."""
+
+    def execute(self, query: Any, params: Any = None, **kwargs: Any) -> psycopg.Cursor:
+        if isinstance(query, str):
+            query = translate(query)
+        return super().execute(query, tuple(params or ()), **kwargs)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.info.transaction_status != psycopg.pq.TransactionStatus.IDLE
+
+    def close(self) -> None:
+        self._shutdown_executor()
+        super().close()
+
+
+class PostgresBackend(Backend):
+    name = "postgres"
+
+    def __init__(self, url: str):
+        self.pool = ConnectionPool(
+            url,
+            min_size=PG_POOL_MIN,
+            max_size=PG_POOL_MAX,
+            timeout=PG_POOL_TIMEOUT,
+            connection_class=PgConnection,
+            kwargs={"row_factory": dict_row},
+            open=True,
+        )
+
+    def acquire(self) -> PgConnection:
+        return self.pool.getconn()
+
+    def release(self, conn: PgConnection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self.pool.putconn(conn)
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def migrate(self, conn: PgConnection) -> None:
+        run_migrations(conn)
@@ -0,0 +1,697 @@
+"""
+Versioned schema migrations for the PostgreSQL backend, tracked in the
+schema_version table.
+
+Version numbers follow api/migrations.py so both backends describe the same
+schema at the same version. Version 7 creates everything SQLite reached in
+migrations 1-7 in one step; later versions get a twin here alongside their
+SQLite migration. All pending migrations run in one transaction under an
+advisory lock, so several processes starting together apply them once.
+"""
+
+import json
+from typing import Callable
+
+from ..migrations import (
+    EXECUTION_KEY_COLUMNS, EXECUTION_TIME_COLUMNS, lease_grace, merged_step_contexts, step_dependency_backfill,
+)
+
+_MIGRATIONS: list[tuple[int, Callable]] = []
+
+# Arbitrary constant identifying the migration lock among advisory locks.
+_MIGRATION_LOCK_KEY = 0x6879_6F70
+
+
+def migration(version: int):
+    def register(fn: Callable) -> Callable:
+        _MIGRATIONS.append((version, fn))
+        _MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def latest_version() -> int:
+    return _MIGRATIONS[-1][0] if _MIGRATIONS else 0
+
+
+def run_migrations(conn) -> None:
+    """Apply every migration newer than the database's schema_version."""
+    cur = conn.cursor()  # raw cursor: DDL below is native PostgreSQL, not translated
+    try:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_KEY,))
+        cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        cur.execute("SELECT max(version) AS version FROM schema_version")
+        current = cur.fetchone()["version"] or 0
+        for version, fn in _MIGRATIONS:
+            if version > current:
+                fn(cur)
+                cur.execute("INSERT INTO schema_version (version) VALUES (%s)", (version,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# ── helpers ────────────────────────────────────────────────────────────────
+
+def _try(cur, sql: str) -> bool:
+    """Run an optional statement; on failure undo just that statement and report False."""
+    cur.execute("SAVEPOINT optional_step")
+    try:
+        cur.execute(sql)
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT optional_step")
+        return False
+    finally:
+        cur.execute("RELEASE SAVEPOINT optional_step")
+    return True
+
+
+# ── migrations ─────────────────────────────────────────────────────────────
+
+@migration(7)
+def _baseline(cur) -> None:
+    """Schema of SQLite version 7: base tables, indexes, counters and JSON side tables."""
+    # Case-insensitive ordering and equality, the counterpart of SQLite's NOCASE;
+    # unquoted `COLLATE NOCASE` in the app's SQL folds to this name. Servers
+    # built without ICU get a copy of "C" so the SQL still runs, case-sensitively.
+    if not _try(cur, "CREATE COLLATION IF NOT EXISTS nocase "
+                     "(provider = icu, locale = 'und-u-ks-level2', deterministic = false)"):
+        cur.execute('CREATE COLLATION IF NOT EXISTS nocase FROM "C"')
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS organizations (
+        id            TEXT PRIMARY KEY,
+        name          TEXT NOT NULL UNIQUE,
+        account_types TEXT NOT NULL DEFAULT '["partner"]',
+        created_at    TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS users (
+        id               TEXT PRIMARY KEY,
+        firstname        TEXT NOT NULL,
+        lastname         TEXT NOT NULL,
+        email            TEXT NOT NULL UNIQUE,
+        languages        TEXT NOT NULL DEFAULT '[]',
+        skills           TEXT NOT NULL DEFAULT '[]',
+        roles            TEXT NOT NULL DEFAULT '[]',
+        organization_id  TEXT REFERENCES organizations(id),
+        app_role         TEXT NOT NULL DEFAULT 'user' CHECK (app_role IN ('admin', 'user', 'partner_admin')),
+        password_hash    TEXT NOT NULL,
+        metabase_user_id BIGINT,
+        created_at       TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS studio_companies (
+        id              TEXT PRIMARY KEY,
+        organization_id TEXT NOT NULL REFERENCES organizations(id),
+        studio_id       TEXT NOT NULL UNIQUE,
+        name            TEXT NOT NULL,
+        environment     TEXT NOT NULL CHECK (environment IN ('test', 'prod')),
+        created_at      TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS user_studio_access (
+        id                TEXT PRIMARY KEY,
+        user_id           TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        studio_company_id TEXT NOT NULL REFERENCES studio_companies(id) ON DELETE CASCADE,
+        granted_at        TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS'),
+        revoked_at        TEXT,
+        UNIQUE (user_id, studio_company_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS system_groups (
+        id              TEXT PRIMARY KEY,
+        organization_id TEXT NOT NULL REFERENCES organizations(id),
+        tool            TEXT NOT NULL,
+        external_name   TEXT NOT NULL,
+        external_id     TEXT,
+        created_at      TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS'),
+        UNIQUE (organization_id, tool)
+    );
+
+    CREATE TABLE IF NOT EXISTS organization_integrations (
+        id                      TEXT PRIMARY KEY,
+        organization_id         TEXT NOT NULL UNIQUE REFERENCES organizations(id),
+        keycloak_confirmed      INTEGER DEFAULT 0,
+        keycloak_cluster        TEXT,
+        metabase_collection_id  TEXT,
+        lms_confirmed           INTEGER DEFAULT 0,
+        updated_at              TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS resources (
+        id          TEXT PRIMARY KEY,
+        name        TEXT NOT NULL UNIQUE,
+        type        TEXT,
+        has_api     INTEGER DEFAULT 1,
+        created_at  TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_definitions (
+        id          TEXT PRIMARY KEY,
+        name        TEXT NOT NULL UNIQUE,
+        description TEXT,
+        created_at  TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_step_definitions (
+        id                     TEXT PRIMARY KEY,
+        workflow_definition_id TEXT NOT NULL REFERENCES workflow_definitions(id),
+        step_order             INTEGER NOT NULL,
+        name                   TEXT NOT NULL,
+        label                  TEXT NOT NULL,
+        type                   TEXT NOT NULL CHECK (type IN ('auto', 'manual')),
+        description            TEXT,
+        UNIQUE (workflow_definition_id, step_order)
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_executions (
+        id                     TEXT PRIMARY KEY,
+        workflow_definition_id TEXT NOT NULL REFERENCES workflow_definitions(id),
+        organization_id        TEXT REFERENCES organizations(id),
+        user_id                TEXT REFERENCES users(id),
+        requested_by           TEXT REFERENCES users(id),
+        status                 TEXT NOT NULL DEFAULT 'pending'
+                               CHECK (status IN ('pending','running','awaiting_input','completed','failed')),
+        current_step_order     INTEGER DEFAULT 1,
+        created_at             TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS'),
+        completed_at           TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_step_executions (
+        id                 TEXT PRIMARY KEY,
+        execution_id       TEXT NOT NULL REFERENCES workflow_executions(id),
+        step_definition_id TEXT NOT NULL REFERENCES workflow_step_definitions(id),
+        step_order         INTEGER NOT NULL,
+        status             TEXT NOT NULL DEFAULT 'pending'
+                           CHECK (status IN ('pending','running','awaiting_input','completed','failed','skipped')),
+        manual_input       TEXT,
+        output             TEXT,
+        error              TEXT,
+        completed_by       TEXT REFERENCES users(id),
+        started_at         TEXT,
+        completed_at       TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS access_grants (
+        id           TEXT PRIMARY KEY,
+        user_id      TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        resource_id  TEXT NOT NULL REFERENCES resources(id),
+        permission   TEXT NOT NULL DEFAULT 'read'
+                     CHECK (permission IN ('read','write','admin')),
+        granted_by   TEXT REFERENCES users(id),
+        granted_at   TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS'),
+        revoked_at   TEXT,
+        execution_id TEXT REFERENCES workflow_executions(id),
+        UNIQUE (user_id, resource_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS user_studio_companies (
+        id         TEXT PRIMARY KEY,
+        user_id    TEXT NOT NULL UNIQUE REFERENCES users(id) ON DELETE CASCADE,
+        studio_id  TEXT NOT NULL UNIQUE,
+        name       TEXT NOT NULL,
+        created_at TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS organization_documentation (
+        id              TEXT PRIMARY KEY,
+        organization_id TEXT NOT NULL UNIQUE REFERENCES organizations(id),
+        internal_docu   TEXT,
+        generique_docu  TEXT,
+        add_docu        TEXT,
+        updated_at      TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_wse_execution_status_order
+        ON workflow_step_executions (execution_id, status, step_order);
+    CREATE INDEX IF NOT EXISTS idx_wse_completed_by
+        ON workflow_step_executions (completed_by) WHERE completed_by IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_we_created ON workflow_executions (created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_we_status_created ON workflow_executions (status, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_we_org_created ON workflow_executions (organization_id, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_we_workflow_created
+        ON workflow_executions (workflow_definition_id, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_we_user ON workflow_executions (user_id) WHERE user_id IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_we_requested_by
+        ON workflow_executions (requested_by) WHERE requested_by IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_users_org_created_id ON users (organization_id, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_organizations_name_nocase ON organizations (name COLLATE nocase, id);
+    CREATE INDEX IF NOT EXISTS idx_studio_companies_org ON studio_companies (organization_id);
+    CREATE INDEX IF NOT EXISTS idx_user_studio_access_company ON user_studio_access (studio_company_id);
+    CREATE INDEX IF NOT EXISTS idx_access_grants_granted_by
+        ON access_grants (granted_by) WHERE granted_by IS NOT NULL;
+
+    -- Per-status execution counters ('' = all), see SQLite migration 6.
+    CREATE TABLE IF NOT EXISTS execution_counts (
+        organization_id        TEXT NOT NULL DEFAULT '',
+        workflow_definition_id TEXT NOT NULL DEFAULT '',
+        status                 TEXT NOT NULL,
+        count                  INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (organization_id, workflow_definition_id, status)
+    );
+
+    CREATE OR REPLACE FUNCTION count_execution() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE execution_counts SET count = count - 1
+            WHERE status = OLD.status
+              AND organization_id IN ('', coalesce(OLD.organization_id, ''))
+              AND workflow_definition_id IN ('', OLD.workflow_definition_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO execution_counts AS ec (organization_id, workflow_definition_id, status, count)
+            SELECT o.id, w.id, NEW.status, 1
+            FROM (SELECT '' AS id UNION ALL SELECT NEW.organization_id WHERE NEW.organization_id IS NOT NULL) AS o,
+                 (SELECT '' AS id UNION ALL SELECT NEW.workflow_definition_id) AS w
+            ON CONFLICT (organization_id, workflow_definition_id, status) DO UPDATE SET count = ec.count + 1;
+        END IF;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_we_count_insert_delete ON workflow_executions;
+    CREATE TRIGGER trg_we_count_insert_delete
+        AFTER INSERT OR DELETE ON workflow_executions
+        FOR EACH ROW EXECUTE FUNCTION count_execution();
+    DROP TRIGGER IF EXISTS trg_we_count_update ON workflow_executions;
+    CREATE TRIGGER trg_we_count_update
+        AFTER UPDATE OF status, organization_id, workflow_definition_id ON workflow_executions
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status
+              OR OLD.organization_id IS DISTINCT FROM NEW.organization_id
+              OR OLD.workflow_definition_id IS DISTINCT FROM NEW.workflow_definition_id)
+        EXECUTE FUNCTION count_execution();
+
+    -- JSON side tables, see SQLite migration 7.
+    CREATE OR REPLACE FUNCTION try_jsonb(doc TEXT) RETURNS jsonb LANGUAGE plpgsql IMMUTABLE AS $$
+    BEGIN
+        RETURN doc::jsonb;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END $$;
+
+    -- Scalar JSON value as text, with booleans as 1/0 like SQLite's json_each.
+    CREATE OR REPLACE FUNCTION jsonb_scalar_text(v jsonb) RETURNS TEXT LANGUAGE sql IMMUTABLE AS $$
+        SELECT CASE jsonb_typeof(v)
+                   WHEN 'boolean' THEN CASE WHEN v::boolean THEN '1' ELSE '0' END
+                   ELSE v #>> '{}'
+               END
+    $$;
+
+    CREATE TABLE IF NOT EXISTS user_attributes (
+        kind    TEXT NOT NULL CHECK (kind IN ('language', 'skill', 'role')),
+        value   TEXT COLLATE nocase NOT NULL,
+        user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        PRIMARY KEY (kind, value, user_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_attributes_user ON user_attributes (user_id);
+
+    CREATE OR REPLACE FUNCTION index_user_attributes() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            DELETE FROM user_attributes WHERE user_id = OLD.id;
+        END IF;
+        INSERT INTO user_attributes (kind, value, user_id)
+        SELECT a.kind, e.v #>> '{}', NEW.id
+        FROM (VALUES ('language', try_jsonb(NEW.languages)),
+                     ('skill', try_jsonb(NEW.skills)),
+                     ('role', try_jsonb(NEW.roles))) AS a(kind, doc)
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(a.doc) = 'array' THEN a.doc ELSE '[]'::jsonb END) AS e(v)
+        WHERE jsonb_typeof(e.v) = 'string'
+        ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_users_attributes ON users;
+    CREATE TRIGGER trg_users_attributes
+        AFTER INSERT OR UPDATE OF languages, skills, roles ON users
+        FOR EACH ROW EXECUTE FUNCTION index_user_attributes();
+
+    CREATE TABLE IF NOT EXISTS step_values (
+        key               TEXT NOT NULL,
+        value             TEXT NOT NULL,
+        source            TEXT NOT NULL CHECK (source IN ('output', 'manual_input')),
+        step_execution_id TEXT NOT NULL REFERENCES workflow_step_executions(id) ON DELETE CASCADE,
+        execution_id      TEXT NOT NULL,
+        PRIMARY KEY (key, value, step_execution_id, source)
+    );
+    CREATE INDEX IF NOT EXISTS idx_step_values_step ON step_values (step_execution_id);
+
+    CREATE OR REPLACE FUNCTION index_step_values() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            DELETE FROM step_values WHERE step_execution_id = OLD.id;
+        END IF;
+        INSERT INTO step_values (step_execution_id, execution_id, source, key, value)
+        SELECT NEW.id, NEW.execution_id, s.source, e.key, jsonb_scalar_text(e.value)
+        FROM (VALUES ('output', try_jsonb(NEW.output)),
+                     ('manual_input', try_jsonb(NEW.manual_input))) AS s(source, doc)
+        CROSS JOIN LATERAL jsonb_each(
+            CASE WHEN jsonb_typeof(s.doc) = 'object' THEN s.doc ELSE '{}'::jsonb END) AS e
+        WHERE jsonb_typeof(e.value) NOT IN ('object', 'array', 'null')
+        ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_wse_values ON workflow_step_executions;
+    CREATE TRIGGER trg_wse_values
+        AFTER INSERT OR UPDATE OF output, manual_input ON workflow_step_executions
+        FOR EACH ROW EXECUTE FUNCTION index_step_values();
+    """)
+
+    # Prefix search: the app's LIKE becomes ILIKE here, which only trigram
+    # indexes can serve. pg_trgm ships with contrib; without it search scans.
+    if _try(cur, "CREATE EXTENSION IF NOT EXISTS pg_trgm"):
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_users_lastname_trgm ON users USING gin (lastname gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_organizations_name_trgm ON organizations USING gin (name gin_trgm_ops);
+        """)
+
+
+@migration(8)
+def _access_grants_soft_execution_ref(cur) -> None:
+    """access_grants.execution_id may point at an archived execution, see SQLite migration 8."""
+    cur.execute("ALTER TABLE access_grants DROP CONSTRAINT IF EXISTS access_grants_execution_id_fkey")
+
+
+@migration(9)
+def _execution_archive(cur) -> None:
+    """Archive tables for finished executions, see SQLite migration 9."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS workflow_executions_archive (
+        id                     TEXT PRIMARY KEY,
+        workflow_definition_id TEXT NOT NULL,
+        organization_id        TEXT,
+        user_id                TEXT,
+        requested_by           TEXT,
+        status                 TEXT NOT NULL,
+        current_step_order     INTEGER,
+        created_at             TEXT,
+        completed_at           TEXT,
+        archived_at            TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+    );
+
+    CREATE TABLE IF NOT EXISTS workflow_step_executions_archive (
+        id                 TEXT PRIMARY KEY,
+        execution_id       TEXT NOT NULL,
+        step_definition_id TEXT NOT NULL,
+        step_order         INTEGER NOT NULL,
+        status             TEXT NOT NULL,
+        manual_input       TEXT,
+        output             TEXT,
+        error              TEXT,
+        completed_by       TEXT,
+        started_at         TEXT,
+        completed_at       TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_wse_archive_execution
+        ON workflow_step_executions_archive (execution_id, step_order);
+
+    -- Archived executions stay counted.
+    CREATE OR REPLACE FUNCTION count_execution() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' AND EXISTS (SELECT 1 FROM workflow_executions_archive WHERE id = OLD.id) THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE execution_counts SET count = count - 1
+            WHERE status = OLD.status
+              AND organization_id IN ('', coalesce(OLD.organization_id, ''))
+              AND workflow_definition_id IN ('', OLD.workflow_definition_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO execution_counts AS ec (organization_id, workflow_definition_id, status, count)
+            SELECT o.id, w.id, NEW.status, 1
+            FROM (SELECT '' AS id UNION ALL SELECT NEW.organization_id WHERE NEW.organization_id IS NOT NULL) AS o,
+                 (SELECT '' AS id UNION ALL SELECT NEW.workflow_definition_id) AS w
+            ON CONFLICT (organization_id, workflow_definition_id, status) DO UPDATE SET count = ec.count + 1;
+        END IF;
+        RETURN NULL;
+    END $$;
+    """)
+
+
+@migration(10)
+def _full_text_search(cur) -> None:
+    """
+    Search documents for GET /api/search, see SQLite migration 10. A generated
+    tsvector with a GIN index stands in for FTS5; punctuation is blanked out
+    first so emails split into words the way FTS5's tokenizer splits them.
+    """
+    cur.execute("""
+    CREATE OR REPLACE FUNCTION search_words(doc TEXT) RETURNS TEXT LANGUAGE sql IMMUTABLE AS $$
+        SELECT regexp_replace(lower(coalesce(doc, '')), '[^[:alnum:]]+', ' ', 'g')
+    $$;
+
+    CREATE TABLE IF NOT EXISTS search_documents (
+        id        BIGSERIAL PRIMARY KEY,
+        kind      TEXT NOT NULL CHECK (kind IN ('user', 'organization', 'step')),
+        ref_id    TEXT NOT NULL,
+        parent_id TEXT,
+        title     TEXT NOT NULL,
+        body      TEXT NOT NULL DEFAULT '',
+        document  tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', search_words(title)), 'A')
+            || setweight(to_tsvector('simple', search_words(body)), 'B')
+        ) STORED,
+        UNIQUE (kind, ref_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_search_documents ON search_documents USING gin (document);
+
+    CREATE TABLE IF NOT EXISTS error_documents (
+        id                BIGSERIAL PRIMARY KEY,
+        step_execution_id TEXT NOT NULL UNIQUE,
+        execution_id      TEXT NOT NULL,
+        error             TEXT NOT NULL,
+        document          tsvector GENERATED ALWAYS AS (to_tsvector('simple', search_words(error))) STORED
+    );
+    CREATE INDEX IF NOT EXISTS idx_error_documents ON error_documents USING gin (document);
+
+    CREATE OR REPLACE FUNCTION index_search_document() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        doc_kind TEXT := TG_ARGV[0];
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM search_documents WHERE kind = doc_kind AND ref_id = OLD.id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF TG_TABLE_NAME = 'users' THEN
+                INSERT INTO search_documents (kind, ref_id, parent_id, title, body)
+                VALUES (doc_kind, NEW.id, NEW.organization_id, NEW.firstname || ' ' || NEW.lastname, NEW.email);
+            ELSIF TG_TABLE_NAME = 'organizations' THEN
+                INSERT INTO search_documents (kind, ref_id, parent_id, title, body)
+                VALUES (doc_kind, NEW.id, NULL, NEW.name, '');
+            ELSE
+                INSERT INTO search_documents (kind, ref_id, parent_id, title, body)
+                VALUES (doc_kind, NEW.id, NEW.workflow_definition_id, NEW.label, NEW.name);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_users_search ON users;
+    CREATE TRIGGER trg_users_search
+        AFTER INSERT OR DELETE OR UPDATE OF firstname, lastname, email, organization_id ON users
+        FOR EACH ROW EXECUTE FUNCTION index_search_document('user');
+    DROP TRIGGER IF EXISTS trg_organizations_search ON organizations;
+    CREATE TRIGGER trg_organizations_search
+        AFTER INSERT OR DELETE OR UPDATE OF name ON organizations
+        FOR EACH ROW EXECUTE FUNCTION index_search_document('organization');
+    DROP TRIGGER IF EXISTS trg_workflow_step_definitions_search ON workflow_step_definitions;
+    CREATE TRIGGER trg_workflow_step_definitions_search
+        AFTER INSERT OR DELETE OR UPDATE OF workflow_definition_id, name, label ON workflow_step_definitions
+        FOR EACH ROW EXECUTE FUNCTION index_search_document('step');
+
+    CREATE OR REPLACE FUNCTION index_error_document() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM error_documents WHERE step_execution_id = OLD.id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.error IS NOT NULL THEN
+            INSERT INTO error_documents (step_execution_id, execution_id, error)
+            VALUES (NEW.id, NEW.execution_id, NEW.error);
+        END IF;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_wse_search ON workflow_step_executions;
+    CREATE TRIGGER trg_wse_search
+        AFTER INSERT OR DELETE OR UPDATE OF error ON workflow_step_executions
+        FOR EACH ROW EXECUTE FUNCTION index_error_document();
+
+    -- Backfill existing rows.
+    INSERT INTO search_documents (kind, ref_id, parent_id, title, body)
+    SELECT 'user', id, organization_id, firstname || ' ' || lastname, email FROM users
+    UNION ALL
+    SELECT 'organization', id, NULL, name, '' FROM organizations
+    UNION ALL
+    SELECT 'step', id, workflow_definition_id, label, name FROM workflow_step_definitions
+    ON CONFLICT DO NOTHING;
+    INSERT INTO error_documents (step_execution_id, execution_id, error)
+    SELECT id, execution_id, error FROM workflow_step_executions WHERE error IS NOT NULL
+    ON CONFLICT DO NOTHING;
+    """)
+
+
+@migration(11)
+def _step_dependencies(cur) -> None:
+    """Steps declare the steps they wait for, see SQLite migration 11."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS workflow_step_dependencies (
+        step_definition_id TEXT NOT NULL REFERENCES workflow_step_definitions(id) ON DELETE CASCADE,
+        depends_on_id      TEXT NOT NULL REFERENCES workflow_step_definitions(id) ON DELETE CASCADE,
+        PRIMARY KEY (step_definition_id, depends_on_id)
+    )
+    """)
+    for sql in step_dependency_backfill():
+        cur.execute(sql)
+
+
+@migration(12)
+def _ordered_execution_count_locks(cur) -> None:
+    """
+    PostgreSQL only (SQLite runs one writer at a time): a status change
+    decrements the old status' counters, then increments the new one's. Two
+    executions moving between the same statuses in opposite directions, as
+    parallel engine advances do, took those row locks in opposite orders and
+    deadlocked. Lock them all in one fixed order first; otherwise as in 9.
+    """
+    cur.execute("""
+    CREATE OR REPLACE FUNCTION count_execution() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' AND EXISTS (SELECT 1 FROM workflow_executions_archive WHERE id = OLD.id) THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'UPDATE' THEN
+            PERFORM 1 FROM execution_counts
+            WHERE (status = OLD.status
+                   AND organization_id IN ('', coalesce(OLD.organization_id, ''))
+                   AND workflow_definition_id IN ('', OLD.workflow_definition_id))
+               OR (status = NEW.status
+                   AND organization_id IN ('', coalesce(NEW.organization_id, ''))
+                   AND workflow_definition_id IN ('', NEW.workflow_definition_id))
+            ORDER BY organization_id, workflow_definition_id, status
+            FOR UPDATE;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE execution_counts SET count = count - 1
+            WHERE status = OLD.status
+              AND organization_id IN ('', coalesce(OLD.organization_id, ''))
+              AND workflow_definition_id IN ('', OLD.workflow_definition_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO execution_counts AS ec (organization_id, workflow_definition_id, status, count)
+            SELECT o.id, w.id, NEW.status, 1
+            FROM (SELECT '' AS id UNION ALL SELECT NEW.organization_id WHERE NEW.organization_id IS NOT NULL) AS o,
+                 (SELECT '' AS id UNION ALL SELECT NEW.workflow_definition_id) AS w
+            ON CONFLICT (organization_id, workflow_definition_id, status) DO UPDATE SET count = ec.count + 1;
+        END IF;
+        RETURN NULL;
+    END $$;
+    """)
+
+
+@migration(13)
+def _execution_contexts(cur) -> None:
+    """Merged context per execution, see SQLite migration 13."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS execution_contexts (
+        execution_id TEXT PRIMARY KEY REFERENCES workflow_executions(id) ON DELETE CASCADE,
+        context      TEXT NOT NULL DEFAULT '{}'
+    );
+    INSERT INTO execution_contexts (execution_id)
+    SELECT id FROM workflow_executions WHERE status <> 'completed'
+    ON CONFLICT DO NOTHING;
+    """)
+    contexts = merged_step_contexts(cur, """
+        SELECT s.execution_id, s.step_order, s.output, s.manual_input
+        FROM workflow_step_executions s
+        JOIN workflow_executions we ON we.id = s.execution_id
+        WHERE we.status <> 'completed' AND s.status = 'completed'
+        ORDER BY s.execution_id, s.step_order
+    """)
+    for execution_id, (ctx, _) in contexts.items():
+        cur.execute(
+            "UPDATE execution_contexts SET context = %s WHERE execution_id = %s",
+            (json.dumps(ctx), execution_id)
+        )
+
+
+@migration(14)
+def _step_leases(cur) -> None:
+    """Leases on running steps, with a grace lease for those already running; see SQLite migration 14."""
+    cur.execute("""
+    ALTER TABLE workflow_step_executions
+        ADD COLUMN IF NOT EXISTS lease_owner TEXT,
+        ADD COLUMN IF NOT EXISTS lease_expires_at TEXT;
+    ALTER TABLE workflow_step_executions_archive
+        ADD COLUMN IF NOT EXISTS lease_owner TEXT,
+        ADD COLUMN IF NOT EXISTS lease_expires_at TEXT;
+    CREATE INDEX IF NOT EXISTS idx_wse_running_lease
+        ON workflow_step_executions (lease_expires_at) WHERE status = 'running';
+    """)
+    cur.execute(
+        "UPDATE workflow_step_executions SET lease_expires_at = %s WHERE status = 'running'",
+        (lease_grace(),)
+    )
+
+
+@migration(15)
+def _context_key_orders(cur) -> None:
+    """Which step set each context key, see SQLite migration 15."""
+    cur.execute("ALTER TABLE execution_contexts ADD COLUMN IF NOT EXISTS key_orders TEXT NOT NULL DEFAULT '{}'")
+    contexts = merged_step_contexts(cur, """
+        SELECT s.execution_id, s.step_order, s.output, s.manual_input
+        FROM workflow_step_executions s
+        JOIN execution_contexts c ON c.execution_id = s.execution_id
+        JOIN workflow_executions we ON we.id = s.execution_id
+        WHERE we.status <> 'completed' AND s.status = 'completed'
+        ORDER BY s.execution_id, s.step_order
+    """)
+    for execution_id, (ctx, orders) in contexts.items():
+        cur.execute(
+            "UPDATE execution_contexts SET context = %s, key_orders = %s WHERE execution_id = %s",
+            (json.dumps(ctx), json.dumps(orders), execution_id)
+        )
+
+
+_EPOCH_MS_NOW = "(extract(epoch FROM now()) * 1000)::bigint"
+
+
+@migration(16)
+def _binary_execution_keys(cur) -> None:
+    """
+    Execution keys as bytea and timestamps as bigint epoch milliseconds, see
+    SQLite migration 16. Foreign keys into the two hot tables come off while
+    the types change and go back on after; indexes are rebuilt by PostgreSQL.
+    """
+    cur.execute("""
+        SELECT conrelid::regclass::text AS tbl, conname, pg_get_constraintdef(oid) AS def
+        FROM pg_constraint
+        WHERE contype = 'f'
+          AND confrelid IN ('workflow_executions'::regclass, 'workflow_step_executions'::regclass)
+    """)
+    foreign_keys = cur.fetchall()
+    for fk in foreign_keys:
+        cur.execute(f"ALTER TABLE {fk['tbl']} DROP CONSTRAINT {fk['conname']}")
+    for table, keys in EXECUTION_KEY_COLUMNS.items():
+        times = EXECUTION_TIME_COLUMNS.get(table, ())
+        # The ISO text defaults can't be cast along with the column.
+        for column in times:
+            cur.execute(f"ALTER TABLE {table} ALTER COLUMN {column} DROP DEFAULT")
+        changes = [f"ALTER COLUMN {c} TYPE bytea USING decode(replace({c}, '-', ''), 'hex')" for c in keys]
+        changes += [
+            f"ALTER COLUMN {c} TYPE bigint USING round(extract(epoch FROM {c}::timestamp) * 1000)::bigint"
+            for c in times
+        ]
+        cur.execute(f"ALTER TABLE {table} {', '.join(changes)}")
+    cur.execute(f"""
+    ALTER TABLE workflow_executions ALTER COLUMN created_at SET DEFAULT {_EPOCH_MS_NOW};
+    ALTER TABLE workflow_executions_archive ALTER COLUMN archived_at SET DEFAULT {_EPOCH_MS_NOW};
+    """)
+    for fk in foreign_keys:
+        cur.execute(f"ALTER TABLE {fk['tbl']} ADD CONSTRAINT {fk['conname']} {fk['def']}")
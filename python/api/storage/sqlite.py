@@ -0,0 +1,193 @@
+"""
+SQLite backend: a file database in WAL mode behind a small connection pool.
+
+With HYOPPS_EXEC_DB_PATH set, the execution tables (api.migrations.EXECUTION_TABLES)
+live in a second file, attached to every connection as schema `exec`. Each
+file has its own WAL, checkpoints and vacuum, and a write transaction only
+locks the file it writes to. The split is one-way: once moved, the tables
+stay in the second file, so the variable must stay set.
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from .base import Backend, OwnThreadMixin
+from ..migrations import run_migrations, split_execution_tables
+
+DB_PATH = os.getenv(
+    "HYOPPS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "hyopps_py.db"),
+)
+
+# Optional second file for the execution tables; empty keeps everything in DB_PATH.
+EXEC_DB_PATH = os.getenv("HYOPPS_EXEC_DB_PATH", "")
+
+# Idle connections kept open for reuse. Bursts beyond this open short-lived
+# extra connections instead of blocking, so the engine can never deadlock
+# against request handlers waiting on the pool.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# Page cache per connection in KiB (negative cache_size = KiB, not pages).
+DB_CACHE_SIZE_KIB = int(os.getenv("DB_CACHE_SIZE_KIB", "16384"))
+# Memory-mapped I/O window in bytes; 0 disables mmap.
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Seconds SQLite itself retries a locked database before reporting BUSY.
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+# Seconds a write may wait for its turn (in-process queue plus BUSY retries)
+# before failing with "database is locked".
+DB_WRITE_TIMEOUT = float(os.getenv("DB_WRITE_TIMEOUT", "30"))
+
+# Statements that make Python's sqlite3 open a transaction implicitly.
+_WRITE = re.compile(r"^\s*(?:--[^\n]*\n\s*)*(?:INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def _configure_schema(conn: sqlite3.Connection, schema: str) -> None:
+    """Per-file pragmas, for the main database and each attached one."""
+    if conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0] == 0:
+        # New file: lets the maintenance task hand free pages back in small
+        # steps. Can only be set before the first table exists, and setting it
+        # on an existing database would take the write lock.
+        conn.execute(f"PRAGMA {schema}.auto_vacuum=INCREMENTAL")
+    conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    # NORMAL is durable across application crashes in WAL mode and skips the
+    # fsync on every commit; only the last transactions can roll back on power loss.
+    conn.execute(f"PRAGMA {schema}.synchronous=NORMAL")
+    conn.execute(f"PRAGMA {schema}.cache_size=-{DB_CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA {schema}.mmap_size={DB_MMAP_SIZE}")
+
+
+def _configure(conn: sqlite3.Connection, exec_path: str = "") -> None:
+    """Apply per-connection pragmas. Runs once when the pool opens a connection."""
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    _configure_schema(conn, "main")
+    if exec_path:
+        conn.execute("ATTACH DATABASE ? AS exec", (exec_path,))
+        _configure_schema(conn, "exec")
+
+
+class PooledConnection(OwnThreadMixin, sqlite3.Connection):
+    """
+    sqlite3 connection that owns the worker thread its async calls run on.
+
+    Write transactions are serialized per process: the first INSERT / UPDATE /
+    DELETE of a transaction waits for the backend's write lock and then opens
+    the transaction with BEGIN IMMEDIATE; commit() or rollback() hands the lock
+    on. Writers queue instead of racing into SQLITE_BUSY, and a transaction
+    never has to upgrade a stale read snapshot to a write (which fails at once,
+    whatever the busy timeout). Reads don't take the lock and run in parallel.
+    """
+
+    write_lock: Optional[threading.Lock] = None
+    split = False
+    _writing = False
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        if self.write_lock is not None and not self.in_transaction and _WRITE.match(sql):
+            self._begin_write()
+        return super().execute(sql, parameters)
+
+    def _begin_write(self) -> None:
+        deadline = time.monotonic() + DB_WRITE_TIMEOUT
+        if not self.write_lock.acquire(timeout=DB_WRITE_TIMEOUT):
+            raise sqlite3.OperationalError("database is locked (timed out waiting for the write lock)")
+        delay = 0.01
+        while True:
+            try:
+                # With two files, BEGIN IMMEDIATE would lock both; a deferred
+                # BEGIN followed at once by the write locks just the file
+                # written. Nothing was read yet, so no stale snapshot can make
+                # that write fail, and in-process writers still queue on the lock.
+                super().execute("BEGIN" if self.split else "BEGIN IMMEDIATE")
+                self._writing = True
+                return
+            except sqlite3.OperationalError as e:
+                # Another process holds the lock past the busy timeout: back off and retry.
+                if "locked" not in str(e) or time.monotonic() + delay > deadline:
+                    self.write_lock.release()
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def _end_write(self) -> None:
+        if self._writing and not self.in_transaction:
+            self._writing = False
+            self.write_lock.release()
+
+    def commit(self) -> None:
+        try:
+            super().commit()
+        finally:
+            self._end_write()
+
+    def rollback(self) -> None:
+        try:
+            super().rollback()
+        finally:
+            self._end_write()
+
+    def close(self) -> None:
+        if self._writing:
+            self.rollback()
+        self._shutdown_executor()
+        super().close()
+
+
+class SQLiteBackend(Backend):
+    """Thread-safe pool of configured SQLite connections for a single database file."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DB_PATH, size: int = DB_POOL_SIZE, exec_path: str = EXEC_DB_PATH):
+        self.path = path
+        self.exec_path = exec_path
+        self._write_lock = threading.Lock()
+        self._idle: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue(maxsize=size)
+
+    def _connect(self) -> PooledConnection:
+        for path in filter(None, (self.path, self.exec_path)):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(
+            self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False, factory=PooledConnection
+        )
+        _configure(conn, self.exec_path)
+        conn.write_lock = self._write_lock
+        conn.split = bool(self.exec_path)
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: PooledConnection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def schemas(self) -> list[str]:
+        """Attached schema names, main first."""
+        return ["main", "exec"] if self.exec_path else ["main"]
+
+    def schema_path(self, schema: str) -> str:
+        return self.exec_path if schema == "exec" else self.path
+
+    def migrate(self, conn: PooledConnection) -> None:
+        run_migrations(conn)
+        split_execution_tables(conn, bool(self.exec_path))
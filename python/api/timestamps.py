@@ -0,0 +1,34 @@
+"""
+Timestamps of the execution tables: integer milliseconds since the Unix
+epoch, UTC (see migration 16). An 8-byte integer instead of a 26-character
+ISO string keeps their indexes small and compares as a number.
+
+The API still reads and writes ISO-8601 text (naive, UTC): to_iso() formats
+a stored value for a response and to_ms() parses a filter or cursor value.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
+
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+
+
+def now_ms() -> int:
+    return to_ms(datetime.utcnow())
+
+
+def to_ms(value: Union[datetime, str]) -> int:
+    """Milliseconds for a naive UTC datetime or an ISO date / datetime string; ValueError if unparsable."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MS
+
+
+def to_iso(ms: Optional[int]) -> Optional[str]:
+    """ISO-8601 text, to the millisecond, for a stored value; None stays None."""
+    if ms is None:
+        return None
+    return (_EPOCH + ms * _MS).isoformat(timespec="milliseconds")
@@ -46,8 +46,8 @@ def _headers():
     return {}
 
 
-def api_get(path: str) -> Union[list, dict]:
-    resp = requests.get(f"{API_URL}{path}", headers=_headers(), timeout=10)
+def api_get(path: str, params: dict = None) -> Union[list, dict]:
+    resp = requests.get(f"{API_URL}{path}", params=params, headers=_headers(), timeout=10)
     resp.raise_for_status()
     return resp.json()
 
@@ -70,6 +70,55 @@ def api_delete(path: str) -> dict:
     return resp.json()
 
 
+# ── Cursor paging ──────────────────────────────────────────────────────────
+# List endpoints return {"items": [...], "next_cursor": ...}. Each paged view
+# keeps a stack of cursors in session state so it can step back and forth.
+
+PAGE_SIZE = 25
+
+
+def api_get_page(path: str, state_key: str, params: dict = None) -> dict:
+    """Fetch the page of `path` that the view `state_key` is currently on."""
+    cursors = st.session_state.setdefault(f"{state_key}_cursors", [None])
+    query = {k: v for k, v in (params or {}).items() if v not in (None, "")}
+    query["limit"] = PAGE_SIZE
+    if cursors[-1]:
+        query["cursor"] = cursors[-1]
+    return api_get(path, params=query)
+
+
+def reset_paging(state_key: str) -> None:
+    st.session_state.pop(f"{state_key}_cursors", None)
+
+
+def page_nav(page: dict, state_key: str) -> None:
+    """Render ← Newer / Older → buttons for a page returned by api_get_page."""
+    cursors = st.session_state.setdefault(f"{state_key}_cursors", [None])
+    if len(cursors) == 1 and not page.get("next_cursor"):
+        return
+    c1, _, c2 = st.columns([1, 4, 1])
+    with c1:
+        if st.button("← Previous", key=f"{state_key}_prev", disabled=len(cursors) == 1,
+                     use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with c2:
+        if st.button("Next →", key=f"{state_key}_next", disabled=not page.get("next_cursor"),
+                     use_container_width=True):
+            cursors.append(page["next_cursor"])
+            st.rerun()
+
+
+# Organization pickers search by name prefix instead of listing the whole directory.
+ORG_PICKER_LIMIT = 50
+
+
+def search_organizations(key: str) -> list:
+    """Render a name-prefix search box and return the matching organizations."""
+    q = st.text_input("Find organization", key=key, placeholder="Name starts with…")
+    return api_get("/api/organizations", params={"q": q or None, "limit": ORG_PICKER_LIMIT})["items"]
+
+
 def poll_until_stable(execution_id: str, base: str = "/api/executions", max_wait: float = 5.0) -> dict:
     """Poll execution until status is not 'running'."""
     deadline = time.time() + max_wait
@@ -142,6 +191,16 @@ def show_login():
                 st.error(f"Login failed: {e}")
 
 
+def count_badges(label: str, stats_path: str) -> str:
+    """Append awaiting-input / failed counts from a stats endpoint to a nav label."""
+    try:
+        counts = api_get(stats_path)["counts"]
+    except Exception:
+        return label
+    badges = [f"{icon} {counts[s]}" for s, icon in (("awaiting_input", "🟡"), ("failed", "🔴")) if counts.get(s)]
+    return "  ".join([label, *badges])
+
+
 # ── Admin Sidebar ──────────────────────────────────────────────────────────
 
 def show_sidebar():
@@ -152,7 +211,7 @@ def show_sidebar():
         st.divider()
 
         pages = {
-            "📋 Executions": "executions",
+            count_badges("📋 Executions", "/api/executions/stats"): "executions",
             "🏢 Organizations": "organizations",
             "👤 Users": "users",
         }
@@ -193,19 +252,19 @@ def show_executions():
                          type="primary" if selected_filter == f else "secondary",
                          key=f"filter_{f}"):
                 st.session_state["exec_filter"] = f
+                reset_paging("executions")
                 st.rerun()
 
     st.divider()
 
+    selected_filter = st.session_state.get("exec_filter", "all")
     try:
-        executions = api_get("/api/executions")
+        result = api_get_page("/api/executions", "executions",
+                              {"status": None if selected_filter == "all" else selected_filter})
     except Exception as e:
         st.error(f"Failed to load executions: {e}")
         return
-
-    selected_filter = st.session_state.get("exec_filter", "all")
-    if selected_filter != "all":
-        executions = [e for e in executions if e["status"] == selected_filter]
+    executions = result["items"]
 
     if not executions:
         st.info("No executions found.")
@@ -235,6 +294,8 @@ def show_executions():
                     st.session_state["page"] = "execution_detail"
                     st.rerun()
 
+    page_nav(result, "executions")
+
 
 # ── New Execution ──────────────────────────────────────────────────────────
 
@@ -312,6 +373,8 @@ def _show_execution_view(ex: dict, exec_api_base: str):
         st.metric("Step", f"{ex['current_step_order']}")
 
     st.caption(f"ID: `{ex['id']}` · Started: {ex['created_at'][:16] if ex['created_at'] else '—'}")
+    if ex.get("archived"):
+        st.info(f"Archived {ex['archived_at'][:10] if ex.get('archived_at') else ''} — read-only history.")
 
     if ex["status"] == "running":
         with st.spinner("Processing steps…"):
@@ -444,12 +507,15 @@ def _render_manual_form(step: dict, ex: dict, exec_api_base: str):
 
     elif step_name == "select_organization":
         try:
-            orgs = api_get("/api/organizations")
+            orgs = search_organizations(f"org_search_{step_id}")
         except Exception as e:
             st.error(str(e))
             return
         if not orgs:
-            st.warning("No organizations exist yet. Create a partner org first.")
+            if st.session_state.get(f"org_search_{step_id}"):
+                st.warning("No organization matches that name.")
+            else:
+                st.warning("No organizations exist yet. Create a partner org first.")
             return
         org_options = {o["name"]: o["id"] for o in orgs}
         with st.form(f"form_{step_id}"):
@@ -515,14 +581,20 @@ def show_organizations():
         _show_edit_org_form(editing_org)
         return
 
+    q = st.text_input("Search", key="orgs_q", placeholder="Name starts with…",
+                      on_change=reset_paging, args=("organizations",))
     try:
-        orgs = api_get("/api/organizations")
+        result = api_get_page("/api/organizations", "organizations", {"q": q})
     except Exception as e:
         st.error(str(e))
         return
+    orgs = result["items"]
 
     if not orgs:
-        st.info("No organizations yet. Start a New Partner Onboarding workflow to create one.")
+        if q:
+            st.info("No organizations match that name.")
+        else:
+            st.info("No organizations yet. Start a New Partner Onboarding workflow to create one.")
         return
 
     for org in orgs:
@@ -564,6 +636,8 @@ def show_organizations():
                     st.session_state.pop("confirm_delete_org", None)
                     st.rerun()
 
+    page_nav(result, "organizations")
+
 
 def _show_edit_org_form(org: dict):
     if st.button("← Back to Organizations"):
@@ -760,14 +834,17 @@ def show_users():
         _show_edit_user_form(editing_user)
         return
 
+    q = st.text_input("Search", key="users_q", placeholder="Email or last name starts with…",
+                      on_change=reset_paging, args=("users",))
     try:
-        users = api_get("/api/users")
+        result = api_get_page("/api/users", "users", {"q": q})
     except Exception as e:
         st.error(str(e))
         return
+    users = result["items"]
 
     if not users:
-        st.info("No users yet.")
+        st.info("No users match that search." if q else "No users yet.")
         return
 
     for user in users:
@@ -808,6 +885,8 @@ def show_users():
                     st.session_state.pop("confirm_delete_user", None)
                     st.rerun()
 
+    page_nav(result, "users")
+
 
 def _show_edit_user_form(user: dict):
     if st.button("← Back to Users"):
@@ -817,11 +896,14 @@ def _show_edit_user_form(user: dict):
     st.markdown(f"## Edit User — {user['firstname']} {user['lastname']}")
 
     try:
-        orgs = api_get("/api/organizations")
+        orgs = search_organizations("edit_user_org_q")
     except Exception:
         orgs = []
 
     org_options = {"— None —": None}
+    # Keep the user's current organization selectable whatever the search shows.
+    if user.get("organization_id") and user.get("organization_name"):
+        org_options[user["organization_name"]] = user["organization_id"]
     org_options.update({o["name"]: o["id"] for o in orgs})
     current_org_name = user.get("organization_name") or "— None —"
 
@@ -985,7 +1067,7 @@ def show_partner_sidebar():
         pages = {
             "🏠 Dashboard": "partner_dashboard",
             "➕ Add User": "partner_add_user",
-            "📋 Workflows": "partner_executions",
+            count_badges("📋 Workflows", "/api/partner/executions/stats"): "partner_executions",
         }
         current = st.session_state.get("page", "partner_dashboard")
         for label, key in pages.items():
@@ -1013,6 +1095,19 @@ def show_partner_dashboard():
     st.caption(" · ".join(overview.get("account_types", ["partner"])))
     st.divider()
 
+    try:
+        stats = api_get("/api/partner/executions/stats")
+    except Exception:
+        stats = None
+    if stats and stats["total"]:
+        st.markdown("### Onboarding Workflows")
+        mcols = st.columns(4)
+        for col, (status, label) in zip(mcols, [("running", "Running"), ("awaiting_input", "Awaiting Input"),
+                                                ("completed", "Completed"), ("failed", "Failed")]):
+            with col:
+                st.metric(label, stats["counts"][status])
+        st.divider()
+
     users = overview.get("users", [])
     st.markdown(f"### Team Members ({len(users)})")
 
@@ -1073,10 +1168,11 @@ def show_partner_executions():
     st.divider()
 
     try:
-        executions = api_get("/api/partner/executions")
+        result = api_get_page("/api/partner/executions", "partner_executions")
     except Exception as e:
         st.error(f"Failed to load workflows: {e}")
         return
+    executions = result["items"]
 
     if not executions:
         st.info("No onboarding workflows yet.")
@@ -1099,6 +1195,8 @@ def show_partner_executions():
                     st.session_state["page"] = "partner_execution_detail"
                     st.rerun()
 
+    page_nav(result, "partner_executions")
+
 
 def show_partner_execution_detail():
     exec_id = st.session_state.get("partner_viewing_exec_id")
@@ -0,0 +1,91 @@
+"""
+Shared fixtures: the API on a throwaway database.
+
+SQLite in a temporary directory by default; set DATABASE_URL to run the suite
+against an empty PostgreSQL database instead. Background jobs are off so
+tests see only the writes they make.
+"""
+
+import os
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="hyopps-tests-")
+os.environ.setdefault("HYOPPS_DB_PATH", os.path.join(_tmp, "hyopps_py.db"))
+for _name in ("ARCHIVE_AFTER_DAYS", "MAINTENANCE_INTERVAL", "BACKUP_INTERVAL", "ENGINE_RECOVERY_INTERVAL"):
+    os.environ.setdefault(_name, "0")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.database import connection, get_backend
+from api.main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    r = client.post("/api/auth/login", json={"email": "admin@hyopps.local", "password": "admin123"})
+    assert r.status_code == 200, r.text
+    return {"Authorization": f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture
+def backend_name(client) -> str:
+    return get_backend().name
+
+
+@pytest.fixture
+def wait_for(client, admin_headers):
+    """Poll an execution until `pred(execution)` holds; returns the execution."""
+    def wait(execution_id, pred, timeout=10.0, headers=None, base="/api/executions"):
+        deadline = time.monotonic() + timeout
+        while True:
+            execution = client.get(f"{base}/{execution_id}", headers=headers or admin_headers).json()
+            if pred(execution):
+                return execution
+            if time.monotonic() > deadline:
+                steps = [(s["step_name"], s["status"]) for s in execution.get("steps", [])]
+                raise AssertionError(f"execution {execution_id} stuck at {execution.get('status')}: {steps}")
+            time.sleep(0.05)
+    return wait
+
+
+@pytest.fixture
+def run_new_partner(client, admin_headers, wait_for):
+    """Drive a new_partner execution through its manual steps; returns the final execution."""
+    def run(org_name, finish=True):
+        r = client.post("/api/executions?wait=5", json={"workflow_type": "new_partner"}, headers=admin_headers)
+        assert r.status_code in (201, 202), r.text
+        execution_id = r.json()["id"]
+        inputs = [
+            ("input_studio_companies", {"organization_name": org_name, "studio_company_id_test": "t", "studio_company_id_prod": "p"}),
+            ("trigger_infrabot", {"keycloak_cluster": "eu1", "keycloak_confirmed": True}),
+        ]
+        if finish:
+            inputs.append(("lms_setup", {"lms_confirmed": True}))
+        for step_name, data in inputs:
+            execution = wait_for(execution_id, awaiting(step_name))
+            step = next(s for s in execution["steps"] if s["step_name"] == step_name)
+            r = client.post(f"/api/executions/{execution_id}/steps/{step['id']}/input?wait=5", json=data, headers=admin_headers)
+            assert r.status_code in (200, 202), r.text
+        if finish:
+            return wait_for(execution_id, lambda e: e["status"] == "completed")
+        return wait_for(execution_id, awaiting("lms_setup"))
+    return run
+
+
+def awaiting(step_name):
+    return lambda e: any(s["step_name"] == step_name and s["status"] == "awaiting_input" for s in e["steps"])
+
+
+@pytest.fixture
+def db():
+    """A pooled connection in its own transaction, committed at the end of the test."""
+    with connection() as conn:
+        yield conn
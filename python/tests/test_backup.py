@@ -0,0 +1,82 @@
+import hashlib
+import sqlite3
+import time
+import types
+
+import pytest
+
+from api import backup
+from api.database import connection, get_backend
+from api.ids import new_id
+
+
+@pytest.fixture(autouse=True)
+def _backup_dir(backend_name, tmp_path, monkeypatch):
+    if backend_name != "sqlite":
+        pytest.skip("online backups are SQLite's")
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    monkeypatch.setattr(backup, "BACKUP_STEP_PAGES", 1)
+
+
+def between_steps(monkeypatch, hook):
+    """Run hook() in every pause of the batched copy."""
+    def sleep(seconds):
+        hook()
+    monkeypatch.setattr(backup, "time", types.SimpleNamespace(sleep=sleep, monotonic=time.monotonic))
+
+
+def test_snapshot_matches_its_checksum(client):
+    result = backup.create_backup()
+    with open(result["path"], "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == result["sha256"]
+    assert result["steps"] > 1
+    snapshot = sqlite3.connect(result["path"])
+    assert snapshot.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+
+
+def test_checkpoints_run_between_steps(client, monkeypatch):
+    busy = []
+
+    def checkpoint():
+        other = sqlite3.connect(get_backend().path, timeout=0)
+        busy.append(other.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0])
+        other.close()
+
+    between_steps(monkeypatch, checkpoint)
+    backup.create_backup()
+    assert busy and not any(busy)
+
+
+def test_copy_finishes_under_constant_writes(client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_MAX_RESTARTS", 2)
+    written = []
+
+    def write():
+        org_id = new_id()
+        with connection() as conn:
+            conn.execute("INSERT INTO organizations (id, name) VALUES (?, ?)", (org_id, f"Backup Load {org_id}"))
+        written.append(org_id)
+
+    between_steps(monkeypatch, write)
+    result = backup.create_backup()
+    # Two restarts, then the rest in one step.
+    assert len(written) > backup.BACKUP_MAX_RESTARTS
+    snapshot = sqlite3.connect(result["path"])
+    assert snapshot.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    assert snapshot.execute("SELECT 1 FROM organizations WHERE id=?", (written[-1],)).fetchone()
+
+
+def test_failed_integrity_check_is_a_server_error(client, admin_headers, monkeypatch, tmp_path):
+    class Target(sqlite3.Connection):
+        def execute(self, sql, *args):
+            if sql == "PRAGMA quick_check":
+                return sqlite3.connect(":memory:").execute("SELECT 'page 2: corrupt'")
+            return super().execute(sql, *args)
+
+    connect = sqlite3.connect
+    monkeypatch.setattr(backup.sqlite3, "connect", lambda path, **kw: connect(path, factory=Target, **kw)
+                        if path.endswith(".partial") else connect(path, **kw))
+    r = client.post("/api/admin/backups", headers=admin_headers)
+    assert r.status_code == 500
+    assert "integrity check" in r.json()["detail"]
+    assert not list(tmp_path.iterdir())
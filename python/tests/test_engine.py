@@ -0,0 +1,401 @@
+"""
+Engine behaviour on hand-built workflows: claims, concurrency, failures,
+context, leases, scheduling and commits.
+
+Each test defines its own workflow. Its first step, `root`, starts out
+completed and every other step depends on it or on a later step, so the
+seeded dependency backfill never touches these definitions.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.database import connection
+from api.engine import workflow as wf
+from api.ids import new_id, new_key
+from api.timestamps import now_ms
+
+
+def define_workflow(steps: list[tuple[str, str]], deps: list[tuple[str, str]]) -> str:
+    """A workflow of `root` plus `steps` as (name, type); `deps` are (step, step it waits for)."""
+    wd = new_id()
+    ids = {}
+    with connection() as conn:
+        conn.execute("INSERT INTO workflow_definitions (id, name) VALUES (?, ?)", (wd, f"test_{wd}"))
+        for order, (name, step_type) in enumerate([("root", "auto")] + steps, 1):
+            ids[name] = new_id()
+            conn.execute(
+                "INSERT INTO workflow_step_definitions (id, workflow_definition_id, step_order, name, label, type) "
+                "VALUES (?,?,?,?,?,?)", (ids[name], wd, order, name, name, step_type)
+            )
+        for step, on in deps:
+            conn.execute(
+                "INSERT INTO workflow_step_dependencies (step_definition_id, depends_on_id) VALUES (?,?)",
+                (ids[step], ids[on])
+            )
+    return wd
+
+
+def new_execution(wd: str) -> tuple[bytes, dict[str, bytes]]:
+    """A running execution of `wd` with `root` completed; returns its key and step execution keys by name."""
+    execution_id = new_key()
+    steps = {}
+    with connection() as conn:
+        conn.execute(
+            "INSERT INTO workflow_executions (id, workflow_definition_id, status, created_at) VALUES (?,?,?,?)",
+            (execution_id, wd, "running", now_ms())
+        )
+        conn.execute("INSERT INTO execution_contexts (execution_id, context) VALUES (?, '{}')", (execution_id,))
+        for row in conn.execute(
+            "SELECT id, name, step_order FROM workflow_step_definitions WHERE workflow_definition_id=?", (wd,)
+        ).fetchall():
+            steps[row["name"]] = new_key()
+            conn.execute(
+                "INSERT INTO workflow_step_executions (id, execution_id, step_definition_id, step_order, status) "
+                "VALUES (?,?,?,?,?)",
+                (steps[row["name"]], execution_id, row["id"], row["step_order"],
+                 "completed" if row["name"] == "root" else "pending")
+            )
+    return execution_id, steps
+
+
+def advance(execution_id: bytes) -> None:
+    """Queue an advance on the engine loop and wait for it."""
+    wf.queue_advance(execution_id).result(timeout=10)
+
+
+def statuses(execution_id: bytes) -> tuple[str, dict[str, str]]:
+    with connection() as conn:
+        execution = conn.execute("SELECT status FROM workflow_executions WHERE id=?", (execution_id,)).fetchone()
+        steps = conn.execute(
+            "SELECT wsd.name, wse.status FROM workflow_step_executions wse "
+            "JOIN workflow_step_definitions wsd ON wsd.id = wse.step_definition_id WHERE wse.execution_id=?",
+            (execution_id,)
+        ).fetchall()
+    return execution["status"], {row["name"]: row["status"] for row in steps}
+
+
+@pytest.fixture
+def steps_run(monkeypatch):
+    """Stub the integrations: a step named fail_* fails, any other succeeds. Records the names run."""
+    ran = []
+
+    async def execute_step(name, context):
+        ran.append(name)
+        if name.startswith("fail"):
+            return {"success": False, "error": f"{name} failed"}
+        return {"success": True, "output": {name: True}}
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    return ran
+
+
+# ── claims ─────────────────────────────────────────────────────────────────
+
+def test_parallel_claims_never_share_a_step(client):
+    wd = define_workflow([(f"s{i}", "auto") for i in range(6)], [(f"s{i}", "root") for i in range(6)])
+    execution_id, steps = new_execution(wd)
+    start = threading.Barrier(6)
+    claimed = []
+
+    def claim():
+        start.wait()
+        with connection() as conn:
+            claimed.extend(step["id"] for step in wf._claim_ready_steps(execution_id, 1, conn))
+
+    threads = [threading.Thread(target=claim) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(v for k, v in steps.items() if k != "root")
+
+
+def test_manual_steps_do_not_count_toward_the_cap(client):
+    wd = define_workflow(
+        [("ask", "manual"), ("a", "auto"), ("b", "auto"), ("c", "auto")],
+        [("ask", "root"), ("a", "root"), ("b", "root"), ("c", "root")],
+    )
+    execution_id, steps = new_execution(wd)
+    with connection() as conn:
+        claimed = wf._claim_ready_steps(execution_id, 2, conn)
+    assert [step["id"] for step in claimed] == [steps["a"], steps["b"]]
+    assert statuses(execution_id) == ("awaiting_input", {
+        "root": "completed", "ask": "awaiting_input", "a": "running", "b": "running", "c": "pending",
+    })
+
+
+# ── failures ───────────────────────────────────────────────────────────────
+
+def test_failed_step_lets_independent_siblings_finish(client, steps_run, monkeypatch):
+    # One step at a time: the siblings are still held back by the cap when fail_a fails.
+    monkeypatch.setattr(wf, "ENGINE_STEP_CONCURRENCY", 1)
+    wd = define_workflow(
+        [("fail_a", "auto"), ("b", "auto"), ("c", "auto"), ("after_a", "auto")],
+        [("fail_a", "root"), ("b", "root"), ("c", "root"), ("after_a", "fail_a")],
+    )
+    execution_id, _ = new_execution(wd)
+    advance(execution_id)
+    assert steps_run == ["fail_a", "b", "c"]
+    assert statuses(execution_id) == ("failed", {
+        "root": "completed", "fail_a": "failed", "b": "completed", "c": "completed", "after_a": "pending",
+    })
+
+
+def test_failure_outcome_does_not_depend_on_the_cap(client, steps_run, monkeypatch):
+    outcomes = set()
+    for concurrency in (1, 2, 4):
+        monkeypatch.setattr(wf, "ENGINE_STEP_CONCURRENCY", concurrency)
+        wd = define_workflow(
+            [("b", "auto"), ("fail_a", "auto"), ("c", "auto"), ("d", "auto"), ("after_b", "auto")],
+            [("b", "root"), ("fail_a", "root"), ("c", "root"), ("d", "root"), ("after_b", "b")],
+        )
+        execution_id, _ = new_execution(wd)
+        advance(execution_id)
+        status, steps = statuses(execution_id)
+        outcomes.add((status, tuple(sorted(steps.items()))))
+    assert outcomes == {("failed", (
+        ("after_b", "completed"), ("b", "completed"), ("c", "completed"), ("d", "completed"),
+        ("fail_a", "failed"), ("root", "completed"),
+    ))}
+
+
+def test_retrying_the_failed_step_resumes_the_execution(client, steps_run, monkeypatch):
+    wd = define_workflow([("fail_once", "auto"), ("after", "auto")], [("fail_once", "root"), ("after", "fail_once")])
+    execution_id, steps = new_execution(wd)
+    advance(execution_id)
+    assert statuses(execution_id)[0] == "failed"
+
+    async def execute_step(name, context):
+        steps_run.append(name)
+        return {"success": True, "output": {}}
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    with connection() as conn:
+        future = wf.retry_step(execution_id, steps["fail_once"], conn)
+    future.result(timeout=10)
+    assert statuses(execution_id) == ("completed", {"root": "completed", "fail_once": "completed", "after": "completed"})
+
+
+# ── context ────────────────────────────────────────────────────────────────
+
+def test_context_merges_in_step_order(client, monkeypatch):
+    # `early` is first in step order but finishes last; `late`'s value must win, as in a sequential run.
+    async def execute_step(name, context):
+        if name == "early":
+            await asyncio.sleep(0.2)
+        return {"success": True, "output": {"shared": name, name: True}}
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    wd = define_workflow([("early", "auto"), ("late", "auto")], [("early", "root"), ("late", "root")])
+    execution_id, _ = new_execution(wd)
+    advance(execution_id)
+    with connection() as conn:
+        ctx = wf._load_context(execution_id, conn)
+    assert ctx == {"shared": "late", "early": True, "late": True}
+
+
+# ── leases ─────────────────────────────────────────────────────────────────
+
+def ago(seconds: float) -> int:
+    return now_ms() - int(seconds * 1000)
+
+
+def hold(step_id: bytes, owner: str, expires_at, started_at=None) -> None:
+    """Mark a step running under someone else's lease."""
+    with connection() as conn:
+        conn.execute(
+            "UPDATE workflow_step_executions SET status='running', lease_owner=?, lease_expires_at=?, started_at=? WHERE id=?",
+            (owner, expires_at, started_at or now_ms(), step_id)
+        )
+
+
+@pytest.mark.parametrize("expires_at, started_at, reclaimed", [
+    (ago(1), None, True),                                   # lease ran out
+    (ago(-60), None, False),                                # lease still live
+    (None, ago(1), False),                                  # no lease, just started by an older release
+    (None, ago(2 * wf.ENGINE_LEASE_SECONDS), True),         # no lease, running for longer than one
+], ids=["expired", "live", "legacy-recent", "legacy-stale"])
+def test_running_step_is_reclaimed_only_once_its_lease_is_over(client, steps_run, expires_at, started_at, reclaimed):
+    wd = define_workflow([("a", "auto")], [("a", "root")])
+    execution_id, steps = new_execution(wd)
+    hold(steps["a"], "elsewhere:1", expires_at, started_at)
+    advance(execution_id)
+    assert steps_run == (["a"] if reclaimed else [])
+    assert statuses(execution_id) == (
+        ("completed", {"root": "completed", "a": "completed"}) if reclaimed
+        else ("running", {"root": "completed", "a": "running"})
+    )
+
+
+def test_result_is_dropped_after_the_lease_is_lost(client):
+    wd = define_workflow([("a", "auto"), ("fail_b", "auto")], [("a", "root"), ("fail_b", "root")])
+    execution_id, steps = new_execution(wd)
+    with connection() as conn:
+        claimed = wf._claim_ready_steps(execution_id, 2, conn)
+    # Both leases ran out and another process took the steps over.
+    for step in claimed:
+        hold(step["id"], "elsewhere:2", ago(-60))
+    with connection() as conn:
+        wf._transition(execution_id, [
+            (claimed[0], {"success": True, "output": {"late": True}}),
+            (claimed[1], {"success": False, "error": "late"}),
+        ], 0, conn)
+        ctx = wf._load_context(execution_id, conn)
+        owners = {row["id"]: (row["status"], row["lease_owner"]) for row in conn.execute(
+            "SELECT id, status, lease_owner FROM workflow_step_executions WHERE id IN (?,?)", (steps["a"], steps["fail_b"])
+        ).fetchall()}
+    assert ctx == {}
+    assert owners == {steps["a"]: ("running", "elsewhere:2"), steps["fail_b"]: ("running", "elsewhere:2")}
+    assert statuses(execution_id)[0] == "running"
+
+
+def test_recovery_leaves_executions_advancing_here_alone(client, monkeypatch):
+    release = threading.Event()
+
+    async def execute_step(name, context):
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        return {"success": True, "output": {}}
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    wd = define_workflow([("a", "auto")], [("a", "root")])
+    execution_id, steps = new_execution(wd)
+    future = wf.queue_advance(execution_id)
+    try:
+        deadline = time.monotonic() + 5
+        while statuses(execution_id)[1]["a"] != "running":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        # As if the renewal were late: the lease looks expired to a sweep.
+        with connection() as conn:
+            conn.execute("UPDATE workflow_step_executions SET lease_expires_at=? WHERE id=?", (ago(1), steps["a"]))
+
+        queued = []
+        monkeypatch.setattr(wf, "queue_advance", queued.append)
+        with connection() as conn:
+            wf.recover_stranded(conn)
+        assert execution_id not in queued
+    finally:
+        release.set()
+        future.result(timeout=10)
+    assert statuses(execution_id)[0] == "completed"
+
+
+# ── scheduling ─────────────────────────────────────────────────────────────
+
+def slow_steps(monkeypatch, seconds: float) -> list[str]:
+    ran = []
+
+    async def execute_step(name, context):
+        ran.append(name)
+        await asyncio.sleep(seconds)
+        return {"success": True, "output": {}}
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    return ran
+
+
+def test_unrelated_executions_advance_in_parallel(client, monkeypatch):
+    ran = slow_steps(monkeypatch, 0.3)
+    wd = define_workflow([("a", "auto")], [("a", "root")])
+    executions = [new_execution(wd)[0] for _ in range(4)]
+    started = time.monotonic()
+    # ...and a second advance of the first one.
+    futures = [wf.queue_advance(execution_id) for execution_id in executions + executions[:1]]
+    for future in futures:
+        future.result(timeout=10)
+    # One slow step at a time would take 1.2s; each execution's step still ran exactly once.
+    assert time.monotonic() - started < 0.9
+    assert ran == ["a"] * 4
+    assert {statuses(execution_id)[0] for execution_id in executions} == {"completed"}
+
+
+def test_create_answers_202_while_the_engine_works(client, admin_headers, monkeypatch):
+    slow_steps(monkeypatch, 0.5)
+    wd = define_workflow([("a", "auto")], [("a", "root")])
+    workflow_type = f"test_{wd}"
+    r = client.post("/api/executions", json={"workflow_type": workflow_type}, headers=admin_headers)
+    assert r.status_code == 202, r.text
+    assert r.headers["Location"] == f"/api/executions/{r.json()['id']}"
+    r = client.post("/api/executions?wait=5", json={"workflow_type": workflow_type}, headers=admin_headers)
+    assert r.status_code == 201, r.text
+    assert r.json()["status"] == "completed"
+
+
+def test_full_engine_refuses_work_before_writing(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(wf, "_slots", threading.BoundedSemaphore(1))
+    wf._slots.acquire()
+    with connection() as conn:
+        before = conn.execute("SELECT count(*) AS n FROM workflow_executions").fetchone()["n"]
+    r = client.post("/api/executions", json={"workflow_type": "new_partner"}, headers=admin_headers)
+    assert r.status_code == 503, r.text
+    assert r.headers["Retry-After"] == "1"
+    with connection() as conn:
+        assert conn.execute("SELECT count(*) AS n FROM workflow_executions").fetchone()["n"] == before
+
+
+def pool_threads(backend_name: str) -> int:
+    """Most threads the pool adds: one per pooled connection, plus psycopg_pool's workers."""
+    if backend_name == "sqlite":
+        from api.storage.sqlite import DB_POOL_SIZE
+        return DB_POOL_SIZE
+    from api.storage.postgres import PG_POOL_MAX
+    return PG_POOL_MAX + 3
+
+
+def test_waiting_steps_cost_coroutines_not_threads(client, backend_name, monkeypatch):
+    waiting, release = [], threading.Event()
+
+    async def execute_step(name, context):
+        waiting.append(name)
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        return {"success": True, "output": {}}
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    wd = define_workflow([("a", "auto"), ("b", "auto")], [("a", "root"), ("b", "root")])
+    executions = [new_execution(wd)[0] for _ in range(40)]
+    threads = threading.active_count()
+    futures = [wf.queue_advance(execution_id) for execution_id in executions]
+    try:
+        deadline = time.monotonic() + 10
+        while len(waiting) < 80:
+            assert time.monotonic() < deadline, len(waiting)
+            time.sleep(0.01)
+        time.sleep(0.1)
+        # 80 steps in flight; the only new threads are the pooled connections'.
+        assert threading.active_count() - threads <= pool_threads(backend_name)
+    finally:
+        release.set()
+        for future in futures:
+            future.result(timeout=10)
+    assert {statuses(execution_id)[0] for execution_id in executions} == {"completed"}
+
+
+# ── commits ────────────────────────────────────────────────────────────────
+
+def test_steps_finishing_together_share_one_commit(client, monkeypatch):
+    async def execute_step(name, context):
+        await asyncio.sleep(0.001 * int(name[1:]))  # staggered, all within the group commit window
+        return {"success": True, "output": {name: True}}
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    monkeypatch.setattr(wf, "ENGINE_GROUP_COMMIT_MS", 50)
+    transitions = []
+    transition = wf._transition
+
+    def counted(execution_id, finished, limit, conn):
+        transitions.append(len(finished))
+        return transition(execution_id, finished, limit, conn)
+
+    monkeypatch.setattr(wf, "_transition", counted)
+    wd = define_workflow([(f"s{i}", "auto") for i in range(4)], [(f"s{i}", "root") for i in range(4)])
+    execution_id, _ = new_execution(wd)
+    advance(execution_id)
+    # One transaction claims all four, the next records all four and completes the execution.
+    assert transitions == [0, 4]
+    assert statuses(execution_id)[0] == "completed"
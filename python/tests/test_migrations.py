@@ -0,0 +1,167 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+from api import migrations
+from api.timestamps import to_ms
+from api.storage import postgres_migrations
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(path, timeout=10, check_same_thread=False)
+
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    conn = _connect(str(tmp_path / "fresh.db"))
+    conn.row_factory = sqlite3.Row
+    migrations.run_migrations(conn)
+    assert migrations.schema_version(conn) == migrations.latest_version()
+    # Current schema: nothing but the user_version read.
+    statements = []
+    conn.set_trace_callback(statements.append)
+    migrations.run_migrations(conn)
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_backends_share_version_numbers():
+    sqlite_versions = [version for version, _, _ in migrations._MIGRATIONS]
+    postgres_versions = [version for version, _ in postgres_migrations._MIGRATIONS]
+    assert sqlite_versions == list(range(1, len(sqlite_versions) + 1))
+    # PostgreSQL's 7 is SQLite's 1-7 in one step; every later version has a twin.
+    assert postgres_versions == list(range(7, len(sqlite_versions) + 1))
+
+
+def test_concurrent_workers_run_a_rebuild_once(tmp_path, monkeypatch):
+    runs = []
+
+    def create(conn):
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+
+    def rebuild(conn):
+        # Stands in for rebuild_table(): its own transactions, outside the version check.
+        runs.append(threading.get_ident())
+        time.sleep(0.3)
+
+    monkeypatch.setattr(migrations, "_MIGRATIONS", [(1, True, create), (2, False, rebuild)])
+    path = str(tmp_path / "race.db")
+    errors = []
+
+    def worker():
+        conn = _connect(path)
+        try:
+            migrations.run_migrations(conn)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(runs) == 1
+    assert migrations.schema_version(_connect(path)) == 2
+
+
+def test_contexts_are_re_merged_in_step_order(tmp_path, monkeypatch):
+    conn = _connect(str(tmp_path / "contexts.db"))
+    conn.row_factory = sqlite3.Row
+    every = list(migrations._MIGRATIONS)
+    monkeypatch.setattr(migrations, "_MIGRATIONS", [m for m in every if m[0] < 15])
+    migrations.run_migrations(conn)
+    conn.execute("PRAGMA foreign_keys=OFF")  # no definitions needed for this
+    conn.execute("INSERT INTO workflow_executions (id, workflow_definition_id, status) VALUES ('e', 'w', 'running')")
+    for order, output in ((1, {"shared": "first", "a": 1}), (2, {"shared": "second"})):
+        conn.execute(
+            "INSERT INTO workflow_step_executions (id, execution_id, step_definition_id, step_order, status, output) "
+            "VALUES (?, 'e', ?, ?, 'completed', ?)", (f"s{order}", f"d{order}", order, json.dumps(output))
+        )
+    # Merged in completion order: step 1 finished last.
+    conn.execute("INSERT INTO execution_contexts (execution_id, context) VALUES ('e', ?)",
+                 (json.dumps({"shared": "first", "a": 1}),))
+    conn.commit()
+    # Stops before migration 16, which would need UUIDs for ids.
+    monkeypatch.setattr(migrations, "_MIGRATIONS", [m for m in every if m[0] <= 15])
+    migrations.run_migrations(conn)
+    row = conn.execute("SELECT context, key_orders FROM execution_contexts WHERE execution_id='e'").fetchone()
+    assert json.loads(row["context"]) == {"shared": "second", "a": 1}
+    assert json.loads(row["key_orders"]) == {"shared": 2, "a": 1}
+
+
+def test_steps_running_before_leases_get_a_grace_lease(tmp_path, monkeypatch):
+    conn = _connect(str(tmp_path / "leases.db"))
+    conn.row_factory = sqlite3.Row
+    every = list(migrations._MIGRATIONS)
+    monkeypatch.setattr(migrations, "_MIGRATIONS", [m for m in every if m[0] < 14])
+    migrations.run_migrations(conn)
+    conn.execute("PRAGMA foreign_keys=OFF")
+    conn.execute(
+        "INSERT INTO workflow_step_executions (id, execution_id, step_definition_id, step_order, status, started_at) "
+        "VALUES ('s', 'e', 'd', 1, 'running', '2000-01-01T00:00:00')"
+    )
+    conn.commit()
+    monkeypatch.setattr(migrations, "_MIGRATIONS", [m for m in every if m[0] <= 15])
+    before = datetime.utcnow().isoformat()
+    migrations.run_migrations(conn)
+    expires_at = conn.execute("SELECT lease_expires_at FROM workflow_step_executions WHERE id='s'").fetchone()[0]
+    assert expires_at > before
+
+
+@pytest.mark.parametrize("split", [False, True], ids=["one-file", "split"])
+def test_execution_keys_and_timestamps_become_binary(tmp_path, monkeypatch, split):
+    conn = _connect(str(tmp_path / "keys.db"))
+    conn.row_factory = sqlite3.Row
+    if split:
+        conn.execute("ATTACH DATABASE ? AS exec", (str(tmp_path / "keys-exec.db"),))
+    every = list(migrations._MIGRATIONS)
+    monkeypatch.setattr(migrations, "_MIGRATIONS", [m for m in every if m[0] < 16])
+    migrations.run_migrations(conn)
+    migrations.split_execution_tables(conn, split)
+    execution_id, step_id = str(uuid.uuid4()), str(uuid.uuid4())
+    migrations.execute_script(conn, """
+    INSERT INTO workflow_definitions (id, name) VALUES ('w', 'keys');
+    INSERT INTO workflow_step_definitions (id, workflow_definition_id, step_order, name, label, type)
+    VALUES ('d', 'w', 1, 'a', 'A', 'auto');
+    INSERT INTO users (id, firstname, lastname, email, password_hash) VALUES ('u', 'U', 'U', 'u@example.com', '');
+    INSERT INTO resources (id, name) VALUES ('r', 'R');
+    """)
+    conn.execute(
+        "INSERT INTO workflow_executions (id, workflow_definition_id, status, created_at, completed_at) "
+        "VALUES (?, 'w', 'failed', '2026-01-02 03:04:05', '2026-01-02T03:04:06.789012')", (execution_id,)
+    )
+    conn.execute("INSERT INTO execution_contexts (execution_id) VALUES (?)", (execution_id,))
+    conn.execute(
+        "INSERT INTO workflow_step_executions (id, execution_id, step_definition_id, step_order, status, "
+        "output, error, started_at) VALUES (?, ?, 'd', 1, 'failed', '{\"cluster\": \"eu1\"}', 'keycloak timeout', "
+        "'2026-01-02T03:04:05.5')", (step_id, execution_id)
+    )
+    conn.execute("INSERT INTO access_grants (id, user_id, resource_id, execution_id) VALUES ('g', 'u', 'r', ?)",
+                 (execution_id,))
+    conn.commit()
+    monkeypatch.setattr(migrations, "_MIGRATIONS", every)
+    migrations.run_migrations(conn)
+
+    key, step_key = uuid.UUID(execution_id).bytes, uuid.UUID(step_id).bytes
+    row = conn.execute("SELECT id, created_at, completed_at FROM workflow_executions").fetchone()
+    assert tuple(row) == (key, to_ms("2026-01-02 03:04:05"), to_ms("2026-01-02T03:04:06.789"))
+    row = conn.execute("SELECT id, execution_id, started_at FROM workflow_step_executions").fetchone()
+    assert tuple(row) == (step_key, key, to_ms("2026-01-02T03:04:05.500"))
+    assert conn.execute("SELECT execution_id FROM execution_contexts").fetchone()[0] == key
+    assert tuple(conn.execute("SELECT step_execution_id, execution_id FROM step_values").fetchone()) == (step_key, key)
+    assert conn.execute("SELECT execution_id FROM access_grants").fetchone()[0] == key
+    # The FTS index still points at its documents, and the triggers came back.
+    assert conn.execute(
+        "SELECT d.step_execution_id FROM error_index JOIN error_documents d ON d.id = error_index.rowid "
+        "WHERE error_index MATCH 'keycloak'"
+    ).fetchone()[0] == step_key
+    conn.execute("UPDATE workflow_step_executions SET error=NULL, output='{}'")
+    assert conn.execute("SELECT count(*) FROM error_documents").fetchone()[0] == 0
+    assert conn.execute("SELECT count(*) FROM step_values").fetchone()[0] == 0
+    assert migrations.schema_of(conn, "workflow_executions") == ("exec" if split else "main")
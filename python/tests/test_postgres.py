@@ -0,0 +1,127 @@
+"""
+PostgreSQL backend. translate() is checked as plain string rewriting; the
+rest needs a server: run the suite with DATABASE_URL pointing at an empty
+database, e.g.
+
+    createdb hyopps_test
+    DATABASE_URL=postgresql://localhost/hyopps_test python -m pytest
+"""
+
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("psycopg")
+
+from api.database import connection, get_backend
+from api.ids import new_id
+from api.storage import postgres_migrations
+from api.storage.postgres import translate
+
+needs_postgres = pytest.mark.skipif(
+    not os.getenv("DATABASE_URL", "").startswith("postgres"), reason="DATABASE_URL is not a PostgreSQL URL"
+)
+
+
+# ── translate() ────────────────────────────────────────────────────────────
+
+def test_translate_placeholders():
+    assert translate("SELECT * FROM users WHERE id=? AND email=?") == "SELECT * FROM users WHERE id=%s AND email=%s"
+
+
+def test_translate_leaves_quoted_text_alone():
+    assert translate("SELECT '?' AS q, \"a?b\" FROM t WHERE x=?") == "SELECT '?' AS q, \"a?b\" FROM t WHERE x=%s"
+    assert translate("SELECT 'it''s like ?' WHERE y=?") == "SELECT 'it''s like ?' WHERE y=%s"
+
+
+def test_translate_escapes_percent_signs():
+    assert translate("SELECT '100%' WHERE a LIKE ?") == "SELECT '100%%' WHERE a ILIKE %s"
+    assert translate("SELECT a % 2 FROM t") == "SELECT a %% 2 FROM t"
+
+
+def test_translate_insert_or_ignore():
+    assert translate("INSERT OR IGNORE INTO t (a) VALUES (?)") == "INSERT INTO t (a) VALUES (%s) ON CONFLICT DO NOTHING"
+    assert translate("insert  or ignore into t (a) VALUES (?);\n") == "INSERT INTO t (a) VALUES (%s) ON CONFLICT DO NOTHING"
+    assert translate("INSERT INTO t (a) VALUES ('OR IGNORE')") == "INSERT INTO t (a) VALUES ('OR IGNORE')"
+
+
+def test_translate_like_is_case_insensitive():
+    assert translate("SELECT * FROM users WHERE email LIKE ? ESCAPE '\\'") == \
+        "SELECT * FROM users WHERE email ILIKE %s ESCAPE '\\'"
+    assert translate("SELECT * FROM t WHERE liked=1") == "SELECT * FROM t WHERE liked=1"
+    assert translate("SELECT 'LIKE' FROM t") == "SELECT 'LIKE' FROM t"
+
+
+# ── against a server ───────────────────────────────────────────────────────
+
+@needs_postgres
+def test_schema_is_at_latest_version(client):
+    assert get_backend().name == "postgres"
+    with connection() as conn:
+        version = conn.execute("SELECT max(version) AS version FROM schema_version").fetchone()["version"]
+    assert version == postgres_migrations.latest_version()
+
+
+@needs_postgres
+def test_concurrent_migrations_apply_once(client):
+    backend = get_backend()
+    errors = []
+
+    def migrate():
+        conn = backend.acquire()
+        try:
+            backend.migrate(conn)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            backend.release(conn)
+
+    threads = [threading.Thread(target=migrate) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    with connection() as conn:
+        rows = conn.execute("SELECT version, count(*) AS n FROM schema_version GROUP BY version").fetchall()
+    assert all(row["n"] == 1 for row in rows), rows
+
+
+@needs_postgres
+def test_crud_round_trip(client):
+    org_id = new_id()
+    with connection() as conn:
+        conn.execute("INSERT INTO organizations (id, name) VALUES (?, ?)", (org_id, "Pg Crud Co"))
+        # INSERT OR IGNORE becomes ON CONFLICT DO NOTHING: no error, no second row.
+        conn.execute("INSERT OR IGNORE INTO organizations (id, name) VALUES (?, ?)", (org_id, "Pg Crud Co"))
+        assert conn.execute("SELECT count(*) AS n FROM organizations WHERE id=?", (org_id,)).fetchone()["n"] == 1
+        row = conn.execute("SELECT name FROM organizations WHERE name LIKE ?", ("pg crud%",)).fetchone()
+        assert row["name"] == "Pg Crud Co"
+        assert conn.execute("UPDATE organizations SET name=? WHERE id=?", ("Pg Crud Ltd", org_id)).rowcount == 1
+    with connection() as conn:
+        assert conn.execute("SELECT name FROM organizations WHERE id=?", (org_id,)).fetchone()["name"] == "Pg Crud Ltd"
+        assert conn.execute("DELETE FROM organizations WHERE id=?", (org_id,)).rowcount == 1
+    with connection() as conn:
+        assert conn.execute("SELECT 1 FROM organizations WHERE id=?", (org_id,)).fetchone() is None
+
+
+@needs_postgres
+def test_rollback_discards_writes(client):
+    org_id = new_id()
+    with pytest.raises(RuntimeError):
+        with connection() as conn:
+            conn.execute("INSERT INTO organizations (id, name) VALUES (?, ?)", (org_id, "Pg Rollback Co"))
+            raise RuntimeError("abort")
+    with connection() as conn:
+        assert conn.execute("SELECT 1 FROM organizations WHERE id=?", (org_id,)).fetchone() is None
+
+
+@needs_postgres
+def test_onboarding_through_the_api(client, admin_headers, run_new_partner):
+    execution = run_new_partner("Pg Onboarding Co")
+    assert all(s["status"] == "completed" for s in execution["steps"])
+    stats = client.get("/api/executions/stats?workflow_type=new_partner", headers=admin_headers).json()
+    assert stats["counts"]["completed"] >= 1
+    org = client.get(f"/api/organizations/{execution['organization_id']}", headers=admin_headers).json()
+    assert org["name"] == "Pg Onboarding Co"
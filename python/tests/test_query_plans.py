@@ -0,0 +1,231 @@
+"""
+EXPLAIN QUERY PLAN regression checks for SQLite.
+
+The hot queries must stay index lookups as history grows: a full SCAN of
+workflow_step_executions or workflow_executions makes every engine advance
+and every list page slower with each onboarding. Besides the named queries
+below, one test records every statement run while it drives an admin
+onboarding, a partner's user onboarding with a failing step retried through
+both routers, each list endpoint with every filter and a second page, the
+search endpoint and the engine's recovery and worker queries, then explains
+each one: none may scan a table that grows with use.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+import bcrypt
+import pytest
+
+from api.database import connection
+from api.engine import workflow as wf
+from api.ids import new_id
+from api.storage.sqlite import PooledConnection
+
+# Reference data: a handful of rows each, so a scan is the cheapest plan.
+SMALL_TABLES = {
+    "workflow_definitions",
+    "workflow_step_definitions",
+    "workflow_step_dependencies",
+    "resources",
+}
+
+_SCAN = re.compile(r"^SCAN (\w+)(?: AS (\w+))?(.*)$")
+
+
+@pytest.fixture(autouse=True)
+def _sqlite_only(backend_name):
+    if backend_name != "sqlite":
+        pytest.skip("query plans are SQLite's")
+
+
+def plan(conn, sql: str, params=()) -> list[str]:
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def partial_indexes(conn) -> set[str]:
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL").fetchall()
+    return {row["name"] for row in rows if " WHERE " in " ".join(row["sql"].upper().split())}
+
+
+def full_scans(conn, sql: str, params=()) -> list[str]:
+    """
+    Plan lines that read a whole growing table. An index-ordered walk under a
+    LIMIT doesn't, nor does a walk of a partial index (it holds only the rows
+    its WHERE admits, e.g. running steps) or an FTS5 MATCH.
+    """
+    aliases = {m.group(2): m.group(1) for m in re.finditer(r"\b(\w+)\s+(?:AS\s+)?(\w+)\b", sql)}
+    partial = partial_indexes(conn)
+    scans = []
+    for line in plan(conn, sql, params):
+        m = _SCAN.match(line)
+        if not m:
+            continue
+        table = aliases.get(m.group(1), m.group(1))
+        if table in SMALL_TABLES or m.group(1) in SMALL_TABLES:
+            continue
+        index = re.search(r"USING (?:COVERING )?INDEX (\w+)", m.group(3))
+        if index and "LIMIT" in sql.upper():
+            continue  # a keyset page walks the index and stops after LIMIT rows
+        if index and index.group(1) in partial:
+            continue
+        if m.group(3).startswith(" VIRTUAL TABLE INDEX") and "MATCH" in sql.upper():
+            continue
+        scans.append(line)
+    return scans
+
+
+def full_scans_of(lines: list[str]) -> list[str]:
+    return [line for line in lines if _SCAN.match(line) and "INDEX" not in line]
+
+
+@pytest.mark.parametrize("sql, params, index", [
+    ("SELECT * FROM workflow_step_executions WHERE execution_id=? AND status='pending' ORDER BY step_order",
+     ("x",), "idx_wse_execution_status_order"),
+    ("SELECT * FROM workflow_executions we ORDER BY we.created_at DESC, we.id DESC LIMIT 50",
+     (), "idx_we_created"),
+    ("SELECT * FROM workflow_executions we WHERE we.status=? ORDER BY we.created_at DESC, we.id DESC LIMIT 50",
+     ("failed",), "idx_we_status_created"),
+    ("SELECT * FROM workflow_executions we WHERE we.organization_id=? ORDER BY we.created_at DESC, we.id DESC LIMIT 50",
+     ("o",), "idx_we_org_created"),
+    ("SELECT * FROM workflow_executions we WHERE we.workflow_definition_id=? ORDER BY we.created_at DESC, we.id DESC LIMIT 50",
+     ("w",), "idx_we_workflow_created"),
+    ("UPDATE workflow_executions SET user_id=NULL WHERE user_id=?", ("u",), "idx_we_user"),
+    ("UPDATE workflow_executions SET requested_by=NULL WHERE requested_by=?", ("u",), "idx_we_requested_by"),
+    ("UPDATE workflow_step_executions SET completed_by=NULL WHERE completed_by=?", ("u",), "idx_wse_completed_by"),
+    ("UPDATE access_grants SET granted_by=NULL WHERE granted_by=?", ("u",), "idx_access_grants_granted_by"),
+    ("SELECT * FROM users u WHERE u.organization_id=? ORDER BY u.created_at DESC, u.id DESC LIMIT 50",
+     ("o",), "idx_users_org_created_id"),
+    ("SELECT * FROM studio_companies WHERE organization_id=?", ("o",), "idx_studio_companies_org"),
+    ("SELECT id FROM workflow_step_executions WHERE status='running' AND lease_expires_at < ?",
+     (946684800000,), "idx_wse_running_lease"),
+])
+def test_hot_query_uses_index(client, sql, params, index):
+    with connection() as conn:
+        lines = plan(conn, sql, params)
+    assert any(f"INDEX {index}" in line for line in lines), lines
+    assert not full_scans_of(lines), lines
+
+
+@pytest.fixture
+def recorded_statements(monkeypatch):
+    """Every statement run on a pooled connection while the test body runs, with its parameters."""
+    seen: dict[str, tuple] = {}
+    execute = PooledConnection.execute
+
+    def record(self, sql, parameters=(), /):
+        if not sql.lstrip().upper().startswith(("PRAGMA", "BEGIN", "EXPLAIN", "SAVEPOINT", "RELEASE")):
+            seen.setdefault(" ".join(sql.split()), parameters)
+        return execute(self, sql, parameters)
+
+    monkeypatch.setattr(PooledConnection, "execute", record)
+    return seen
+
+
+def partner_admin(client, org_id: str) -> dict:
+    email = f"plans-{new_id()}@example.com"
+    with connection() as conn:
+        conn.execute(
+            "INSERT INTO users (id, firstname, lastname, email, organization_id, app_role, password_hash) "
+            "VALUES (?,?,?,?,?,?,?)",
+            (new_id(), "Pat", "Partner", email, org_id, "partner_admin",
+             bcrypt.hashpw(b"secret123", bcrypt.gensalt()).decode())
+        )
+    r = client.post("/api/auth/login", json={"email": email, "password": "secret123"})
+    assert r.status_code == 200, r.text
+    return {"Authorization": f"Bearer {r.json()['token']}"}
+
+
+def stub_integrations(monkeypatch) -> None:
+    """No Metabase or mail server here: the Metabase step fails twice, then both succeed."""
+    execute_step, failures = wf.execute_step, []
+
+    async def stub(name, context):
+        if name == "share_documentation":
+            return {"success": True, "output": {}}
+        if name != "add_user_to_metabase_group":
+            return await execute_step(name, context)
+        if len(failures) < 2:
+            failures.append(name)
+            return {"success": False, "error": "metabase unreachable"}
+        return {"success": True, "output": {"metabase_user_id": "4242"}}
+
+    monkeypatch.setattr(wf, "execute_step", stub)
+
+
+def second_page(client, url: str, headers: dict) -> None:
+    """Fetch `url` one row per page and follow its cursor once."""
+    sep = "&" if "?" in url else "?"
+    r = client.get(f"{url}{sep}limit=1", headers=headers)
+    assert r.status_code == 200, url
+    cursor = r.json()["next_cursor"]
+    assert cursor, url
+    assert client.get(f"{url}{sep}limit=1&cursor={cursor}", headers=headers).status_code == 200, url
+
+
+def test_no_statement_scans_a_growing_table(client, admin_headers, run_new_partner, wait_for, monkeypatch,
+                                            recorded_statements):
+    execution = run_new_partner("Plan Check Co")
+    org_id = execution["organization_id"]
+    run_new_partner("Plan Check Two", finish=False)  # a second organization, for a second page
+
+    # A partner onboards a user; add_user_to_metabase_group fails twice and is retried from each router.
+    stub_integrations(monkeypatch)
+    partner = partner_admin(client, org_id)
+    base = "/api/partner/executions"
+    executions = [client.post(f"{base}?wait=5", headers=partner).json()["id"] for _ in range(2)]
+    user_execution = executions[0]
+    pending = wait_for(user_execution, lambda e: e["current_step_order"] == 2, headers=partner, base=base)
+    step = next(s for s in pending["steps"] if s["step_name"] == "input_user_details")
+    r = client.post(f"{base}/{user_execution}/steps/{step['id']}/input?wait=5", headers=partner, json={
+        "email": f"plans-user-{new_id()}@example.com", "firstname": "Plan", "lastname": "Check",
+        "skills": ["python"], "languages": ["en"], "roles": ["analyst"],
+    })
+    assert r.status_code in (200, 202), r.text
+    for retry in (f"{base}/{user_execution}", f"/api/executions/{user_execution}"):
+        failed = wait_for(user_execution, lambda e: e["status"] == "failed")
+        step = next(s for s in failed["steps"] if s["status"] == "failed")
+        headers = partner if retry.startswith(base) else admin_headers
+        r = client.post(f"{retry}/steps/{step['id']}/retry?wait=5", headers=headers)
+        assert r.status_code in (200, 202), r.text
+    wait_for(user_execution, lambda e: e["status"] == "completed")
+
+    today = datetime.utcnow().date()
+    created = f"created_from={today.isoformat()}&created_to={(today + timedelta(days=1)).isoformat()}"
+    for url in (
+        "/api/executions?status=completed", f"/api/executions?organization_id={org_id}",
+        "/api/executions?workflow_type=new_partner", f"/api/executions?{created}",
+        "/api/executions?output_key=metabase_user_id", "/api/executions?output_key=metabase_user_id&output_value=4242",
+        f"/api/executions/{execution['id']}", f"/api/executions/{new_id()}",
+        "/api/executions/stats", f"/api/executions/stats?organization_id={org_id}&workflow_type=new_partner",
+        f"/api/organizations/{org_id}", f"/api/users?organization_id={org_id}",
+        "/api/users?q=adm", "/api/users?skill=python", "/api/users?language=EN", "/api/users?role=analyst",
+        "/api/search?q=plan", "/api/search?q=metabase&type=error", "/api/search?q=check&type=user,organization",
+    ):
+        assert client.get(url, headers=admin_headers).status_code in (200, 404), url
+    for url in ("/api/executions", f"/api/executions?organization_id={org_id}", "/api/organizations", "/api/users"):
+        second_page(client, url, admin_headers)
+    for url in ("/api/partner/me", f"{base}?status=completed", f"{base}?{created}", f"{base}/stats",
+                f"{base}/{user_execution}", f"{base}/{new_id()}"):
+        assert client.get(url, headers=partner).status_code in (200, 404), url
+    second_page(client, base, partner)
+
+    # What the recovery sweep and the engine workers run.
+    with connection() as conn:
+        wf.recover_stranded(conn)
+        wf.runnable_executions(100, conn)
+        wf.release_leases(conn)
+
+    statements = dict(recorded_statements)
+    for fragment in ("FROM step_values", "user_attributes", "search_index", "error_index",
+                     "lease_owner=?", "lease_expires_at"):
+        assert any(fragment in sql for sql in statements), fragment
+    offenders = {}
+    with connection() as conn:
+        for sql, params in statements.items():
+            if sql.upper().startswith("INSERT") and "SELECT" not in sql.upper():
+                continue
+            scans = full_scans(conn, sql, params)
+            if scans:
+                offenders[sql] = scans
+    assert not offenders, offenders
@@ -0,0 +1,143 @@
+"""
+ENGINE_EXTERNAL: the API only records requests and standalone workers
+(api/engine/worker.py) run every step.
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+import bcrypt
+import pytest
+
+from api.database import connection
+from api.engine import worker as worker_module
+from api.engine import workflow as wf
+from api.ids import new_id, to_key
+
+
+@pytest.fixture
+def external(monkeypatch):
+    """The API as deployed with ENGINE_EXTERNAL=1: no advance runs in this process."""
+    monkeypatch.setattr(wf, "ENGINE_EXTERNAL", True)
+
+
+@pytest.fixture
+def partner_headers(client):
+    """A partner_admin of a fresh organization."""
+    org_id, email = new_id(), f"partner-{new_id()}@example.com"
+    with connection() as conn:
+        conn.execute("INSERT INTO organizations (id, name) VALUES (?, ?)", (org_id, f"Worker Co {org_id}"))
+        conn.execute(
+            "INSERT INTO users (id, firstname, lastname, email, organization_id, app_role, password_hash) "
+            "VALUES (?,?,?,?,?,?,?)",
+            (new_id(), "Pat", "Partner", email, org_id, "partner_admin",
+             bcrypt.hashpw(b"secret123", bcrypt.gensalt()).decode())
+        )
+    r = client.post("/api/auth/login", json={"email": email, "password": "secret123"})
+    assert r.status_code == 200, r.text
+    return {"Authorization": f"Bearer {r.json()['token']}"}, org_id
+
+
+def test_partner_execution_is_readable_before_any_advance(client, partner_headers, external, monkeypatch, wait_for):
+    headers, org_id = partner_headers
+    r = client.post("/api/partner/executions?wait=1", headers=headers)
+    assert r.status_code == 202, r.text
+    assert r.json()["organization_id"] == org_id
+    execution_id = r.json()["id"]
+
+    r = client.get(f"/api/partner/executions/{execution_id}", headers=headers)
+    assert r.status_code == 200, r.text
+    steps = {s["step_name"]: s["status"] for s in r.json()["steps"]}
+    assert steps["select_organization"] == "completed"
+    assert steps["input_user_details"] == "pending"
+    with connection() as conn:
+        assert to_key(execution_id) in wf.runnable_executions(1000, conn)
+
+    # What a worker does next: the execution moves on to the partner's first real input.
+    monkeypatch.setattr(wf, "ENGINE_EXTERNAL", False)
+    wf.queue_advance(to_key(execution_id)).result(timeout=10)
+    execution = wait_for(execution_id, lambda e: e["status"] == "awaiting_input", headers=headers,
+                         base="/api/partner/executions")
+    assert [s["step_name"] for s in execution["steps"] if s["status"] == "awaiting_input"] == ["input_user_details"]
+
+
+@pytest.fixture
+def worker(external, monkeypatch):
+    """Start run_worker() on its own loop and thread; call the result to stop it and wait."""
+    monkeypatch.setattr(worker_module, "ENGINE_POLL_INTERVAL", 0.02)
+    loop = asyncio.new_event_loop()
+    stop = asyncio.Event()
+    thread = threading.Thread(target=loop.run_until_complete, args=(worker_module.run_worker(stop),))
+    thread.start()
+
+    def stop_worker(timeout=10.0):
+        loop.call_soon_threadsafe(stop.set)
+        thread.join(timeout)
+        assert not thread.is_alive()
+
+    yield stop_worker
+    if thread.is_alive():
+        stop_worker()
+    loop.close()
+
+
+def test_worker_runs_an_onboarding_to_completion(client, admin_headers, run_new_partner, worker):
+    execution = run_new_partner("Worker Driven Co")
+    assert all(s["status"] == "completed" for s in execution["steps"])
+
+
+def test_stopping_worker_hands_unfinished_steps_back(client, admin_headers, wait_for, worker, monkeypatch):
+    monkeypatch.setattr(worker_module, "ENGINE_SHUTDOWN_GRACE", 0.1)
+    started, cancelled = threading.Event(), threading.Event()
+
+    async def execute_step(name, context):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(wf, "execute_step", execute_step)
+    r = client.post("/api/executions", json={"workflow_type": "new_partner"}, headers=admin_headers)
+    execution_id = r.json()["id"]
+    execution = wait_for(execution_id, lambda e: e["status"] == "awaiting_input")
+    step = next(s for s in execution["steps"] if s["status"] == "awaiting_input")
+    client.post(f"/api/executions/{execution_id}/steps/{step['id']}/input",
+                json={"organization_name": "Worker Stop Co"}, headers=admin_headers)
+    execution = wait_for(execution_id, lambda e: e["current_step_order"] == 2)
+    step = next(s for s in execution["steps"] if s["status"] == "awaiting_input")
+    client.post(f"/api/executions/{execution_id}/steps/{step['id']}/input",
+                json={"keycloak_cluster": "eu1"}, headers=admin_headers)
+    assert started.wait(10)
+
+    worker()
+    assert cancelled.is_set()
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT status, lease_owner FROM workflow_step_executions WHERE execution_id=? AND status IN ('pending','running')",
+            (to_key(execution_id),)
+        ).fetchall()
+        assert to_key(execution_id) in wf.runnable_executions(1000, conn)
+    assert rows and all(row["status"] == "pending" and row["lease_owner"] is None for row in rows)
+
+
+def test_sigterm_stops_the_worker_process(client):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "api.engine.worker"], cwd=os.path.dirname(os.path.dirname(__file__)),
+        stderr=subprocess.PIPE, text=True, env={**os.environ, "ENGINE_EXTERNAL": "1", "ENGINE_SHUTDOWN_GRACE": "1"},
+    )
+    try:
+        for line in proc.stderr:
+            if "started" in line:
+                break
+        proc.send_signal(signal.SIGTERM)
+        _, err = proc.communicate(timeout=15)
+    finally:
+        proc.kill()
+    assert proc.returncode == 0, err
+    assert "stopped" in err